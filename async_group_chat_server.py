@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import deque
+
+HOST = "0.0.0.0"
+PORT = 5004  # change if needed
+
+MAX_OUTBOX_BYTES = 256 * 1024   # output buffered per client before the policy applies
+SLOW_CLIENT_POLICY = "disconnect"  # or "drop": skip messages for that client
+HISTORY_LIMIT = 200             # messages kept per group
+HISTORY_TTL_SECONDS = 15 * 60   # persistent mode: 15 minutes
+HISTORY_FILE = "chat_history.json"
+SAVE_INTERVAL = 1.0             # persistent mode: seconds between history file writes
+BACKLOG = 4096                  # pending connections, for reconnect storms
+
+# Greeting of the threaded server each history mode stands in for:
+# group_chat_server.py, group_char_server_history.py and
+# presistent_group_chat_server.py
+HISTORY_MODES = {
+    "none": b"Welcome to the Group Chat Server!\r\n",
+    "memory": b"Welcome to the Group Chat Server with History!\r\n",
+    "persistent": b"Welcome to the Persistent Group Chat Server!\r\n",
+}
+
+
+# ---------- History ----------
+
+class ChatHistory:
+    """
+    Recent messages per group, replayed to members when they join.
+
+    "memory" keeps the last `limit` messages of each group; "persistent"
+    additionally forgets messages older than `ttl` seconds and writes the
+    history to `path` (same JSON layout as presistent_group_chat_server.py,
+    so either server can pick up the other's file). Writes are batched:
+    at most one every SAVE_INTERVAL seconds, off the event loop.
+    """
+    def __init__(self, mode: str, limit: int = HISTORY_LIMIT,
+                 ttl: float | None = None, path: str | None = None):
+        self.mode = mode
+        self.limit = limit
+        self.ttl = ttl
+        self.path = path
+        self._groups = {}  # group_id -> deque of (ts, text)
+        self._dirty = False
+
+    def add(self, group_id: str, text: str):
+        if self.mode == "none":
+            return
+        msgs = self._groups.get(group_id)
+        if msgs is None:
+            msgs = self._groups[group_id] = deque(maxlen=self.limit)
+        msgs.append((time.time(), text))
+        self._dirty = True
+
+    def recent(self, group_id: str) -> list[str]:
+        msgs = self._groups.get(group_id)
+        if not msgs:
+            return []
+        if self.ttl is not None:
+            cutoff = time.time() - self.ttl
+            while msgs and msgs[0][0] < cutoff:
+                msgs.popleft()
+        return [text for _ts, text in msgs]
+
+    def replay(self, group_id: str) -> bytes:
+        """
+        History block sent to a member that just joined group_id, worded
+        like the threaded server of this mode.
+        """
+        if self.mode == "none":
+            return b""
+        texts = self.recent(group_id)
+        if self.mode == "memory":
+            if not texts:
+                return b"(No previous messages in this group yet.)\r\n\r\n"
+            header = f"--- Previous messages in group '{group_id}' ---\r\n"
+            footer = "--- End of previous messages ---\r\n\r\n"
+        else:
+            if not texts:
+                return b"(No messages in this group in the last 15 minutes.)\r\n\r\n"
+            header = f"--- Messages in group '{group_id}' from last 15 minutes ---\r\n"
+            footer = "--- End of recent messages ---\r\n\r\n"
+        return (header + "".join(texts) + footer).encode()
+
+    # ---------- Persistence ----------
+
+    def load(self):
+        """Load history from disk, keeping only messages within the TTL."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            # Corrupted file or other issue; start fresh
+            return
+
+        cutoff = time.time() - self.ttl
+        for gid, msgs in data.items():
+            recent = deque(maxlen=self.limit)
+            for m in msgs:
+                ts = m.get("ts", 0)
+                txt = m.get("text", "")
+                if ts >= cutoff and txt:
+                    recent.append((ts, txt))
+            if recent:
+                self._groups[gid] = recent
+
+    def snapshot(self) -> dict:
+        data = {}
+        for gid in list(self._groups):
+            self.recent(gid)  # prune
+            msgs = self._groups[gid]
+            if msgs:
+                data[gid] = [{"ts": ts, "text": text} for ts, text in msgs]
+            else:
+                del self._groups[gid]
+        return data
+
+    def save(self, data: dict):
+        tmp_file = self.path + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_file, self.path)
+
+    async def autosave(self):
+        while True:
+            await asyncio.sleep(SAVE_INTERVAL)
+            if self._dirty:
+                self._dirty = False
+                # Snapshot on the loop, write in a worker thread
+                try:
+                    await asyncio.to_thread(self.save, self.snapshot())
+                except OSError as e:
+                    self._dirty = True  # retry on the next interval
+                    print(f"[!] Could not save history to {self.path}: {e}")
+
+
+# ---------- Server ----------
+
+class AsyncGroupChatServer:
+    """
+    Group chat on one asyncio event loop instead of a thread per client.
+
+    Speaks the same telnet-style protocol as the threaded servers: user id
+    prompt, group id prompt, history replay, then every chunk a client
+    sends is relayed to the rest of its group until "/quit" or EOF.
+
+    An idle member costs a stream pair and a suspended coroutine rather
+    than a thread. broadcast() encodes a message once and queues it for
+    each member; once per loop iteration everything queued for a member
+    is handed to its transport in one write, which sends immediately
+    when the socket has room and buffers otherwise. The loop never waits
+    for a slow reader, and a burst (e.g. a wave of join notices) costs
+    one send per member rather than one per message. A member whose
+    buffered output would pass max_outbox_bytes is handled by
+    slow_client_policy, as in chat_broadcast.BroadcastEngine.
+    """
+    def __init__(self, host: str = HOST, port: int = PORT, history: ChatHistory | None = None,
+                 max_outbox_bytes: int = MAX_OUTBOX_BYTES,
+                 slow_client_policy: str = SLOW_CLIENT_POLICY, quiet: bool = False):
+        if slow_client_policy not in ("disconnect", "drop"):
+            raise ValueError("slow_client_policy must be 'disconnect' or 'drop'")
+        self.host = host
+        self.port = port
+        self.history = history or ChatHistory("none")
+        self.max_outbox_bytes = max_outbox_bytes
+        self.slow_client_policy = slow_client_policy
+        self.quiet = quiet
+        self.dropped_messages = 0
+        self.slow_disconnects = 0
+        # group_id -> {writer: user_id}; dicts keep join order and make
+        # leaving O(1)
+        self.groups = {}
+        self._pending = {}  # writer -> chunks queued this loop iteration
+        self._pending_bytes = {}  # writer -> total size of its chunks
+
+    def broadcast(self, group_id: str, message: str, sender=None, save_to_history=True):
+        """
+        Send 'message' to all members of group_id except optionally sender.
+        """
+        if save_to_history:
+            self.history.add(group_id, message)
+        members = self.groups.get(group_id)
+        if not members:
+            return
+        data = message.encode()
+        limit = self.max_outbox_bytes - len(data)
+        pending_bytes = self._pending_bytes
+        # No awaits below: membership cannot change while iterating
+        for writer in members:
+            if writer is sender:
+                continue
+            transport = writer.transport
+            if transport.is_closing():
+                continue
+            if transport.get_write_buffer_size() + pending_bytes.get(writer, 0) > limit:
+                if self.slow_client_policy == "drop":
+                    self.dropped_messages += 1
+                    continue
+                # Its handler sees EOF and leaves the group as usual
+                self.slow_disconnects += 1
+                transport.abort()
+                continue
+            self._queue(writer, data)
+
+    def _queue(self, writer: asyncio.StreamWriter, data: bytes):
+        pending = self._pending
+        chunks = pending.get(writer)
+        if chunks is None:
+            if not pending:
+                asyncio.get_running_loop().call_soon(self._flush_pending)
+            pending[writer] = [data]
+            self._pending_bytes[writer] = len(data)
+        else:
+            chunks.append(data)
+            self._pending_bytes[writer] += len(data)
+
+    def _flush_pending(self):
+        pending, self._pending = self._pending, {}
+        self._pending_bytes = {}
+        for writer, chunks in pending.items():
+            if not writer.transport.is_closing():
+                writer.write(chunks[0] if len(chunks) == 1 else b"".join(chunks))
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        addr = writer.get_extra_info("peername")
+        print(f"[+] New connection from {addr}")
+        group_id = None
+
+        try:
+            writer.write(HISTORY_MODES[self.history.mode] + b"Enter your user id: ")
+            user_id = (await reader.read(1024)).decode(errors="ignore").strip()
+            if not user_id:
+                return
+
+            writer.write(b"Enter group id to join (e.g., group1): ")
+            group_id = (await reader.read(1024)).decode(errors="ignore").strip()
+            if not group_id:
+                group_id = None
+                return
+
+            # Add client to the chosen group (create if it doesn't exist)
+            self.groups.setdefault(group_id, {})[writer] = user_id
+            print(f"[+] User '{user_id}' joined group '{group_id}' from {addr}")
+
+            writer.write(
+                f"\r\nYou joined group '{group_id}' as '{user_id}'.\r\n"
+                "Type messages and press Enter to chat.\r\n"
+                "Type '/quit' to leave.\r\n\r\n".encode()
+            )
+            writer.write(self.history.replay(group_id))
+
+            # Notify others in the group (do NOT store this in history)
+            self.broadcast(group_id, f"[Server] {user_id} has joined the group.\r\n",
+                           sender=writer, save_to_history=False)
+
+            while True:
+                data = await reader.read(1024)
+                if not data:
+                    break  # client disconnected
+
+                msg = data.decode(errors="ignore").strip()
+                if not msg:
+                    continue
+
+                if msg.lower() == "/quit":
+                    self._queue(writer, b"Goodbye!\r\n")
+                    break
+
+                formatted = f"[{group_id}] {user_id}: {msg}\r\n"
+                if not self.quiet:
+                    print(formatted.strip())
+                self.broadcast(group_id, formatted, sender=writer)
+
+        except ConnectionError:
+            # Client closed the connection abruptly
+            pass
+        finally:
+            if group_id is not None:
+                members = self.groups[group_id]
+                del members[writer]
+                if not members:
+                    del self.groups[group_id]  # delete empty group
+                print(f"[-] Connection from {addr} ({group_id}) closed.")
+                self.broadcast(group_id, f"[Server] {user_id} has left the group.\r\n",
+                               save_to_history=False)
+            # Output still queued (e.g. "Goodbye!") is written before closing
+            chunks = self._pending.pop(writer, None)
+            self._pending_bytes.pop(writer, None)
+            if chunks:
+                writer.write(b"".join(chunks))
+            writer.close()
+
+    async def serve(self):
+        autosave = None
+        if self.history.mode == "persistent":
+            self.history.load()
+            print("[*] Loaded history from disk.")
+            autosave = asyncio.create_task(self.history.autosave())
+        server = await asyncio.start_server(self.handle_client, self.host, self.port,
+                                            backlog=BACKLOG)
+        print(f"[*] Async group chat server ({self.history.mode} history) "
+              f"listening on {self.host}:{self.port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if autosave is not None:
+                autosave.cancel()
+                self.history.save(self.history.snapshot())
+
+
+def raise_fd_limit():
+    """
+    Every member holds a socket; lift the soft descriptor limit to the
+    hard one so tens of thousands fit (Unix only).
+    """
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="asyncio group chat server: one event loop instead of a thread per "
+                    "client, with the handshake, history replay and /quit of the "
+                    "threaded servers.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--history", choices=sorted(HISTORY_MODES), default="memory",
+                        help="none: group_chat_server, memory: group_char_server_history, "
+                             "persistent: presistent_group_chat_server (default: memory)")
+    parser.add_argument("--history-limit", type=int, default=HISTORY_LIMIT,
+                        help="messages kept per group")
+    parser.add_argument("--history-file", default=HISTORY_FILE)
+    parser.add_argument("--max-outbox-bytes", type=int, default=MAX_OUTBOX_BYTES)
+    parser.add_argument("--slow-client-policy", choices=("disconnect", "drop"),
+                        default=SLOW_CLIENT_POLICY)
+    parser.add_argument("--quiet", action="store_true", help="do not print chat messages")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    raise_fd_limit()
+    ttl = HISTORY_TTL_SECONDS if args.history == "persistent" else None
+    history = ChatHistory(args.history, args.history_limit, ttl, args.history_file)
+    server = AsyncGroupChatServer(args.host, args.port, history, args.max_outbox_bytes,
+                                  args.slow_client_policy, args.quiet)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        print("\n[*] Shutting down.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+# Send without blocking even on sockets the handler threads keep blocking
+MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0)
+MAX_BUFFERS_PER_SEND = 64  # messages handed to one sendmsg() call
+HAVE_SENDMSG = hasattr(socket.socket, "sendmsg")  # not on Windows
+
+
+class _Outbox:
+    """
+    Messages waiting to be written to one connection.
+    queue holds shared bytes objects; offset is how much of queue[0] has
+    already been sent.
+    """
+    __slots__ = ("conn", "queue", "offset", "size", "allowance", "lock", "scheduled",
+                 "registered", "closing", "close_deadline", "dead", "closed")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.queue = deque()
+        self.offset = 0
+        self.size = 0  # bytes queued, not yet sent
+        self.allowance = 0  # of size, exempt from max_outbox_bytes (never > size)
+        self.lock = threading.Lock()
+        self.scheduled = False  # queued for the writer thread
+        self.registered = False  # in the writer's selector (only touched by it)
+        self.closing = False
+        self.close_deadline = None
+        self.dead = False  # write failed or shut down; nothing more is sent
+        self.closed = False
+
+
+class BroadcastEngine:
+    """
+    Non-blocking fan-out for the chat servers.
+
+    Handler threads never write to sockets themselves. send() and
+    broadcast() append the message (encoded once and shared by every
+    recipient) to each connection's outbox and return immediately. One
+    writer thread drains the outboxes with non-blocking scatter-gather
+    writes, waiting for writability with selectors only when a socket's
+    buffer is full. A slow reader therefore no longer stalls its group,
+    and a broadcast to N members costs the sender N queue appends
+    instead of N blocking sendall calls.
+
+    Each outbox is bounded by max_outbox_bytes. When a message would
+    exceed it, slow_client_policy decides:
+      - "disconnect": shut the connection down (its handler then sees
+                      EOF and cleans up as for any disconnect)
+      - "drop":       skip this message for that client only
+    A message sent with capped=False (such as a history replay on join)
+    is queued regardless, and its unsent bytes do not count towards the
+    limit for the messages after it.
+    """
+    POLICIES = ("disconnect", "drop")
+
+    def __init__(self, max_outbox_bytes: int = 256 * 1024,
+                 slow_client_policy: str = "disconnect", close_timeout: float = 2.0):
+        if slow_client_policy not in self.POLICIES:
+            raise ValueError(f"slow_client_policy must be one of {self.POLICIES}")
+        self.max_outbox_bytes = max_outbox_bytes
+        self.slow_client_policy = slow_client_policy
+        self.close_timeout = close_timeout
+        self.dropped_messages = 0
+        self.slow_disconnects = 0
+        self._outboxes = {}  # conn -> _Outbox
+        self._outboxes_lock = threading.Lock()
+        self._ready = deque()  # outboxes with new data, for the writer
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._sel = selectors.DefaultSelector()
+        self._sel.register(self._wake_r, selectors.EVENT_READ)
+        self._closing = set()  # outboxes flushing before their socket is closed
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # ---------- Handler side ----------
+
+    def register(self, conn: socket.socket):
+        """
+        Route all further output for conn through the engine.
+        """
+        with self._outboxes_lock:
+            self._outboxes[conn] = _Outbox(conn)
+
+    def unregister(self, conn: socket.socket):
+        """
+        Close conn once its queued output is written (or close_timeout
+        passes). Connections that were never registered are closed now.
+        """
+        with self._outboxes_lock:
+            outbox = self._outboxes.pop(conn, None)
+        if outbox is None:
+            conn.close()
+            return
+        with outbox.lock:
+            outbox.closing = True
+            outbox.close_deadline = time.time() + self.close_timeout
+        # Even if it is already scheduled or waiting for writability, so
+        # the writer starts the close timeout now
+        self._ready.append(outbox)
+        self._wake()
+
+    def send(self, conn: socket.socket, data: bytes, capped: bool = True):
+        outbox = self._outboxes.get(conn)
+        if outbox is not None and self._enqueue(outbox, data, capped):
+            self._wake()
+
+    def broadcast(self, conns, data: bytes, exclude=None):
+        """
+        Queue the same bytes object for every connection in conns except
+        exclude, then wake the writer once.
+        """
+        outboxes = self._outboxes
+        wake = False
+        for conn in conns:
+            if conn is exclude:
+                continue
+            outbox = outboxes.get(conn)
+            if outbox is not None and self._enqueue(outbox, data):
+                wake = True
+        if wake:
+            self._wake()
+
+    def _enqueue(self, outbox: _Outbox, data: bytes, capped: bool = True) -> bool:
+        """
+        Returns True if the writer has to be woken for this outbox.
+        """
+        with outbox.lock:
+            if outbox.dead or outbox.closing:
+                return False
+            if not capped:
+                outbox.allowance += len(data)
+            elif outbox.size - outbox.allowance + len(data) > self.max_outbox_bytes:
+                if self.slow_client_policy == "drop":
+                    self.dropped_messages += 1
+                    return False
+                outbox.dead = True
+                self.slow_disconnects += 1
+                try:
+                    outbox.conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                return False
+            outbox.queue.append(data)
+            outbox.size += len(data)
+            return self._schedule_locked(outbox)
+
+    def _schedule_locked(self, outbox: _Outbox) -> bool:
+        if outbox.scheduled:
+            return False
+        outbox.scheduled = True
+        self._ready.append(outbox)
+        return True
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except BlockingIOError:
+            pass  # a wakeup is already pending
+
+    # ---------- Writer thread ----------
+
+    def _run(self):
+        while True:
+            timeout = None
+            if self._closing:
+                timeout = max(0.0, min(o.close_deadline for o in self._closing) - time.time())
+            for key, _events in self._sel.select(timeout):
+                if key.fileobj is self._wake_r:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                else:
+                    self._flush(key.data)
+            while self._ready:
+                self._flush(self._ready.popleft())
+            if self._closing:
+                now = time.time()
+                for outbox in [o for o in self._closing if o.close_deadline <= now]:
+                    self._finish(outbox)
+
+    def _flush(self, outbox: _Outbox):
+        """
+        Write as much of outbox as the socket accepts without blocking.
+        """
+        conn = outbox.conn
+        while not outbox.dead:
+            with outbox.lock:
+                if not outbox.queue:
+                    outbox.scheduled = False
+                    break
+                buffers = list(islice(outbox.queue, MAX_BUFFERS_PER_SEND))
+                offset = outbox.offset
+            if offset:
+                buffers[0] = memoryview(buffers[0])[offset:]
+            try:
+                if HAVE_SENDMSG:
+                    sent = conn.sendmsg(buffers, [], MSG_DONTWAIT)
+                else:
+                    sent = conn.send(buffers[0], MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError:
+                outbox.dead = True
+                break
+            if sent:
+                with outbox.lock:
+                    outbox.size -= sent
+                    # Exempt bytes still queued can never exceed what is queued
+                    outbox.allowance = min(outbox.allowance, outbox.size)
+                    sent += outbox.offset
+                    queue = outbox.queue
+                    while queue and sent >= len(queue[0]):
+                        sent -= len(queue.popleft())
+                    outbox.offset = sent
+                continue
+            # Socket buffer full: wait until it is writable again
+            if not outbox.registered:
+                self._sel.register(conn, selectors.EVENT_WRITE, outbox)
+                outbox.registered = True
+            if outbox.closing:
+                self._closing.add(outbox)
+            return
+        # Drained, or the connection is gone
+        if outbox.registered:
+            self._sel.unregister(conn)
+            outbox.registered = False
+        if outbox.closing:
+            self._finish(outbox)
+
+    def _finish(self, outbox: _Outbox):
+        """
+        Close the socket of a connection its handler has unregistered.
+        """
+        self._closing.discard(outbox)
+        if outbox.registered:
+            self._sel.unregister(outbox.conn)
+            outbox.registered = False
+        if not outbox.closed:
+            outbox.closed = True
+            outbox.dead = True
+            outbox.conn.close()
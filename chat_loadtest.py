@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from async_group_chat_server import raise_fd_limit
+from kv_bench import emit, free_port, percentile, read_rss
+
+SERVERS = ("async_group_chat_server", "group_chat_server",
+           "group_char_server_history", "presistent_group_chat_server")
+
+
+# ---------- Members ----------
+
+class Member:
+    """
+    One chat client. Listeners time every relayed load-test message they
+    receive; idle members leave their data in the kernel socket buffer,
+    like a client that is not reading (or only drain it, --drain-idle).
+    """
+    def __init__(self, user_id: str, group_id: str, listener: bool):
+        self.user_id = user_id
+        self.group_id = group_id
+        self.listener = listener
+        self.reader = None
+        self.writer = None
+        self.received = 0  # load-test messages seen (listeners only)
+        self.latencies = []  # seconds, listeners only
+        self.eof = False
+
+    async def join(self, host: str, port: int):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        await self.reader.readuntil(b"user id: ")
+        self.writer.write(self.user_id.encode())
+        await self.reader.readuntil(b"(e.g., group1): ")
+        self.writer.write(self.group_id.encode())
+        await self.reader.readuntil(b"'/quit' to leave.\r\n\r\n")
+
+    async def drain(self):
+        reader = self.reader
+        if not self.listener:
+            while await reader.read(65536):
+                pass
+            self.eof = True
+            return
+        # Chunks the server relays are not split at newlines, so a line
+        # may also start with the marker
+        marker = b"load "
+        while True:
+            try:
+                line = await reader.readuntil(b"\r\n")
+            except asyncio.IncompleteReadError:
+                self.eof = True
+                return
+            pos = line.find(marker)
+            if pos < 0:
+                continue  # join/leave notices, history
+            now = time.perf_counter()
+            _seq, sent = line[pos + len(marker):].split()
+            self.latencies.append(now - float(sent))
+            self.received += 1
+
+
+async def join_all(args, members: list[Member]) -> tuple[float, int]:
+    """
+    Connect and hand-shake every member, args.connect_concurrency at a
+    time. Returns (seconds, failures).
+    """
+    slots = asyncio.Semaphore(args.connect_concurrency)
+    failures = 0
+
+    async def join(member):
+        nonlocal failures
+        async with slots:
+            try:
+                await member.join(args.host, args.port)
+            except (OSError, asyncio.IncompleteReadError):
+                failures += 1
+                member.writer = None
+
+    started = time.perf_counter()
+    # In order, so each group's listeners join last and see the full fan-out
+    await asyncio.gather(*(join(m) for m in members))
+    return time.perf_counter() - started, failures
+
+
+# ---------- Workload ----------
+
+async def run(args, proc) -> dict:
+    groups = [f"g{g}" for g in range(args.groups)]
+    senders = [Member(f"sender{g}", gid, False) for g, gid in enumerate(groups)]
+    members = []
+    for i in range(args.members):
+        gid = groups[i % args.groups]
+        members.append(Member(f"user{i}", gid, False))
+    for g, gid in enumerate(groups):
+        members += [Member(f"listener{g}.{i}", gid, True) for i in range(args.listeners)]
+
+    rss_before = read_rss(proc.pid) if proc is not None else None
+    connect_seconds, failures = await join_all(args, senders + members)
+    joined = [m for m in senders + members if m.writer is not None]
+    drains = []
+    for m in joined:
+        if m.listener or args.drain_idle:
+            drains.append(asyncio.create_task(m.drain()))
+        else:
+            m.writer.transport.pause_reading()
+    await asyncio.sleep(args.settle)  # let join notices flush
+    rss_after = read_rss(proc.pid) if proc is not None else None
+
+    # One message every 1/rate seconds, round-robin over the groups
+    interval = 1.0 / args.rate
+    started = time.perf_counter()
+    for seq in range(args.messages):
+        sender = senders[seq % args.groups]
+        if sender.writer is not None:
+            sender.writer.write(f"load {seq} {time.perf_counter():.6f}\r\n".encode())
+        delay = started + (seq + 1) * interval - time.perf_counter()
+        await asyncio.sleep(max(0.0, delay))
+    send_seconds = time.perf_counter() - started
+
+    listeners = [m for m in joined if m.listener]
+    expected = {gid: sum(1 for seq in range(args.messages) if seq % args.groups == g)
+                for g, gid in enumerate(groups)}
+    deadline = time.perf_counter() + args.timeout
+    while time.perf_counter() < deadline:
+        if all(m.received >= expected[m.group_id] or m.eof for m in listeners):
+            break
+        await asyncio.sleep(0.05)
+
+    for m in joined:
+        m.writer.close()
+    for task in drains:
+        task.cancel()
+    await asyncio.gather(*drains, return_exceptions=True)
+
+    latencies = sorted(x * 1000 for m in listeners for x in m.latencies)
+    return {
+        "config": {
+            "server": args.server,
+            "history": args.history,
+            "members": args.members,
+            "groups": args.groups,
+            "listeners_per_group": args.listeners,
+            "messages": args.messages,
+            "rate": args.rate,
+            "drain_idle": args.drain_idle,
+        },
+        "connected": len(joined),
+        "connect_failures": failures,
+        "connect_seconds": round(connect_seconds, 3),
+        "listeners_disconnected": sum(1 for m in listeners if m.eof),
+        "rss_before_bytes": rss_before,
+        "rss_after_bytes": rss_after,
+        "rss_bytes_per_member": (round((rss_after - rss_before) / len(joined), 1)
+                                 if proc is not None and joined else None),
+        "send_seconds": round(send_seconds, 3),
+        "deliveries": len(latencies),
+        "expected_deliveries": sum(expected[m.group_id] for m in listeners),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50), 3),
+            "p90": round(percentile(latencies, 0.90), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "max": round(latencies[-1], 3) if latencies else 0.0,
+        },
+    }
+
+
+# ---------- Server lifecycle ----------
+
+def start_server(args, history_file: str) -> subprocess.Popen:
+    """
+    Run the selected chat server in a subprocess, with its output
+    discarded and its history file in a temporary directory.
+    """
+    if args.server == "async_group_chat_server":
+        argv = ["--host", args.host, "--port", str(args.port), "--history", args.history,
+                "--history-file", history_file, "--quiet"]
+        code = f"import async_group_chat_server as m; m.main({argv!r})"
+    else:
+        # The threaded servers are configured through module constants
+        code = (f"import {args.server} as m; m.HOST = {args.host!r}; m.PORT = {args.port}; "
+                f"m.HISTORY_FILE = {history_file!r}; m.main()")
+    proc = subprocess.Popen([sys.executable, "-c", code],
+                            cwd=os.path.dirname(os.path.abspath(__file__)),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection((args.host, args.port), timeout=0.5).close()
+            return proc
+        except OSError:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"{args.server} did not start on {args.host}:{args.port}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load test for the group chat servers. Joins many members (idle "
+                    "apart from reading), then sends timestamped messages at a fixed "
+                    "rate and reports server RSS per member and broadcast latency as "
+                    "seen by the last members to join each group.")
+    parser.add_argument("--server", choices=SERVERS, default="async_group_chat_server")
+    parser.add_argument("--history", choices=("none", "memory", "persistent"),
+                        default="none", help="async_group_chat_server only")
+    parser.add_argument("--target", default=None, metavar="HOST:PORT",
+                        help="use a running server instead of starting one")
+    parser.add_argument("--members", type=int, default=10000, help="idle members in total")
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--listeners", type=int, default=2,
+                        help="latency-measuring members per group")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=100.0, help="messages per second")
+    parser.add_argument("--drain-idle", action="store_true",
+                        help="idle members read (and discard) what they receive")
+    parser.add_argument("--connect-concurrency", type=int, default=200)
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="seconds to wait after joining before sending")
+    parser.add_argument("--timeout", type=float, default=10.0,
+                        help="seconds to wait for stragglers after the last send")
+    parser.add_argument("--output", default=None, help="write the JSON report here")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    raise_fd_limit()
+    proc = None
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.target is not None:
+            host, _, port = args.target.rpartition(":")
+            args.host, args.port = host, int(port)
+        else:
+            args.host = "127.0.0.1"
+            args.port = free_port(args.host)
+            proc = start_server(args, os.path.join(tmp, "chat_history.json"))
+        try:
+            result = asyncio.run(run(args, proc))
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait()
+    emit(args, result)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,24 +2,37 @@
 import socket
 import threading
 
+from chat_broadcast import BroadcastEngine
+
 HOST = "0.0.0.0"
 PORT = 5002  # choose any free port
 
-# group_id -> list of (conn, user_id)
+MAX_OUTBOX_BYTES = 256 * 1024   # output queued per client before the policy applies
+SLOW_CLIENT_POLICY = "disconnect"  # or "drop": skip messages for that client
+
+# group_id -> {conn: user_id}; dicts keep join order and make leaving O(1)
 groups = {}
 
+# conn -> group_id, so leaving does not scan every group
+member_group = {}
+
 # group_id -> list of previous chat messages (strings with \r\n)
 group_history = {}
 
-# One lock to protect both structures
+# One lock to protect all three structures
 data_lock = threading.Lock()
 
+# Writes everything sent to joined clients; created in main()
+engine = None
+
 
 def broadcast(group_id, message, sender_conn=None, save_to_history=True):
     """
     Send 'message' to all clients in the given group_id,
     except optionally the sender_conn.
     Optionally store the message in the group's history.
+    The message is encoded once and queued for each client; the broadcast
+    engine writes it, so a slow client never blocks the sender.
     """
     with data_lock:
         # Save in history if required
@@ -31,17 +44,10 @@ def broadcast(group_id, message, sender_conn=None, save_to_history=True):
             #     history.pop(0)
 
         # Take a snapshot of current clients in that group
-        clients = list(groups.get(group_id, []))
+        conns = list(groups.get(group_id, ()))
 
-    # Send to all clients except the sender
-    for conn, _uid in clients:
-        if conn is sender_conn:
-            continue
-        try:
-            conn.sendall(message.encode())
-        except OSError:
-            # If sending fails, ignore; cleanup happens in handler
-            pass
+    # Queue for all clients except the sender
+    engine.broadcast(conns, message.encode(), exclude=sender_conn)
 
 
 def send_previous_messages(conn, group_id):
@@ -53,15 +59,15 @@ def send_previous_messages(conn, group_id):
         history = list(group_history.get(group_id, []))
 
     if not history:
-        conn.sendall(b"(No previous messages in this group yet.)\r\n\r\n")
+        engine.send(conn, b"(No previous messages in this group yet.)\r\n\r\n")
         return
 
+    # Queued as one message, so live broadcasts cannot interleave with it,
+    # and exempt from MAX_OUTBOX_BYTES so a long history cannot get every
+    # joiner disconnected
     header = f"--- Previous messages in group '{group_id}' ---\r\n"
-    conn.sendall(header.encode())
-    for msg in history:
-        # each msg already has \r\n at the end
-        conn.sendall(msg.encode())
-    conn.sendall(b"--- End of previous messages ---\r\n\r\n")
+    replay = header + "".join(history) + "--- End of previous messages ---\r\n\r\n"
+    engine.send(conn, replay.encode(), capped=False)
 
 
 def handle_client(conn, addr):
@@ -83,19 +89,23 @@ def handle_client(conn, addr):
             conn.close()
             return
 
+        # From here on all output goes through the engine
+        engine.register(conn)
+
         # Add client to the chosen group (create if it doesn't exist)
         with data_lock:
-            groups.setdefault(group_id, [])
-            groups[group_id].append((conn, user_id))
+            groups.setdefault(group_id, {})[conn] = user_id
+            member_group[conn] = group_id
             # Ensure group_history entry exists too
             group_history.setdefault(group_id, [])
 
         print(f"[+] User '{user_id}' joined group '{group_id}' from {addr}")
 
-        conn.sendall(
+        engine.send(
+            conn,
             f"\r\nYou joined group '{group_id}' as '{user_id}'.\r\n"
             "Type messages and press Enter to chat.\r\n"
-            "Type '/quit' to leave.\r\n\r\n".encode()
+            "Type '/quit' to leave.\r\n\r\n".encode(),
         )
 
         # Send previous messages to this new client (Objective 3)
@@ -120,7 +130,7 @@ def handle_client(conn, addr):
                 continue
 
             if msg.lower() == "/quit":
-                conn.sendall(b"Goodbye!\r\n")
+                engine.send(conn, b"Goodbye!\r\n")
                 break
 
             # User chat message: format and broadcast to others
@@ -135,14 +145,9 @@ def handle_client(conn, addr):
     finally:
         # Remove from groups
         with data_lock:
-            for gid, clients in groups.items():
-                new_list = [(c, uid) for (c, uid) in clients if c is not conn]
-                if len(new_list) != len(clients):
-                    groups[gid] = new_list
-                    removed_from = gid
-                    break
-            else:
-                removed_from = None
+            removed_from = member_group.pop(conn, None)
+            if removed_from is not None:
+                del groups[removed_from][conn]
 
         if removed_from:
             print(f"[-] Connection from {addr} ({removed_from}) closed.")
@@ -157,10 +162,14 @@ def handle_client(conn, addr):
             except Exception:
                 pass
 
-        conn.close()
+        # Closes the socket once queued output (e.g. "Goodbye!") is written
+        engine.unregister(conn)
 
 
 def main():
+    global engine
+    engine = BroadcastEngine(MAX_OUTBOX_BYTES, SLOW_CLIENT_POLICY)
+
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_sock:
         server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server_sock.bind((HOST, PORT))
@@ -2,30 +2,35 @@
 import socket
 import threading
 
+from chat_broadcast import BroadcastEngine
+
 HOST = "0.0.0.0"
 PORT = 5001  # change if needed
 
-# group_id -> list of (conn, user_id)
+MAX_OUTBOX_BYTES = 256 * 1024   # output queued per client before the policy applies
+SLOW_CLIENT_POLICY = "disconnect"  # or "drop": skip messages for that client
+
+# group_id -> {conn: user_id}; dicts keep join order and make leaving O(1)
 groups = {}
+# conn -> group_id, so leaving does not scan every group
+member_group = {}
 groups_lock = threading.Lock()
 
+# Writes everything sent to joined clients; created in main()
+engine = None
+
 
 def broadcast(group_id, message, sender_conn=None):
     """
     Send 'message' to all clients in the given group_id,
     except optionally the sender_conn.
+    The message is encoded once and queued for each client; the broadcast
+    engine writes it, so a slow client never blocks the sender.
     """
     with groups_lock:
-        clients = list(groups.get(group_id, []))  # snapshot
+        conns = list(groups.get(group_id, ()))  # snapshot
 
-    for conn, _uid in clients:
-        if conn is sender_conn:
-            continue
-        try:
-            conn.sendall(message.encode())
-        except OSError:
-            # Broken pipe / disconnected client; cleanup happens elsewhere
-            pass
+    engine.broadcast(conns, message.encode(), exclude=sender_conn)
 
 
 def handle_client(conn, addr):
@@ -45,10 +50,13 @@ def handle_client(conn, addr):
             conn.close()
             return
 
+        # From here on all output goes through the engine
+        engine.register(conn)
+
         # Add client to the chosen group (create if it doesn't exist)
         with groups_lock:
-            groups.setdefault(group_id, [])
-            groups[group_id].append((conn, user_id))
+            groups.setdefault(group_id, {})[conn] = user_id
+            member_group[conn] = group_id
         print(f"[+] User '{user_id}' joined group '{group_id}' from {addr}")
 
         welcome = (
@@ -56,7 +64,7 @@ def handle_client(conn, addr):
             "Type messages and press Enter to chat.\r\n"
             "Type '/quit' to leave.\r\n\r\n"
         )
-        conn.sendall(welcome.encode())
+        engine.send(conn, welcome.encode())
 
         # Notify others in the group
         broadcast(group_id,
@@ -73,7 +81,7 @@ def handle_client(conn, addr):
                 continue
 
             if msg.lower() == "/quit":
-                conn.sendall(b"Goodbye!\r\n")
+                engine.send(conn, b"Goodbye!\r\n")
                 break
 
             # Relay message to other clients in the same group
@@ -86,16 +94,13 @@ def handle_client(conn, addr):
         pass
     finally:
         # Remove from groups
-        removed_from = None
         with groups_lock:
-            for gid, clients in list(groups.items()):
-                new_list = [(c, uid) for (c, uid) in clients if c is not conn]
-                if len(new_list) != len(clients):
-                    groups[gid] = new_list
-                    removed_from = gid
-                    if not new_list:
-                        del groups[gid]  # delete empty group
-                    break
+            removed_from = member_group.pop(conn, None)
+            if removed_from is not None:
+                members = groups[removed_from]
+                del members[conn]
+                if not members:
+                    del groups[removed_from]  # delete empty group
 
         if removed_from:
             print(f"[-] Connection from {addr} ({removed_from}) closed.")
@@ -107,10 +112,14 @@ def handle_client(conn, addr):
             except Exception:
                 pass
 
-        conn.close()
+        # Closes the socket once queued output (e.g. "Goodbye!") is written
+        engine.unregister(conn)
 
 
 def main():
+    global engine
+    engine = BroadcastEngine(MAX_OUTBOX_BYTES, SLOW_CLIENT_POLICY)
+
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_sock:
         server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server_sock.bind((HOST, PORT))
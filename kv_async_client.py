@@ -0,0 +1,173 @@
+import asyncio
+import sys
+from collections import deque
+
+from kv_client import MULTILINE_FRAMES, KVError, _Commands
+
+
+async def read_response_async(reader: asyncio.StreamReader) -> str | None:
+    """
+    asyncio counterpart of kv_client.read_response.
+    """
+    line = await reader.readline()
+    if not line.endswith(b"\n"):
+        return None
+    response = line.decode("utf-8").rstrip("\n")
+    if response.startswith(MULTILINE_FRAMES):
+        lines = [response]
+        for _ in range(int(response.rsplit(" ", 1)[1])):
+            line = await reader.readline()
+            if not line.endswith(b"\n"):
+                return None
+            lines.append(line.decode("utf-8").rstrip("\n"))
+        response = "\n".join(lines)
+    return response
+
+
+class AsyncKVClient(_Commands):
+    """
+    asyncio client for the key-value server that multiplexes many
+    coroutines over one connection.
+
+    Requests are written in call order and the server answers in order,
+    so a single reader task resolves pending futures FIFO. At most
+    max_in_flight requests are outstanding; further callers wait
+    (backpressure), and writes also wait for the transport to drain.
+    With timeout set, a caller gets asyncio.TimeoutError if its reply
+    takes longer; the reply is still consumed when it arrives, keeping
+    the stream in sync. Reply lines may be up to max_line_bytes long
+    (asyncio's default limit would be 64 KiB).
+
+        async with AsyncKVClient(port=5000) as client:
+            values = await asyncio.gather(*(client.get(k) for k in keys))
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 5000,
+                 max_in_flight: int = 1000, timeout: float | None = None,
+                 max_line_bytes: int = 64 * 1024 * 1024):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_line_bytes = max_line_bytes
+        self._max_in_flight = max_in_flight
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._pending = deque()
+        self._slots = None
+        self._error = None  # set once the reader has stopped; later calls fail with it
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_connection(
+            self.host, self.port, limit=self.max_line_bytes)
+        self._error = None
+        self._slots = asyncio.Semaphore(self._max_in_flight)
+        self._reader_task = asyncio.create_task(self._read_loop())
+
+    async def close(self):
+        if self._writer is None:
+            return
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except OSError:
+            pass
+        if self._reader_task is not None:
+            try:
+                await self._reader_task
+            except Exception:
+                pass  # already reported to the pending callers
+        self._writer = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def execute(self, command: str) -> str:
+        """
+        Send a raw command line and return the raw response frame.
+        """
+        return await self._call(command, lambda response: response)
+
+    async def _call(self, line: str, parser):
+        if self._writer is None:
+            raise ConnectionError("Not connected")
+        await self._slots.acquire()
+        if self._error is not None:
+            # Nothing would ever answer; fail instead of hanging
+            self._slots.release()
+            raise ConnectionError(str(self._error))
+        future = asyncio.get_running_loop().create_future()
+        # Queue and write in the same step so the FIFO matches wire order
+        self._pending.append(future)
+        try:
+            self._writer.write(line.encode("utf-8") + b"\n")
+            await self._writer.drain()
+        except Exception:
+            # The connection failed under us. Unless the reader already
+            # failed the future, take it back along with its slot.
+            try:
+                self._pending.remove(future)
+            except ValueError:
+                pass
+            else:
+                self._slots.release()
+            raise
+        if self.timeout is None:
+            response = await future
+        else:
+            response = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        return parser(response)
+
+    async def _read_loop(self):
+        error = ConnectionError(f"Server {self.host}:{self.port} closed the connection")
+        try:
+            while True:
+                response = await read_response_async(self._reader)
+                if response is None:
+                    break
+                future = self._pending.popleft()
+                self._slots.release()
+                if not future.done():
+                    future.set_result(response)
+        except (OSError, IndexError) as exc:
+            error = ConnectionError(str(exc) or repr(exc))
+        except ValueError as exc:
+            # readline() reports a LimitOverrunError as ValueError; either
+            # way the stream is out of sync and the connection is useless
+            if isinstance(exc.__context__, asyncio.LimitOverrunError):
+                error = ConnectionError(f"Reply from {self.host}:{self.port} has a line "
+                                        f"over max_line_bytes ({self.max_line_bytes})")
+            else:
+                error = ConnectionError(f"Malformed reply from {self.host}:{self.port}: {exc}")
+            self._writer.close()
+        finally:
+            self._error = error
+            while self._pending:
+                future = self._pending.popleft()
+                self._slots.release()
+                if not future.done():
+                    future.set_exception(error)
+
+
+async def _demo(host: str, port: int):
+    async with AsyncKVClient(host, port) as client:
+        await asyncio.gather(*(client.put(f"key{i}", f"value{i}") for i in range(1000)))
+        values = await asyncio.gather(*(client.get(f"key{i}") for i in range(1000)))
+        print(f"[CLIENT] Wrote and read back {len(values)} keys, last: {values[-1]!r}")
+        try:
+            await client.putex("key0", -1, "x")
+        except KVError as exc:
+            print(f"[CLIENT] Server error as expected: {exc}")
+
+
+if __name__ == "__main__":
+    host = "127.0.0.1"
+    port = 5000
+    if len(sys.argv) >= 2:
+        host = sys.argv[1]
+    if len(sys.argv) >= 3:
+        port = int(sys.argv[2])
+    asyncio.run(_demo(host, port))
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+import argparse
+import bisect
+import json
+import math
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from array import array
+
+
+# ---------- Workload ----------
+
+class Workload:
+    """
+    Generates request lines for one connection from the benchmark options.
+    """
+    def __init__(self, args, seed: int):
+        self.rng = random.Random(seed)
+        self.read_ratio = args.read_ratio
+        self.ttl_share = args.ttl_share
+        self.ttl = args.ttl
+        self.num_keys = args.keys
+        self.value = "v" * args.value_size
+        self.cum_weights = None
+        if args.distribution == "zipf":
+            self.cum_weights = zipf_cum_weights(args.keys, args.zipf_s)
+
+    def key(self) -> str:
+        if self.cum_weights is None:
+            index = self.rng.randrange(self.num_keys)
+        else:
+            point = self.rng.random() * self.cum_weights[-1]
+            index = bisect.bisect_left(self.cum_weights, point)
+        return f"key:{index}"
+
+    def request(self) -> bytes:
+        rng = self.rng
+        if rng.random() < self.read_ratio:
+            return f"GET {self.key()}\n".encode()
+        if self.ttl_share and rng.random() < self.ttl_share:
+            return f"PUTEX {self.key()} {self.ttl} {self.value}\n".encode()
+        return f"PUT {self.key()} {self.value}\n".encode()
+
+
+def zipf_cum_weights(n: int, s: float) -> list[float]:
+    """
+    Cumulative weights of a Zipf(s) distribution over ranks 1..n.
+    """
+    total = 0.0
+    cum = []
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** s
+        cum.append(total)
+    return cum
+
+
+# ---------- Load generation ----------
+
+def run_connection(args, seed: int, deadline: float, result: dict):
+    """
+    Drive one connection until deadline, recording the latency of every
+    request (for pipelined batches: the batch round trip).
+    """
+    workload = Workload(args, seed)
+    latencies = array("d")
+    ops = errors = 0
+    host, port = args.host, args.port
+    with socket.create_connection((host, port)) as sock:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = sock.makefile("rb")
+        depth = args.pipeline
+        while time.perf_counter() < deadline:
+            batch = b"".join(workload.request() for _ in range(depth))
+            started = time.perf_counter()
+            sock.sendall(batch)
+            for _ in range(depth):
+                line = reader.readline()
+                if not line:
+                    raise ConnectionError("server closed the connection")
+                if line.startswith(b"ERROR"):
+                    errors += 1
+            elapsed = time.perf_counter() - started
+            for _ in range(depth):
+                latencies.append(elapsed)
+            ops += depth
+    result["ops"] = ops
+    result["errors"] = errors
+    result["latencies"] = latencies
+
+
+def run_worker(args, worker_id: int, connections: int, deadline: float, queue):
+    """
+    One load-generating process running `connections` threads, so the
+    client side is not limited to a single core.
+    """
+    results = [{} for _ in range(connections)]
+    threads = [
+        threading.Thread(target=run_connection,
+                         args=(args, worker_id * 1000 + i, deadline, results[i]))
+        for i in range(connections)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    latencies = array("d")
+    ops = errors = 0
+    for r in results:
+        ops += r.get("ops", 0)
+        errors += r.get("errors", 0)
+        latencies.extend(r.get("latencies", ()))
+    queue.put((ops, errors, latencies.tobytes()))
+
+
+def preload(args):
+    """
+    Write every key once so reads hit, using pipelined PUTs.
+    """
+    value = "v" * args.value_size
+    with socket.create_connection((args.host, args.port)) as sock:
+        reader = sock.makefile("rb")
+        for start in range(0, args.keys, 1000):
+            count = min(1000, args.keys - start)
+            sock.sendall("".join(f"PUT key:{i} {value}\n"
+                                 for i in range(start, start + count)).encode())
+            for _ in range(count):
+                reader.readline()
+
+
+# ---------- Memory footprint ----------
+
+def read_rss(pid: int) -> int:
+    """
+    Resident set size of a process in bytes (Linux /proc only).
+    """
+    with open(f"/proc/{pid}/status", encoding="ascii") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError(f"no VmRSS for pid {pid}")
+
+
+def load_keys(args, batch_size: int = 500):
+    """
+    Write args.keys keys of args.value_size bytes with pipelined MSETs.
+    Key i gets value number i % args.value_cardinality (every value
+    distinct by default), zero-padded to the value size.
+    """
+    cardinality = args.value_cardinality or args.keys
+    size = args.value_size
+
+    def value(i: int) -> str:
+        return str(i % cardinality).zfill(size)[-size:]
+
+    with socket.create_connection((args.host, args.port)) as sock:
+        reader = sock.makefile("rb")
+        for start in range(0, args.keys, batch_size * 16):
+            lines = []
+            for first in range(start, min(start + batch_size * 16, args.keys), batch_size):
+                last = min(first + batch_size, args.keys)
+                lines.append("MSET " + " ".join(f"key:{i} {value(i)}" for i in range(first, last)))
+            sock.sendall(("\n".join(lines) + "\n").encode())
+            for _ in lines:
+                line = reader.readline()
+                if line != b"OK\n":
+                    raise RuntimeError(f"MSET failed: {line!r}")
+
+
+def measure_memory(args, proc: subprocess.Popen) -> dict:
+    """
+    RSS of the server before and after loading the keys; the difference
+    divided by the key count approximates the per-key footprint.
+    """
+    time.sleep(0.2)
+    before = read_rss(proc.pid)
+    started = time.perf_counter()
+    load_keys(args)
+    elapsed = time.perf_counter() - started
+    time.sleep(0.2)
+    after = read_rss(proc.pid)
+    return {
+        "config": {
+            "server": args.server,
+            "mode": args.mode,
+            "shards": args.shards,
+            "keys": args.keys,
+            "value_size": args.value_size,
+            "value_cardinality": args.value_cardinality,
+            "intern_values": args.intern_values,
+            "compress_threshold": args.compress_threshold,
+        },
+        "load_seconds": round(elapsed, 3),
+        "rss_before_bytes": before,
+        "rss_after_bytes": after,
+        "bytes_per_key": round((after - before) / args.keys, 1) if args.keys else 0.0,
+    }
+
+
+# ---------- Reporting ----------
+
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def histogram(sorted_us) -> list[list]:
+    """
+    Power-of-two microsecond buckets: [[upper_bound_us, count], ...].
+    """
+    buckets = []
+    bound = 1.0
+    i = 0
+    n = len(sorted_us)
+    while i < n:
+        j = bisect.bisect_right(sorted_us, bound, i)
+        if j > i:
+            buckets.append([bound, j - i])
+        i = j
+        bound *= 2
+    return buckets
+
+
+def report(args, ops: int, errors: int, latencies, elapsed: float) -> dict:
+    us = sorted(x * 1e6 for x in latencies)
+    return {
+        "config": {
+            "server": args.server if args.target is None else args.target,
+            "mode": args.mode,
+            "shards": args.shards,
+            "connections": args.connections,
+            "workers": args.workers,
+            "pipeline": args.pipeline,
+            "duration": args.duration,
+            "read_ratio": args.read_ratio,
+            "distribution": args.distribution,
+            "zipf_s": args.zipf_s if args.distribution == "zipf" else None,
+            "keys": args.keys,
+            "value_size": args.value_size,
+            "ttl_share": args.ttl_share,
+        },
+        "ops": ops,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_ops_per_sec": round(ops / elapsed, 1) if elapsed else 0.0,
+        "latency_us": {
+            "mean": round(sum(us) / len(us), 1) if us else 0.0,
+            "p50": round(percentile(us, 0.50), 1),
+            "p90": round(percentile(us, 0.90), 1),
+            "p99": round(percentile(us, 0.99), 1),
+            "p999": round(percentile(us, 0.999), 1),
+            "max": round(us[-1], 1) if us else 0.0,
+        },
+        "histogram_us": histogram(us),
+    }
+
+
+# ---------- Server lifecycle ----------
+
+def free_port(host: str) -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+def start_server(args) -> subprocess.Popen:
+    """
+    Run the selected server module in a subprocess, so it does not share
+    a GIL with the load generator.
+    """
+    kwargs = {"host": args.host, "port": args.port}
+    if args.server == "kv_server_updated":
+        kwargs["mode"] = args.mode
+        kwargs["shards"] = args.shards
+        if args.intern_values:
+            kwargs["intern_values"] = True
+        if args.compress_threshold is not None:
+            kwargs["compress_threshold"] = args.compress_threshold
+    code = (f"import {args.server} as m; "
+            f"m.KeyValueServer(**{kwargs!r}).start()")
+    proc = subprocess.Popen([sys.executable, "-c", code],
+                            cwd=os.path.dirname(os.path.abspath(__file__)),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection((args.host, args.port), timeout=0.5).close()
+            return proc
+        except OSError:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"{args.server} did not start on {args.host}:{args.port}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load generator for kv_server.py / kv_server_updated.py. Starts the "
+                    "server in a subprocess (or uses --target), runs the workload and "
+                    "prints a JSON report of throughput and latency percentiles.",
+        epilog="examples:\n"
+               "  python kv_bench.py --mode eventloop --connections 64\n"
+               "  python kv_bench.py --server kv_server --read-ratio 0.5 --pipeline 16\n"
+               "  python kv_bench.py --target 127.0.0.1:5000 --distribution zipf\n"
+               "  python kv_bench.py --memory --keys 1000000 --value-size 16",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--server", choices=("kv_server", "kv_server_updated"),
+                        default="kv_server_updated", help="server module to start")
+    parser.add_argument("--target", default=None, metavar="HOST:PORT",
+                        help="benchmark an already running server instead")
+    parser.add_argument("--mode", default="threaded",
+                        help="serving mode for kv_server_updated (default: threaded)")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="store segments for kv_server_updated (default: 1)")
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="load-generating processes (default: min(connections, cpus))")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--pipeline", type=int, default=1, help="requests per round trip")
+    parser.add_argument("--read-ratio", type=float, default=0.9, help="share of GETs")
+    parser.add_argument("--distribution", choices=("uniform", "zipf"), default="uniform")
+    parser.add_argument("--zipf-s", type=float, default=1.0, help="Zipf exponent")
+    parser.add_argument("--keys", type=int, default=10000, help="key space size")
+    parser.add_argument("--value-size", type=int, default=64, help="bytes per value")
+    parser.add_argument("--ttl-share", type=float, default=0.0,
+                        help="share of writes sent as PUTEX (kv_server_updated only)")
+    parser.add_argument("--ttl", type=float, default=60.0, help="PUTEX ttl in seconds")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="do not write every key before measuring")
+    parser.add_argument("--memory", action="store_true",
+                        help="instead of a load test, report the server's RSS per key "
+                             "after loading --keys keys (Linux only)")
+    parser.add_argument("--value-cardinality", type=int, default=None, metavar="N",
+                        help="--memory: use N distinct values (default: one per key)")
+    parser.add_argument("--intern-values", action="store_true",
+                        help="start kv_server_updated with value interning")
+    parser.add_argument("--compress-threshold", type=int, default=None, metavar="BYTES",
+                        help="start kv_server_updated compressing values of at least BYTES")
+    parser.add_argument("--output", default=None, help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    if args.memory and (args.target is not None or args.server != "kv_server_updated"):
+        parser.error("--memory starts its own kv_server_updated; drop --target / --server")
+
+    if args.ttl_share and args.server == "kv_server" and args.target is None:
+        parser.error("kv_server does not support PUTEX; use --ttl-share 0")
+    if args.workers is None:
+        args.workers = min(args.connections, multiprocessing.cpu_count())
+    args.workers = max(1, min(args.workers, args.connections))
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    proc = None
+    if args.target is not None:
+        host, _, port = args.target.rpartition(":")
+        args.host, args.port = host, int(port)
+    else:
+        args.host = "127.0.0.1"
+        args.port = free_port(args.host)
+        proc = start_server(args)
+
+    if args.memory:
+        try:
+            result = measure_memory(args, proc)
+        finally:
+            proc.terminate()
+            proc.wait()
+        emit(args, result)
+        return
+
+    try:
+        if not args.no_preload:
+            preload(args)
+
+        queue = multiprocessing.Queue()
+        per_worker = [args.connections // args.workers] * args.workers
+        for i in range(args.connections % args.workers):
+            per_worker[i] += 1
+        started = time.perf_counter()
+        deadline = started + args.duration
+        # perf_counter is system-wide on Linux/macOS/Windows, so child
+        # processes can compare against the same deadline.
+        workers = [
+            multiprocessing.Process(target=run_worker,
+                                    args=(args, i, n, deadline, queue))
+            for i, n in enumerate(per_worker)
+        ]
+        for w in workers:
+            w.start()
+        ops = errors = 0
+        latencies = array("d")
+        for _ in workers:
+            w_ops, w_errors, raw = queue.get()
+            ops += w_ops
+            errors += w_errors
+            latencies.frombytes(raw)
+        elapsed = time.perf_counter() - started
+        for w in workers:
+            w.join()
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+    emit(args, report(args, ops, errors, latencies, elapsed))
+
+
+def emit(args, result: dict):
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,588 @@
+import queue
 import socket
 import sys
+import threading
+from contextlib import contextmanager
+
+
+# Responses whose first line ends with a count of lines that follow
+MULTILINE_FRAMES = ("VALUES ", "KEYS ", "ITEMS ", "ENTRIES ", "PROFILE ")
+
+# Commands that must not run twice; KVClient only resends them on request
+NON_IDEMPOTENT_COMMANDS = frozenset({"INCR", "INCRBY", "DECR", "DECRBY", "APPEND",
+                                     "GETSET", "CAS"})
+
+
+def read_response(reader) -> str | None:
+    """
+    Read one response frame from a binary file-like reader.
+    Most responses are a single line; multi-line frames ("VALUES <n>",
+    "KEYS <cursor> <n>", "ITEMS <n>", "ENTRIES <n>", "PROFILE <n>") are
+    followed by n more lines.
+    Returns None if the server closed the connection.
+    """
+    line = reader.readline()
+    if not line.endswith(b"\n"):
+        return None
+    response = line.decode("utf-8").rstrip("\n")
+    if response.startswith(MULTILINE_FRAMES):
+        lines = [response]
+        for _ in range(int(response.rsplit(" ", 1)[1])):
+            line = reader.readline()
+            if not line.endswith(b"\n"):
+                return None
+            lines.append(line.decode("utf-8").rstrip("\n"))
+        response = "\n".join(lines)
+    return response
+
+
+class KVError(Exception):
+    """
+    The server answered a command with "ERROR <message>".
+    """
+
+
+# ---------- Command builders ----------
+#
+# Each builder returns (request line, parser for its response), shared by
+# KVClient (one round trip per call) and Pipeline (many per round trip).
+
+def _check_token(name: str, token: str):
+    if not token or any(ch.isspace() for ch in token):
+        raise ValueError(f"{name} must be a non-empty string without whitespace: {token!r}")
+
+
+def _check_value(value: str):
+    if "\n" in value or "\r" in value:
+        raise ValueError("values cannot contain newlines in the text protocol")
+
+
+def _raise_error(response: str):
+    if response.startswith("ERROR"):
+        raise KVError(response[6:])
+    raise KVError(f"Unexpected response: {response!r}")
+
+
+def _parse_value(response: str) -> str | None:
+    if response.startswith("VALUE "):
+        return response[6:]
+    if response == "NOT_FOUND":
+        return None
+    _raise_error(response)
+
+
+def _parse_ok(response: str) -> None:
+    if response != "OK":
+        _raise_error(response)
+
+
+def _parse_deleted(response: str) -> bool:
+    if response == "DELETED":
+        return True
+    if response == "NOT_FOUND":
+        return False
+    _raise_error(response)
+
+
+def _parse_count(response: str) -> int:
+    if response.startswith("DELETED "):
+        return int(response[8:])
+    _raise_error(response)
+
+
+def _parse_int(response: str) -> int:
+    if response.startswith("VALUE "):
+        return int(response[6:])
+    _raise_error(response)
+
+
+def _parse_length(response: str) -> int:
+    if response.startswith("LENGTH "):
+        return int(response[7:])
+    _raise_error(response)
+
+
+def _parse_versioned(response: str) -> tuple[str, int] | None:
+    if response.startswith("VALUE "):
+        _tag, version, value = response.split(" ", 2)
+        return value, int(version)
+    if response == "NOT_FOUND":
+        return None
+    _raise_error(response)
+
+
+def _parse_cas(response: str) -> bool:
+    if response == "OK":
+        return True
+    if response in ("EXISTS", "NOT_FOUND"):
+        return False
+    _raise_error(response)
+
+
+def _parse_keys(response: str) -> tuple[str, list[str]]:
+    lines = response.split("\n")
+    if not lines[0].startswith("KEYS "):
+        _raise_error(response)
+    return lines[0].split()[1], lines[1:]
+
+
+def _parse_items(response: str) -> list[tuple[str, str]]:
+    lines = response.split("\n")
+    if not lines[0].startswith("ITEMS "):
+        _raise_error(response)
+    return [tuple(line.split(" ", 1)) for line in lines[1:]]
+
+
+def _parse_values(response: str) -> list:
+    lines = response.split("\n")
+    if not lines[0].startswith("VALUES "):
+        _raise_error(response)
+    return [_parse_value(line) for line in lines[1:]]
+
+
+def _parse_slowlog(response: str) -> list[tuple[int, int, int, str, str]]:
+    lines = response.split("\n")
+    if not lines[0].startswith("ENTRIES "):
+        _raise_error(response)
+    entries = []
+    for line in lines[1:]:
+        entry_id, timestamp, usec, client, command = line.split(" ", 4)
+        entries.append((int(entry_id), int(timestamp), int(usec), client, command))
+    return entries
+
+
+def _parse_profile(response: str) -> list[str]:
+    lines = response.split("\n")
+    if not lines[0].startswith("PROFILE "):
+        _raise_error(response)
+    return lines[1:]
+
+
+def _get(key: str):
+    _check_token("key", key)
+    return f"GET {key}", _parse_value
+
+
+def _put(key: str, value: str):
+    _check_token("key", key)
+    _check_value(value)
+    return f"PUT {key} {value}", _parse_ok
+
+
+def _putex(key: str, ttl: float, value: str):
+    _check_token("key", key)
+    _check_value(value)
+    return f"PUTEX {key} {ttl} {value}", _parse_ok
+
+
+def _delete(key: str):
+    _check_token("key", key)
+    return f"DELETE {key}", _parse_deleted
+
+
+def _mget(keys: list[str]):
+    for key in keys:
+        _check_token("key", key)
+    return "MGET " + " ".join(keys), _parse_values
+
+
+def _incrby(key: str, delta: int, ttl: float | None):
+    _check_token("key", key)
+    line = f"INCRBY {key} {int(delta)}"
+    if ttl is not None:
+        line += f" {ttl}"
+    return line, _parse_int
+
+
+def _append(key: str, value: str):
+    _check_token("key", key)
+    _check_value(value)
+    return f"APPEND {key} {value}", _parse_length
+
+
+def _getset(key: str, value: str):
+    _check_token("key", key)
+    _check_value(value)
+    return f"GETSET {key} {value}", _parse_value
+
+
+def _gets(key: str):
+    _check_token("key", key)
+    return f"GETS {key}", _parse_versioned
+
+
+def _cas(key: str, version: int, value: str):
+    _check_token("key", key)
+    _check_value(value)
+    return f"CAS {key} {int(version)} {value}", _parse_cas
+
+
+def _scan(cursor: str, prefix: str, count: int):
+    line = f"SCAN {cursor} COUNT {int(count)}"
+    if prefix:
+        _check_token("prefix", prefix)
+        line += f" MATCH {prefix}"
+    return line, _parse_keys
+
+
+def _range(low: str, high: str, count: int):
+    _check_token("min", low)
+    _check_token("max", high)
+    return f"RANGE {low} {high} COUNT {int(count)}", _parse_items
+
+
+def _mset(items: dict[str, str]):
+    for key, value in items.items():
+        _check_token("key", key)
+        _check_token("MSET value", value)
+    return "MSET " + " ".join(f"{key} {value}" for key, value in items.items()), _parse_ok
+
+
+def _mdel(keys: list[str]):
+    for key in keys:
+        _check_token("key", key)
+    return "MDEL " + " ".join(keys), _parse_count
+
+
+def _slowlog_get(count: int):
+    return f"SLOWLOG GET {int(count)}", _parse_slowlog
+
+
+def _slowlog_len():
+    return "SLOWLOG LEN", _parse_length
+
+
+def _slowlog_reset():
+    return "SLOWLOG RESET", _parse_ok
+
+
+class _Commands:
+    """
+    Every command in terms of self._call(line, parser).
+    Values travel as text: the server stores the words of a value joined
+    by single spaces.
+    """
+    def get(self, key: str):
+        return self._call(*_get(key))
+
+    def put(self, key: str, value: str):
+        return self._call(*_put(key, value))
+
+    def putex(self, key: str, ttl: float, value: str):
+        return self._call(*_putex(key, ttl, value))
+
+    def delete(self, key: str):
+        return self._call(*_delete(key))
+
+    def mget(self, keys: list[str]):
+        return self._call(*_mget(keys))
+
+    def mset(self, items: dict[str, str]):
+        return self._call(*_mset(items))
+
+    def mdel(self, keys: list[str]):
+        return self._call(*_mdel(keys))
+
+    def incr(self, key: str, delta: int = 1, ttl: float | None = None):
+        """
+        Atomically add delta and return the new value; ttl only applies
+        if the counter is created by this call.
+        """
+        return self._call(*_incrby(key, delta, ttl))
+
+    def decr(self, key: str, delta: int = 1, ttl: float | None = None):
+        return self._call(*_incrby(key, -delta, ttl))
+
+    def append(self, key: str, value: str):
+        return self._call(*_append(key, value))
+
+    def getset(self, key: str, value: str):
+        return self._call(*_getset(key, value))
+
+    def gets(self, key: str):
+        """
+        (value, version) for cas(), or None if the key is missing.
+        """
+        return self._call(*_gets(key))
+
+    def cas(self, key: str, version: int, value: str):
+        """
+        Store value only if key is unchanged since gets(); True if stored.
+        """
+        return self._call(*_cas(key, version, value))
+
+    def scan(self, cursor: str = "0", prefix: str = "", count: int = 100):
+        """
+        One SCAN page: (next cursor, keys); the cursor is "0" when done.
+        """
+        return self._call(*_scan(cursor, prefix, count))
+
+    def range(self, low: str = "-", high: str = "+", count: int = 100):
+        """
+        One RANGE page of (key, value) pairs; bounds as for the RANGE command.
+        """
+        return self._call(*_range(low, high, count))
+
+    def slowlog_get(self, count: int = 10):
+        """
+        Newest slow-log entries: (id, unix time, usec, client, command).
+        """
+        return self._call(*_slowlog_get(count))
+
+    def slowlog_len(self) -> int:
+        return self._call(*_slowlog_len())
+
+    def slowlog_reset(self):
+        return self._call(*_slowlog_reset())
+
+
+def scan_iter(client, prefix: str = "", count: int = 1000):
+    """
+    Yield every key (optionally only those starting with prefix) in sorted
+    order, one SCAN page per round trip. client is a KVClient, KVPool or
+    KVCluster; the cursor is stateless, so pooled connections may change
+    between pages.
+    """
+    cursor = "0"
+    while True:
+        cursor, keys = client.scan(cursor, prefix, count)
+        yield from keys
+        if cursor == "0":
+            return
+
+
+class Pipeline(_Commands):
+    """
+    Queue commands and send them in one write; execute() reads all the
+    replies in order and returns their parsed results.
+
+        with client.pipeline() as pipe:
+            for key in keys:
+                pipe.get(key)
+            values = pipe.execute()
+    """
+    def __init__(self, client: "KVClient"):
+        self._client = client
+        self._queue = []
+
+    def _call(self, line: str, parser):
+        self._queue.append((line, parser))
+        return self
+
+    def __len__(self):
+        return len(self._queue)
+
+    def execute(self) -> list:
+        queue, self._queue = self._queue, []
+        if not queue:
+            return []
+        responses = self._client._roundtrip([line for line, _parser in queue])
+        return [parser(response) for (_line, parser), response in zip(queue, responses)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._queue.clear()
+
+
+class KVClient(_Commands):
+    """
+    Blocking client for the key-value server, for use from code rather
+    than the interactive prompt below.
+
+    Responses are read through a buffered reader. A reused connection
+    that turns out to be dead (sendall fails, or the server hangs up
+    before answering, e.g. because it closed the connection while idle
+    in a pool) is reconnected and the request sent once more. Requests
+    containing NON_IDEMPOTENT_COMMANDS are only resent with
+    retry_non_idempotent=True. Timeouts are never retried, since the
+    server may already have run the request; the connection is dropped
+    and the error raised.
+    A KVClient is not thread-safe; share connections through KVPool.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 5000,
+                 timeout: float | None = None, retry_non_idempotent: bool = False):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.retry_non_idempotent = retry_non_idempotent
+        self._sock = None
+        self._reader = None
+
+    def connect(self):
+        self.close()
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._sock.makefile("rb")
+
+    def close(self):
+        if self._sock is not None:
+            self._reader.close()
+            self._sock.close()
+            self._sock = None
+            self._reader = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def pipeline(self) -> Pipeline:
+        return Pipeline(self)
+
+    def profile_start(self, kind: str = "cpu"):
+        """
+        Start profiling the commands of this connection ("cpu" or "mem").
+        Lost if the connection is re-established.
+        """
+        _check_token("kind", kind)
+        return self._call(f"PROFILE START {kind}", _parse_ok)
+
+    def profile_stop(self, count: int = 20) -> list[str]:
+        """
+        Stop profiling and return the report lines.
+        """
+        return self._call(f"PROFILE STOP {int(count)}", _parse_profile)
+
+    def execute(self, command: str) -> str:
+        """
+        Send a raw command line and return the raw response frame.
+        """
+        return self._roundtrip([command])[0]
+
+    def execute_many(self, commands: list[str]) -> list[str]:
+        """
+        Send raw command lines in one write and return their raw response
+        frames, in order.
+        """
+        return self._roundtrip(commands)
+
+    def _call(self, line: str, parser):
+        return parser(self._roundtrip([line])[0])
+
+    def _roundtrip(self, lines: list[str]) -> list[str]:
+        payload = ("\n".join(lines) + "\n").encode("utf-8")
+        reused = self._sock is not None
+        if not reused:
+            self.connect()
+        try:
+            self._sock.sendall(payload)
+        except ConnectionError:
+            if not reused:
+                self.close()
+                raise
+            first = None  # the pooled connection was already gone
+        except OSError:
+            self.close()
+            raise
+        else:
+            first = self._read_first()
+        if first is None:
+            # Hung up without answering. Only a reused connection can have
+            # gone stale while idle; resend unless running twice matters.
+            if not reused or not self._may_resend(lines):
+                self.close()
+                raise ConnectionError(f"Server {self.host}:{self.port} closed the connection")
+            self.connect()
+            try:
+                self._sock.sendall(payload)
+            except OSError:
+                self.close()
+                raise
+            first = self._read_first()
+            if first is None:
+                self.close()
+                raise ConnectionError(f"Server {self.host}:{self.port} closed the connection")
+
+        responses = [first]
+        try:
+            for _ in range(len(lines) - 1):
+                response = read_response(self._reader)
+                if response is None:
+                    raise ConnectionError(f"Server {self.host}:{self.port} closed the connection")
+                responses.append(response)
+        except OSError:
+            self.close()
+            raise
+        return responses
+
+    def _read_first(self) -> str | None:
+        """
+        Read the first response, or None if the server hung up (EOF or
+        reset) before sending one. Other errors, timeouts in particular,
+        drop the connection and propagate: the request may have run.
+        """
+        try:
+            return read_response(self._reader)
+        except ConnectionError:
+            return None
+        except OSError:
+            self.close()
+            raise
+
+    def _may_resend(self, lines: list[str]) -> bool:
+        if self.retry_non_idempotent:
+            return True
+        return not any(line.split(" ", 1)[0].upper() in NON_IDEMPOTENT_COMMANDS
+                       for line in lines)
+
+
+class KVPool(_Commands):
+    """
+    Thread-safe pool of KVClient connections to one server.
+
+    Connections are opened lazily, up to max_size, and reused; callers
+    block while all of them are in use. Use the get/put/... shortcuts, or
+    hold one connection for several calls (or a pipeline):
+
+        with pool.connection() as client:
+            client.put("a", "1")
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 5000,
+                 max_size: int = 10, timeout: float | None = None,
+                 retry_non_idempotent: bool = False):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.retry_non_idempotent = retry_non_idempotent
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        try:
+            client = self._idle.get_nowait()
+        except queue.Empty:
+            client = KVClient(self.host, self.port, timeout=self.timeout,
+                              retry_non_idempotent=self.retry_non_idempotent)
+        try:
+            yield client
+        except KVError:
+            # A clean error reply; the connection is still in sync
+            self._idle.put(client)
+            raise
+        except BaseException:
+            # The connection may be mid-response; don't hand it out again
+            client.close()
+            raise
+        else:
+            self._idle.put(client)
+        finally:
+            self._slots.release()
+
+    def _call(self, line: str, parser):
+        with self.connection() as client:
+            return client._call(line, parser)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
 
 
 def main(host: str = "127.0.0.1", port: int = 5000):
@@ -10,6 +593,7 @@ def main(host: str = "127.0.0.1", port: int = 5000):
       PUT mykey some value
       GET mykey
       DELETE mykey
+      MGET key1 key2
       QUIT
 
     Press Ctrl+C to exit.
@@ -19,6 +603,7 @@ def main(host: str = "127.0.0.1", port: int = 5000):
             sock.connect((host, port))
             print(f"[CLIENT] Connected to {host}:{port}")
             print("Type commands (PUT/GET/DELETE/QUIT). Ctrl+C to exit.\n")
+            reader = sock.makefile("rb")
 
             while True:
                 try:
@@ -36,15 +621,11 @@ def main(host: str = "127.0.0.1", port: int = 5000):
                 # Ensure newline-terminated command
                 sock.sendall((cmd.strip() + "\n").encode("utf-8"))
 
-                # Read server response (one line)
-                data = b""
-                while not data.endswith(b"\n"):
-                    chunk = sock.recv(4096)
-                    if not chunk:
-                        print("[CLIENT] Server closed the connection.")
-                        return
-                    data += chunk
-                response = data.decode("utf-8").rstrip("\n")
+                # Read server response (one frame)
+                response = read_response(reader)
+                if response is None:
+                    print("[CLIENT] Server closed the connection.")
+                    return
                 print(response)
 
                 if cmd.strip().upper() == "QUIT":
@@ -0,0 +1,259 @@
+import bisect
+import hashlib
+import heapq
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from kv_client import (KVPool, _append, _cas, _delete, _get, _gets, _getset, _incrby,
+                       _mdel, _mget, _mset, _put, _putex, _range, _scan)
+
+
+def _ring_hash(data: str) -> int:
+    """
+    64-bit position on the ring. md5 is used for its uniform spread, not
+    for security; it is also stable across processes, unlike hash().
+    """
+    return int.from_bytes(hashlib.md5(data.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent-hash ring with virtual nodes.
+
+    Every node is placed on the ring at `vnodes` pseudo-random points; a
+    key belongs to the first point at or after its own hash. Adding or
+    removing one of N nodes therefore only moves the keys of the arcs that
+    node gains or loses, about 1/N of them, and many virtual nodes keep
+    the arcs (and so the load) even.
+
+    Lookups are a bisect over a sorted array of points. The arrays are
+    rebuilt and swapped in as one tuple on membership changes, so lookups
+    never take a lock.
+    """
+    def __init__(self, nodes=(), vnodes: int = 160):
+        self.vnodes = vnodes
+        self._nodes = set()
+        self._ring = ((), ())  # (sorted point hashes, owning node per point)
+        self._lock = threading.Lock()  # serializes membership changes
+        for node in nodes:
+            self.add_node(node)
+
+    @property
+    def nodes(self) -> list[str]:
+        return sorted(self._nodes)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def add_node(self, node: str):
+        with self._lock:
+            if node not in self._nodes:
+                self._nodes.add(node)
+                self._rebuild()
+
+    def remove_node(self, node: str):
+        with self._lock:
+            if node in self._nodes:
+                self._nodes.discard(node)
+                self._rebuild()
+
+    def _rebuild(self):
+        points = sorted(
+            (_ring_hash(f"{node}#{i}"), node)
+            for node in self._nodes for i in range(self.vnodes)
+        )
+        self._ring = (tuple(h for h, _node in points), tuple(node for _h, node in points))
+
+    def node_for(self, key: str) -> str:
+        hashes, owners = self._ring
+        if not hashes:
+            raise LookupError("hash ring is empty")
+        index = bisect.bisect_left(hashes, _ring_hash(key))
+        return owners[index if index < len(owners) else 0]
+
+    def group(self, keys) -> dict[str, list[int]]:
+        """
+        Map node -> positions in keys of the keys it owns.
+        """
+        groups = {}
+        for pos, key in enumerate(keys):
+            groups.setdefault(self.node_for(key), []).append(pos)
+        return groups
+
+
+class KVCluster:
+    """
+    Client that shards keys across several key-value servers with a
+    consistent-hash ring (see HashRing).
+
+    Single-key commands go to the key's node over that node's KVPool.
+    mget/mset/mdel are split per node and the per-node requests run in
+    parallel on a thread pool, so a multi-key call costs about one round
+    trip to the slowest node instead of one per node.
+
+        cluster = KVCluster([("127.0.0.1", 5000), ("127.0.0.1", 5001)])
+        cluster.mset({"a": "1", "b": "2"})
+        cluster.mget(["a", "b"])
+
+    add_node/remove_node only change routing; about 1/N of the keys map
+    to a different node afterwards and read as missing until rewritten.
+    """
+    def __init__(self, nodes: list[tuple[str, int]], vnodes: int = 160,
+                 pool_size: int = 10, timeout: float | None = None,
+                 max_workers: int | None = None):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.ring = HashRing(vnodes=vnodes)
+        self._pools = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or 4 * max(1, len(nodes)),
+                                            thread_name_prefix="kv-cluster")
+        for host, port in nodes:
+            self.add_node(host, port)
+
+    def add_node(self, host: str, port: int) -> str:
+        name = f"{host}:{port}"
+        if name not in self._pools:
+            self._pools[name] = KVPool(host, port, max_size=self.pool_size,
+                                       timeout=self.timeout)
+        self.ring.add_node(name)
+        return name
+
+    def remove_node(self, host: str, port: int):
+        name = f"{host}:{port}"
+        self.ring.remove_node(name)
+        pool = self._pools.pop(name, None)
+        if pool is not None:
+            pool.close()
+
+    def node_for(self, key: str) -> str:
+        return self.ring.node_for(key)
+
+    def pool_for(self, key: str) -> KVPool:
+        return self._pools[self.ring.node_for(key)]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for pool in self._pools.values():
+            pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # ---------- Single-key commands ----------
+
+    def get(self, key: str):
+        return self.pool_for(key)._call(*_get(key))
+
+    def put(self, key: str, value: str):
+        return self.pool_for(key)._call(*_put(key, value))
+
+    def putex(self, key: str, ttl: float, value: str):
+        return self.pool_for(key)._call(*_putex(key, ttl, value))
+
+    def delete(self, key: str):
+        return self.pool_for(key)._call(*_delete(key))
+
+    def incr(self, key: str, delta: int = 1, ttl: float | None = None):
+        return self.pool_for(key)._call(*_incrby(key, delta, ttl))
+
+    def decr(self, key: str, delta: int = 1, ttl: float | None = None):
+        return self.pool_for(key)._call(*_incrby(key, -delta, ttl))
+
+    def append(self, key: str, value: str):
+        return self.pool_for(key)._call(*_append(key, value))
+
+    def getset(self, key: str, value: str):
+        return self.pool_for(key)._call(*_getset(key, value))
+
+    def gets(self, key: str):
+        return self.pool_for(key)._call(*_gets(key))
+
+    def cas(self, key: str, version: int, value: str):
+        return self.pool_for(key)._call(*_cas(key, version, value))
+
+    # ---------- Multi-key commands ----------
+
+    def _fan_out(self, requests: dict[str, tuple]) -> dict:
+        """
+        Run {node: (line, parser)} in parallel, one request per node.
+        Returns {node: parsed result}; the first failure is raised.
+        """
+        if len(requests) == 1:
+            (node, request), = requests.items()
+            return {node: self._pools[node]._call(*request)}
+        futures = {node: self._executor.submit(self._pools[node]._call, *request)
+                   for node, request in requests.items()}
+        return {node: future.result() for node, future in futures.items()}
+
+    def mget(self, keys: list[str]) -> list:
+        groups = self.ring.group(keys)
+        results = self._fan_out({node: _mget([keys[pos] for pos in positions])
+                                 for node, positions in groups.items()})
+        values = [None] * len(keys)
+        for node, positions in groups.items():
+            for pos, value in zip(positions, results[node]):
+                values[pos] = value
+        return values
+
+    def mset(self, items: dict[str, str]):
+        keys = list(items)
+        groups = self.ring.group(keys)
+        self._fan_out({node: _mset({keys[pos]: items[keys[pos]] for pos in positions})
+                       for node, positions in groups.items()})
+
+    def scan(self, cursor: str = "0", prefix: str = "", count: int = 100):
+        """
+        One cluster-wide SCAN page: every node returns its next count keys
+        after the cursor and the page is the first count of their merge,
+        so keys come back in global sorted order.
+        """
+        pages = self._fan_out({node: _scan(cursor, prefix, count) for node in self.ring.nodes})
+        keys = list(islice(heapq.merge(*(keys for _cursor, keys in pages.values())), count))
+        return (keys[-1].encode("utf-8").hex() if len(keys) == count else "0"), keys
+
+    def range(self, low: str = "-", high: str = "+", count: int = 100):
+        pages = self._fan_out({node: _range(low, high, count) for node in self.ring.nodes})
+        return list(islice(heapq.merge(*pages.values()), count))
+
+    def mdel(self, keys: list[str]) -> int:
+        groups = self.ring.group(keys)
+        results = self._fan_out({node: _mdel([keys[pos] for pos in positions])
+                                 for node, positions in groups.items()})
+        return sum(results.values())
+
+
+def _demo(nodes: list[tuple[str, int]]):
+    keys = [f"key{i}" for i in range(10000)]
+    with KVCluster(nodes) as cluster:
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            cluster.mset({key: key.upper() for key in batch})
+        values = cluster.mget(keys)
+        print(f"[CLUSTER] Read back {sum(v is not None for v in values)} of {len(keys)} keys")
+        counts = {}
+        for key in keys:
+            node = cluster.node_for(key)
+            counts[node] = counts.get(node, 0) + 1
+        for node, count in sorted(counts.items()):
+            print(f"[CLUSTER] {node}: {count} keys")
+
+    ring = HashRing(f"{host}:{port}" for host, port in nodes)
+    before = {key: ring.node_for(key) for key in keys}
+    ring.add_node("new-node:0")
+    moved = sum(before[key] != ring.node_for(key) for key in keys)
+    print(f"[CLUSTER] Adding a node would move {moved / len(keys):.1%} of keys "
+          f"(ideal {1 / len(ring):.1%})")
+
+
+if __name__ == "__main__":
+    # python kv_cluster.py HOST:PORT [HOST:PORT...]
+    nodes = []
+    for arg in sys.argv[1:] or ["127.0.0.1:5000"]:
+        host, _, port = arg.rpartition(":")
+        nodes.append((host, int(port)))
+    _demo(nodes)
@@ -0,0 +1,309 @@
+import bisect
+import cProfile
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Upper bounds (seconds) of the per-command latency histogram buckets
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.1, float("inf"))
+
+
+class _ThreadCounters:
+    """
+    Counters owned by one thread; only that thread writes them.
+    commands maps command name -> [calls, total_seconds, *bucket_counts].
+    """
+    __slots__ = ("commands", "hits", "misses", "connections_opened",
+                 "connections_closed")
+
+    def __init__(self):
+        self.commands = {}
+        self.hits = 0
+        self.misses = 0
+        self.connections_opened = 0
+        self.connections_closed = 0
+
+
+class ServerMetrics:
+    """
+    Low-overhead command counters and latency histograms.
+
+    Every thread that executes commands gets its own _ThreadCounters and
+    updates it without any lock; snapshot() sums over all threads. A
+    thread that is about to exit folds its counters into a shared total
+    with retire_thread(), so thread-per-connection serving does not
+    accumulate one counter object per past connection.
+    """
+    def __init__(self):
+        self.started = time.time()
+        self._local = threading.local()
+        self._threads = []
+        self._retired = _ThreadCounters()
+        self._lock = threading.Lock()  # guards _threads and _retired
+
+    def _counters(self) -> _ThreadCounters:
+        try:
+            return self._local.counters
+        except AttributeError:
+            counters = self._local.counters = _ThreadCounters()
+            with self._lock:
+                self._threads.append(counters)
+            return counters
+
+    def observe(self, command: str, seconds: float):
+        commands = self._counters().commands
+        entry = commands.get(command)
+        if entry is None:
+            entry = commands[command] = [0, 0.0] + [0] * len(LATENCY_BUCKETS)
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2 + bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def record_lookups(self, hits: int, misses: int):
+        counters = self._counters()
+        counters.hits += hits
+        counters.misses += misses
+
+    def client_connected(self):
+        self._counters().connections_opened += 1
+
+    def client_disconnected(self):
+        self._counters().connections_closed += 1
+
+    def retire_thread(self):
+        counters = getattr(self._local, "counters", None)
+        if counters is None:
+            return
+        del self._local.counters
+        with self._lock:
+            self._threads.remove(counters)
+            _merge_into(self._retired, counters)
+
+    def snapshot(self) -> _ThreadCounters:
+        """
+        Totals over every thread, past and present.
+        """
+        total = _ThreadCounters()
+        with self._lock:
+            _merge_into(total, self._retired)
+            for counters in self._threads:
+                _merge_into(total, counters)
+        return total
+
+    def summary(self, store_stats: dict) -> dict:
+        """
+        Flat name -> value mapping for the STATS command.
+        """
+        totals = self.snapshot()
+        uptime = time.time() - self.started
+        total_commands = sum(entry[0] for entry in totals.commands.values())
+        lookups = totals.hits + totals.misses
+        stats = dict(store_stats)
+        stats.update({
+            "uptime_seconds": round(uptime, 1),
+            "connected_clients": totals.connections_opened - totals.connections_closed,
+            "total_connections": totals.connections_opened,
+            "total_commands": total_commands,
+            "ops_per_sec": round(total_commands / uptime, 1) if uptime else 0.0,
+            "keyspace_hits": totals.hits,
+            "keyspace_misses": totals.misses,
+            "hit_rate": round(totals.hits / lookups, 4) if lookups else 0.0,
+        })
+        for command, entry in sorted(totals.commands.items()):
+            name = command.lower()
+            stats[f"cmd_{name}_calls"] = entry[0]
+            stats[f"cmd_{name}_usec_per_call"] = round(entry[1] / entry[0] * 1e6, 2)
+        return stats
+
+    def prometheus(self, store_stats: dict) -> str:
+        """
+        Render everything in the Prometheus text exposition format.
+        """
+        totals = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{labels} {value}")
+
+        metric("kv_uptime_seconds", "gauge", "Seconds since the server started.",
+               [("", round(time.time() - self.started, 3))])
+        metric("kv_connected_clients", "gauge", "Currently connected clients.",
+               [("", totals.connections_opened - totals.connections_closed)])
+        metric("kv_connections_total", "counter", "Accepted client connections.",
+               [("", totals.connections_opened)])
+        metric("kv_keyspace_hits_total", "counter", "Key lookups that found a value.",
+               [("", totals.hits)])
+        metric("kv_keyspace_misses_total", "counter", "Key lookups that found nothing.",
+               [("", totals.misses)])
+        for name, value in store_stats.items():
+            kind = "counter" if name in ("evictions", "expired_keys") else "gauge"
+            suffix = "_total" if kind == "counter" else ""
+            metric(f"kv_{name}{suffix}", kind, f"Store statistic {name}.", [("", value)])
+
+        commands = sorted(totals.commands.items())
+        metric("kv_commands_total", "counter", "Commands processed.",
+               [(f'{{command="{cmd}"}}', entry[0]) for cmd, entry in commands])
+        lines.append("# HELP kv_command_duration_seconds Command execution time.")
+        lines.append("# TYPE kv_command_duration_seconds histogram")
+        for cmd, entry in commands:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, entry[2:]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'kv_command_duration_seconds_bucket{{command="{cmd}",le="{le}"}} '
+                             f"{cumulative}")
+            lines.append(f'kv_command_duration_seconds_sum{{command="{cmd}"}} {entry[1]}')
+            lines.append(f'kv_command_duration_seconds_count{{command="{cmd}"}} {entry[0]}')
+        return "\n".join(lines) + "\n"
+
+
+class SlowLog:
+    """
+    Ring buffer of the most recent commands that took at least threshold
+    seconds (None disables it). Callers compare against self.threshold
+    themselves, so a fast command costs one float comparison and the
+    lock is only taken for slow ones.
+    """
+    MAX_ARGS = 32  # arguments kept per entry
+    MAX_ARG_LEN = 128  # characters kept per argument
+
+    def __init__(self, threshold: float | None = 0.01, max_len: int = 128):
+        self.threshold = float("inf") if threshold is None else threshold
+        self._entries = deque(maxlen=max_len)
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def record(self, args: list[str], seconds: float, addr=None):
+        if len(args) > self.MAX_ARGS:
+            args = args[:self.MAX_ARGS - 1] + [f"...({len(args) - self.MAX_ARGS + 1} more)"]
+        args = [arg if len(arg) <= self.MAX_ARG_LEN else arg[:self.MAX_ARG_LEN] + "..."
+                for arg in args]
+        client = f"{addr[0]}:{addr[1]}" if addr else "-"
+        with self._lock:
+            self._entries.append((self._next_id, time.time(), seconds, client, args))
+            self._next_id += 1
+
+    def get(self, count: int = 10) -> list[tuple]:
+        """
+        Up to count (id, timestamp, seconds, client, args) entries, newest first.
+        """
+        with self._lock:
+            return [self._entries[-1 - i] for i in range(min(count, len(self._entries)))]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class ConnectionProfile:
+    """
+    On-demand profile of one client connection (PROFILE START / STOP).
+
+    "cpu" runs a cProfile.Profile that the server resumes only while it
+    executes this connection's requests. "mem" uses tracemalloc, which is
+    process-wide: STOP reports the top allocation growth since START,
+    whichever connection caused it. Tracing is started by the first open
+    mem profile (unless it is already on) and stopped with the last one.
+    """
+    KINDS = ("cpu", "mem")
+    _mem_sessions = 0
+    _started_tracing = False
+    _mem_lock = threading.Lock()
+
+    def __init__(self, kind: str):
+        if kind not in self.KINDS:
+            raise ValueError(f"kind must be one of {self.KINDS}, got {kind!r}")
+        self.kind = kind
+        self.started = time.time()
+        self._profiler = None
+        self._baseline = None
+        if kind == "cpu":
+            self._profiler = cProfile.Profile()
+        else:
+            with ConnectionProfile._mem_lock:
+                if ConnectionProfile._mem_sessions == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    ConnectionProfile._started_tracing = True
+                ConnectionProfile._mem_sessions += 1
+            self._baseline = tracemalloc.take_snapshot()
+
+    def resume(self):
+        if self._profiler is not None:
+            self._profiler.enable()
+
+    def pause(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+
+    def stop(self, limit: int = 20) -> list[str]:
+        """
+        End the profile and return its report as lines of text.
+        """
+        if self._profiler is not None:
+            self._profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+            return [line.rstrip() for line in out.getvalue().splitlines() if line.strip()]
+
+        snapshot = tracemalloc.take_snapshot()
+        with ConnectionProfile._mem_lock:
+            ConnectionProfile._mem_sessions -= 1
+            if ConnectionProfile._mem_sessions == 0 and ConnectionProfile._started_tracing:
+                ConnectionProfile._started_tracing = False
+                tracemalloc.stop()
+        diff = snapshot.compare_to(self._baseline, "lineno")
+        return [str(stat) for stat in diff[:limit]]
+
+
+def _merge_into(total: _ThreadCounters, counters: _ThreadCounters):
+    total.hits += counters.hits
+    total.misses += counters.misses
+    total.connections_opened += counters.connections_opened
+    total.connections_closed += counters.connections_closed
+    # dict.copy() is atomic under the GIL, so the owner thread may keep
+    # inserting while we read
+    for command, entry in counters.commands.copy().items():
+        entry = list(entry)
+        existing = total.commands.get(command)
+        if existing is None:
+            total.commands[command] = entry
+        else:
+            for i, value in enumerate(entry):
+                existing[i] += value
+
+
+def start_metrics_http_server(host: str, port: int, render) -> ThreadingHTTPServer:
+    """
+    Serve render() as text at http://host:port/metrics from a daemon thread.
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # scrapes are too frequent to log
+
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+import argparse
+import heapq
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import threading
+import time
+import zlib
+from itertools import islice
+
+import kv_server_updated as kv
+from kv_client import KVPool
+
+
+FORWARDED_OPS = frozenset({kv.OP_GET, kv.OP_PUT, kv.OP_PUTEX, kv.OP_DELETE})
+
+
+def partition_for(key: str, partitions: int) -> int:
+    """
+    Stable key -> partition mapping, identical in every process (unlike
+    hash(), which is salted per interpreter).
+    """
+    return zlib.crc32(key.encode("utf-8")) % partitions
+
+
+class _BinaryPeerPool:
+    """
+    Pool of binary-protocol connections to one peer, for forwarding
+    binary frames whose key lives on that peer.
+    """
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._idle = queue.LifoQueue()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = sock.makefile("rb")
+        sock.sendall(b"BINARY\n")
+        if reader.readline() != b"OK BINARY\n":
+            sock.close()
+            raise ConnectionError(f"{self.host}:{self.port} refused binary mode")
+        return sock, reader
+
+    def forward(self, frames: list[bytes]) -> list[bytes]:
+        """
+        Send request frames in one write and return the complete response
+        frames, in order.
+        """
+        try:
+            sock, reader = self._idle.get_nowait()
+        except queue.Empty:
+            sock, reader = self._connect()
+        responses = []
+        try:
+            sock.sendall(b"".join(frames))
+            for _ in frames:
+                header = reader.read(kv.BIN_RESPONSE_HEADER.size)
+                _status, length = kv.BIN_RESPONSE_HEADER.unpack(header)
+                responses.append(header + reader.read(length))
+        except (OSError, ValueError, kv.struct.error):
+            sock.close()
+            raise ConnectionError(f"lost connection to {self.host}:{self.port}")
+        self._idle.put((sock, reader))
+        return responses
+
+
+class PartitionedKeyValueServer(kv.KeyValueServer):
+    """
+    Front end of one worker process in a multi-process deployment.
+
+    Every worker accepts on the shared public port (SO_REUSEPORT, so the
+    kernel spreads connections across workers) and owns one partition of
+    the keyspace. Commands on owned keys run locally; others are forwarded
+    over pooled connections to the owning worker's private shard port.
+    Multi-key commands are split per owner and their results merged.
+    Pipelined requests for another worker are forwarded as one batch per
+    owner rather than one round trip each.
+
+    The front end always runs in threaded mode, since forwarding blocks.
+    """
+    SINGLE_KEY_COMMANDS = frozenset({"PUT", "PUTEX", "GET", "DELETE", "INCR", "INCRBY",
+                                     "DECR", "DECRBY", "APPEND", "GETSET", "GETS", "CAS"})
+
+    def __init__(self, index: int, peer_addrs: list[tuple[str, int]], **kwargs):
+        kwargs["mode"] = "threaded"
+        super().__init__(**kwargs)
+        self.index = index
+        self.partitions = len(peer_addrs)
+        self._pools = [None if i == index else KVPool(host, port, max_size=32)
+                       for i, (host, port) in enumerate(peer_addrs)]
+        self._binary_pools = [None if i == index else _BinaryPeerPool(host, port)
+                              for i, (host, port) in enumerate(peer_addrs)]
+
+    def _forward(self, owner: int, line: str) -> str:
+        try:
+            with self._pools[owner].connection() as client:
+                return client.execute(line)
+        except OSError:
+            return f"ERROR Shard {owner} unavailable"
+
+    def _execute_command(self, cmd: str, parts: list[str]) -> str:
+        if cmd in self.SINGLE_KEY_COMMANDS and len(parts) >= 2:
+            owner = partition_for(parts[1], self.partitions)
+            if owner != self.index:
+                return self._forward(owner, " ".join(parts))
+        elif cmd in ("MGET", "MDEL") and len(parts) >= 2:
+            return self._split_keys(cmd, parts[1:])
+        elif cmd == "MSET" and len(parts) >= 3 and len(parts) % 2 == 1:
+            return self._split_pairs(parts[1:])
+        elif cmd in ("SCAN", "RANGE"):
+            return self._merge_pages(cmd, parts)
+        return super()._execute_command(cmd, parts)
+
+    def _tracking_command(self, parts: list[str], state) -> str:
+        # Writes forwarded to other workers never reach this process's
+        # tracker, so invalidations would be missed.
+        return "ERROR TRACKING is not supported on the shared port; use a shard port"
+
+    def _group_by_owner(self, keys: list[str]) -> dict:
+        groups = {}
+        for pos, key in enumerate(keys):
+            groups.setdefault(partition_for(key, self.partitions), []).append(pos)
+        return groups
+
+    def _run_on(self, owner: int, cmd: str, args: list[str]) -> str:
+        if owner == self.index:
+            return super()._execute_command(cmd, [cmd] + args)
+        return self._forward(owner, " ".join([cmd] + args))
+
+    def _split_keys(self, cmd: str, keys: list[str]) -> str:
+        if cmd == "MGET":
+            lines = [None] * len(keys)
+            for owner, positions in self._group_by_owner(keys).items():
+                response = self._run_on(owner, cmd, [keys[pos] for pos in positions])
+                if response.startswith("ERROR"):
+                    return response
+                for pos, line in zip(positions, response.split("\n")[1:]):
+                    lines[pos] = line
+            return "\n".join([f"VALUES {len(keys)}"] + lines)
+
+        deleted = 0
+        for owner, positions in self._group_by_owner(keys).items():
+            response = self._run_on(owner, cmd, [keys[pos] for pos in positions])
+            if response.startswith("ERROR"):
+                return response
+            deleted += int(response.split()[1])
+        return f"DELETED {deleted}"
+
+    def _merge_pages(self, cmd: str, parts: list[str]) -> str:
+        """
+        Run SCAN / RANGE on every partition and merge the pages in key
+        order. Each partition returns at most COUNT entries past the
+        cursor, so the first COUNT of the merge is the global page.
+        """
+        local = super()._execute_command(cmd, parts)
+        if local.startswith("ERROR"):
+            return local  # bad arguments; the peers would say the same
+        # Options follow the cursor (SCAN) or the bounds (RANGE); the local
+        # run has already validated them
+        first = 2 if cmd == "SCAN" else 3
+        count = self.DEFAULT_PAGE_COUNT
+        for option, value in zip(parts[first::2], parts[first + 1::2]):
+            if option.upper() == "COUNT":
+                count = self._page_count(value)
+        pages = [local.split("\n")[1:]]
+        line = " ".join(parts)
+        for owner in range(self.partitions):
+            if owner != self.index:
+                response = self._forward(owner, line)
+                if response.startswith("ERROR"):
+                    return response
+                pages.append(response.split("\n")[1:])
+        if cmd == "SCAN":
+            keys = list(islice(heapq.merge(*pages), count))
+            cursor = keys[-1].encode("utf-8").hex() if len(keys) == count else "0"
+            return "\n".join([f"KEYS {cursor} {len(keys)}"] + keys)
+        items = list(islice(heapq.merge(*pages, key=lambda item: item.split(" ", 1)[0]), count))
+        return "\n".join([f"ITEMS {len(items)}"] + items)
+
+    def _split_pairs(self, args: list[str]) -> str:
+        keys = args[0::2]
+        for owner, positions in self._group_by_owner(keys).items():
+            pairs = []
+            for pos in positions:
+                pairs += args[2 * pos:2 * pos + 2]
+            response = self._run_on(owner, "MSET", pairs)
+            if response != "OK":
+                return response
+        return "OK"
+
+    def _dispatch_binary(self, op: int, key: str, value: memoryview, out: bytearray):
+        owner = partition_for(key, self.partitions)
+        if op not in FORWARDED_OPS or owner == self.index:
+            super()._dispatch_binary(op, key, value, out)
+            return
+        try:
+            out += self._binary_pools[owner].forward([self._frame(op, key, value)])[0]
+        except OSError:
+            self._binary_error(out, f"Shard {owner} unavailable")
+
+    @staticmethod
+    def _frame(op: int, key: str, value: memoryview) -> bytes:
+        key_bytes = key.encode("utf-8")
+        return (kv.BIN_REQUEST_HEADER.pack(op, 0, len(key_bytes), len(value))
+                + key_bytes + bytes(value))
+
+    # ---------- Pipelined forwarding ----------
+
+    def _execute_lines(self, lines: list[str], state, out: bytearray):
+        """
+        Commands on other workers' keys are held back and sent per owner
+        in one batch. Commands on local keys run in between (they touch
+        different keys); anything else first flushes the batches, so
+        e.g. an MGET sees every write sent before it.
+        """
+        if self.partitions == 1:
+            super()._execute_lines(lines, state, out)
+            return
+        responses = [None] * len(lines)
+        batches = {}  # owner -> positions in lines
+        for pos, line in enumerate(lines):
+            parts = line.split()
+            cmd = parts[0].upper()
+            if cmd in self.SINGLE_KEY_COMMANDS and len(parts) >= 2:
+                owner = partition_for(parts[1], self.partitions)
+                if owner != self.index:
+                    batches.setdefault(owner, []).append(pos)
+                    continue
+            elif batches:
+                self._forward_lines(batches, lines, responses, state)
+            responses[pos] = self.process_command(line, state)
+        if batches:
+            self._forward_lines(batches, lines, responses, state)
+        for response in responses:
+            out += response.encode("utf-8")
+            out += b"\n"
+
+    def _forward_lines(self, batches: dict, lines: list[str], responses: list, state):
+        for owner, positions in batches.items():
+            started = time.perf_counter()
+            try:
+                with self._pools[owner].connection() as client:
+                    replies = client.execute_many([lines[pos] for pos in positions])
+            except OSError:
+                replies = [f"ERROR Shard {owner} unavailable"] * len(positions)
+            elapsed = time.perf_counter() - started
+            for pos, reply in zip(positions, replies):
+                responses[pos] = reply
+                self._observe(lines[pos].split(), elapsed, state.addr)
+        batches.clear()
+
+    def _execute_frames(self, frames: list, out: bytearray, addr=None):
+        results = [None] * len(frames)
+        batches = {}  # owner -> positions in frames
+        for pos, (op, key, value) in enumerate(frames):
+            owner = partition_for(key, self.partitions)
+            if op in FORWARDED_OPS and owner != self.index:
+                batches.setdefault(owner, []).append(pos)
+                continue
+            result = results[pos] = bytearray()
+            self._execute_binary(op, key, value, result, addr)
+        for owner, positions in batches.items():
+            started = time.perf_counter()
+            try:
+                replies = self._binary_pools[owner].forward(
+                    [self._frame(*frames[pos]) for pos in positions])
+            except OSError:
+                replies = [bytearray() for _ in positions]
+                for reply in replies:
+                    self._binary_error(reply, f"Shard {owner} unavailable")
+            elapsed = time.perf_counter() - started
+            for pos, reply in zip(positions, replies):
+                results[pos] = reply
+                op, key, _value = frames[pos]
+                self._observe([kv.BIN_OP_NAMES[op], key], elapsed, addr)
+        for result in results:
+            out += result
+
+    def _observe(self, parts: list[str], elapsed: float, addr):
+        """
+        Metrics and slow log for a forwarded request; elapsed covers its
+        whole batch.
+        """
+        self.metrics.observe(parts[0].upper(), elapsed)
+        if elapsed >= self.slowlog.threshold:
+            self.slowlog.record(parts, elapsed, addr)
+
+
+def run_worker(index: int, workers: int, host: str, port: int, server_options: dict):
+    """
+    Worker process: a private shard server on port + 1 + index that owns
+    the partition's store, plus the partitioned front end on the shared
+    public port.
+    """
+    # The launcher handles Ctrl+C and terminates the workers; SIGTERM then
+    # unwinds front.start() like Ctrl+C, so both servers shut down cleanly
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    options = dict(server_options)
+    for name in ("aof_path", "snapshot_path"):
+        if options.get(name):
+            options[name] = f"{options[name]}.{index}"
+
+    shard_server = kv.KeyValueServer(host=host, port=port + 1 + index, **options)
+    shard_thread = threading.Thread(target=shard_server.start)
+    shard_thread.start()
+
+    try:
+        peers = [(host, port + 1 + i) for i in range(workers)]
+        front = PartitionedKeyValueServer(index, peers, host=host, port=port,
+                                          reuse_port=True, store=shard_server.store)
+        front.start()
+    except KeyboardInterrupt:
+        pass  # terminated before the front end was up
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        # Flushes and closes the shard's append-only log
+        shard_server.stop()
+        shard_thread.join()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run N key-value server processes sharing one port. Each worker "
+                    "owns a hash partition of the keyspace and also serves it directly "
+                    "on PORT+1+i; the shared port forwards to the owner as needed.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--mode", choices=kv.KeyValueServer.MODES, default="threaded",
+                        help="front end of the per-worker shard ports (default: threaded)")
+    parser.add_argument("--max-keys", type=int, default=None, help="per worker")
+    parser.add_argument("--max-memory", type=int, default=None, help="per worker")
+    parser.add_argument("--eviction-policy", choices=sorted(kv.EVICTION_POLICIES),
+                        default="lru")
+    parser.add_argument("--intern-values", action="store_true")
+    parser.add_argument("--compress-threshold", type=int, default=None, metavar="BYTES")
+    parser.add_argument("--aof", default=None, metavar="PATH",
+                        help="per-worker append-only logs PATH.<i>")
+    parser.add_argument("--snapshot", default=None, metavar="PATH",
+                        help="per-worker snapshots PATH.<i>")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise SystemExit("SO_REUSEPORT is not available on this platform")
+    server_options = {
+        "mode": args.mode,
+        "max_keys": args.max_keys,
+        "max_memory": args.max_memory,
+        "eviction_policy": args.eviction_policy,
+        "intern_values": args.intern_values,
+        "compress_threshold": args.compress_threshold,
+        "aof_path": args.aof,
+        "snapshot_path": args.snapshot,
+    }
+    processes = [
+        multiprocessing.Process(
+            target=run_worker,
+            args=(i, args.workers, args.host, args.port, server_options),
+            daemon=True,
+        )
+        for i in range(args.workers)
+    ]
+    for p in processes:
+        p.start()
+    # Shut the workers down on SIGTERM too, not just Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f"[LAUNCHER] {args.workers} workers on {args.host}:{args.port} "
+          f"(shard ports {args.port + 1}-{args.port + args.workers})")
+    try:
+        for p in processes:
+            p.join()
+    except KeyboardInterrupt:
+        print("\n[LAUNCHER] Shutting down workers...")
+        for p in processes:
+            p.terminate()
+        for p in processes:
+            p.join()
+
+
+if __name__ == "__main__":
+    main()
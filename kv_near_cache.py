@@ -0,0 +1,258 @@
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+from kv_client import KVPool, _Commands, _get, _mget
+
+
+class _LocalCache:
+    """
+    Bounded LRU of key -> (value, deadline), None values included (a
+    cached miss), plus tokens for reads in flight.
+
+    A read registers a token with begin() before its request is sent;
+    invalidate() and clear() revoke it, and finish() only caches the
+    response while the token is still current. An INVALIDATE that
+    overtakes the response it refers to therefore cannot leave a stale
+    entry behind.
+    """
+    def __init__(self, max_entries: int, ttl: float | None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._fetching = {}  # key -> token of the newest read in flight
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, key: str) -> tuple[bool, str | None]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, deadline = entry
+                if deadline is None or deadline > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def begin(self, key: str) -> object:
+        token = object()
+        with self._lock:
+            self._fetching[key] = token
+        return token
+
+    def finish(self, key: str, token: object, value: str | None, cache: bool):
+        """
+        End a read; cache value if cache is set and nothing revoked token.
+        """
+        with self._lock:
+            if self._fetching.get(key) is not token:
+                return
+            del self._fetching[key]
+            if not cache:
+                return
+            deadline = None if self.ttl is None else time.monotonic() + self.ttl
+            self._entries[key] = (value, deadline)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._fetching.pop(key, None)
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._fetching.clear()
+            self._entries.clear()
+
+
+class NearCacheClient(_Commands):
+    """
+    KVPool with an in-process read cache that the server keeps coherent.
+
+    get/mget are answered locally when possible. Misses are read with
+    "TRACKING ON REDIRECT <id>" in front, so the server announces the next
+    change of each key on this client's invalidation channel (see
+    kv_tracking) and a background thread drops the entry. Writes made
+    through this client drop their keys locally as well, so a thread
+    always reads its own writes.
+
+    Entries also expire after ttl seconds, which bounds staleness for
+    keys that expire on the server (expiry is not announced). While the
+    invalidation channel is down nothing is cached, and the cache is
+    emptied whenever the channel is lost or re-established.
+
+        with NearCacheClient("127.0.0.1", 5000, max_entries=10000, ttl=30) as client:
+            client.get("config:flags")  # round trip
+            client.get("config:flags")  # local until the key changes
+
+    Only meant for a single KeyValueServer (or one shard port); the
+    multi-process shared port rejects TRACKING.
+    """
+    # Single-key writes; MSET and MDEL are handled separately
+    WRITE_COMMANDS = frozenset({"PUT", "PUTEX", "DELETE", "INCRBY", "APPEND",
+                                "GETSET", "CAS"})
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 5000,
+                 max_entries: int = 10000, ttl: float | None = 60.0,
+                 pool_size: int = 10, timeout: float | None = None,
+                 retry_interval: float = 1.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.pool = KVPool(host, port, max_size=pool_size, timeout=timeout)
+        self._cache = _LocalCache(max_entries, ttl)
+        self._channel_id = None  # set while the invalidation channel is up
+        self._channel_sock = None
+        self._closed = threading.Event()
+        self._first_attempt = threading.Event()
+        self._thread = threading.Thread(target=self._channel_loop, daemon=True)
+        self._thread.start()
+        self._first_attempt.wait()
+
+    def close(self):
+        self._closed.set()
+        sock = self._channel_sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def stats(self) -> dict:
+        cache = self._cache
+        return {
+            "entries": len(cache),
+            "hits": cache.hits,
+            "misses": cache.misses,
+            "invalidations": cache.invalidations,
+            "channel_up": self._channel_id is not None,
+        }
+
+    # ---------- Invalidation channel ----------
+
+    def _channel_loop(self):
+        while not self._closed.is_set():
+            try:
+                with socket.create_connection((self.host, self.port),
+                                              timeout=self.timeout) as sock:
+                    self._channel_sock = sock
+                    self._run_channel(sock)
+            except (OSError, ValueError):
+                pass
+            finally:
+                # Drop the id first, so reads finishing now cannot cache
+                self._channel_id = None
+                self._channel_sock = None
+                self._cache.clear()
+                self._first_attempt.set()
+            self._closed.wait(self.retry_interval)
+
+    def _run_channel(self, sock: socket.socket):
+        reader = sock.makefile("rb")
+        sock.sendall(b"INVALIDATIONS\n")
+        line = reader.readline()
+        if not line.startswith(b"OK INVALIDATIONS "):
+            raise ValueError(f"server refused INVALIDATIONS: {line!r}")
+        sock.settimeout(None)  # idle channels are normal
+        self._cache.clear()
+        self._channel_id = int(line.split()[2])
+        self._first_attempt.set()
+        for line in reader:
+            if line.startswith(b"INVALIDATE "):
+                self._cache.invalidate(line[11:].rstrip(b"\n").decode("utf-8"))
+        # EOF: the server went away; the caller clears the cache
+
+    # ---------- Cached reads ----------
+
+    def get(self, key: str):
+        found, value = self._cache.lookup(key)
+        if found:
+            return value
+        return self._tracked_read([key], *_get(key))[0]
+
+    def mget(self, keys: list[str]) -> list:
+        values = [None] * len(keys)
+        missing = {}  # key -> positions in keys
+        for pos, key in enumerate(keys):
+            found, value = self._cache.lookup(key)
+            if found:
+                values[pos] = value
+            else:
+                missing.setdefault(key, []).append(pos)
+        if missing:
+            fetch = list(missing)
+            for key, value in zip(fetch, self._tracked_read(fetch, *_mget(fetch))):
+                for pos in missing[key]:
+                    values[pos] = value
+        return values
+
+    def _tracked_read(self, keys: list[str], line: str, parser) -> list:
+        """
+        Run a GET/MGET line for keys with tracking on, cache the results
+        and return them as a list.
+        """
+        channel_id = self._channel_id
+        if channel_id is None:
+            result = self.pool._call(line, parser)
+            return result if isinstance(result, list) else [result]
+        tokens = [self._cache.begin(key) for key in keys]
+        cached = False
+        try:
+            with self.pool.connection() as client:
+                tracking, response = client._roundtrip(
+                    [f"TRACKING ON REDIRECT {channel_id}", line])
+            result = parser(response)
+            values = result if isinstance(result, list) else [result]
+            # A new channel would not announce changes to these keys
+            cached = tracking == "OK" and self._channel_id == channel_id
+        except BaseException:
+            values = [None] * len(keys)
+            raise
+        finally:
+            for key, token, value in zip(keys, tokens, values):
+                self._cache.finish(key, token, value, cached)
+        return values
+
+    # ---------- Everything else ----------
+
+    def _call(self, line: str, parser):
+        keys = self._written_keys(line)
+        for key in keys:
+            self._cache.invalidate(key)
+        try:
+            return self.pool._call(line, parser)
+        finally:
+            # Also drop whatever another thread cached meanwhile; the
+            # server's INVALIDATE for it may still be on the way
+            for key in keys:
+                self._cache.invalidate(key)
+
+    def _written_keys(self, line: str) -> list[str]:
+        cmd, _, args = line.partition(" ")
+        if cmd in self.WRITE_COMMANDS:
+            return [args.split(" ", 1)[0]]
+        if cmd == "MSET":
+            return args.split(" ")[0::2]
+        if cmd == "MDEL":
+            return args.split(" ")
+        return []
@@ -0,0 +1,266 @@
+import mmap
+import os
+import shutil
+import struct
+import threading
+import time
+
+
+# ---------- Mutation record format ----------
+#
+# Every mutation is one self-delimiting record:
+#
+#   op (u8) | flags (u8) | expiry (f64) | key_len (u32) | value_len (u32) | key | value
+#
+# Big-endian. expiry is an absolute Unix timestamp, 0.0 for "no expiry".
+# flags is reserved (always 0 for now).
+
+RECORD_HEADER = struct.Struct("!BBdII")
+
+REC_PUT = 1
+REC_PUTEX = 2
+REC_DELETE = 3
+
+
+def encode_put(key: str, value: bytes, expiry: float | None) -> bytes:
+    key_bytes = key.encode("utf-8")
+    if expiry is None:
+        header = RECORD_HEADER.pack(REC_PUT, 0, 0.0, len(key_bytes), len(value))
+    else:
+        header = RECORD_HEADER.pack(REC_PUTEX, 0, expiry, len(key_bytes), len(value))
+    return header + key_bytes + value
+
+
+def encode_delete(key: str) -> bytes:
+    key_bytes = key.encode("utf-8")
+    return RECORD_HEADER.pack(REC_DELETE, 0, 0.0, len(key_bytes), 0) + key_bytes
+
+
+def iter_records(data, offset: int = 0):
+    """
+    Decode records from bytes or an mmap starting at offset.
+    Yields (op, key, value, expiry, end_offset); expiry is None for keys
+    without a TTL. Stops quietly at a truncated trailing record.
+    """
+    unpack_from = RECORD_HEADER.unpack_from
+    header_size = RECORD_HEADER.size
+    end = len(data)
+    while end - offset >= header_size:
+        op, _flags, expiry, key_len, value_len = unpack_from(data, offset)
+        key_start = offset + header_size
+        value_start = key_start + key_len
+        record_end = value_start + value_len
+        if record_end > end:
+            return
+        yield (op, data[key_start:value_start].decode("utf-8"),
+               data[value_start:record_end],
+               expiry if op == REC_PUTEX else None, record_end)
+        offset = record_end
+
+
+def apply_records(store, data, offset: int = 0) -> tuple[int, int]:
+    """
+    Apply encoded records to store, dropping keys whose expiry has passed.
+    Writes are handed to store.restore_many in batches so loading does
+    not pay one lock round trip per key.
+    Returns (records applied, offset just past the last complete record).
+    """
+    now = time.time()
+    count = 0
+    batch = []
+    for op, key, value, expiry, offset in iter_records(data, offset):
+        count += 1
+        if op == REC_DELETE or (expiry is not None and expiry <= now):
+            if batch:
+                store.restore_many(batch)
+                batch = []
+            store.delete(key)
+        else:
+            batch.append((key, value, expiry))
+            if len(batch) >= 1000:
+                store.restore_many(batch)
+                batch = []
+    if batch:
+        store.restore_many(batch)
+    return count, offset
+
+
+# ---------- Append-only log ----------
+
+class AppendOnlyLog:
+    """
+    Append-only log of store mutations (PUT, PUTEX with absolute expiry,
+    DELETE), attached to a store with store.add_listener(log).
+
+    fsync policy:
+      - "always":   write + fsync before the mutation returns
+      - "everysec": group commit; records are buffered and a background
+                    thread writes and fsyncs them every fsync_interval_ms
+      - "no":       same buffering, but the background thread only writes;
+                    the OS decides when data reaches disk
+    """
+    FSYNC_POLICIES = ("always", "everysec", "no")
+
+    def __init__(self, path: str, fsync: str = "everysec",
+                 fsync_interval_ms: int = 1000):
+        if fsync not in self.FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {self.FSYNC_POLICIES}, got {fsync!r}")
+        self.path = path
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval_ms / 1000.0
+        self._file = open(path, "ab")
+        self._lock = threading.Lock()  # guards _pending; held by appenders
+        self._flush_lock = threading.Lock()  # serializes file writes
+        self._pending = bytearray()
+        self._closed = threading.Event()
+        self._flusher = None
+        if fsync != "always":
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    @staticmethod
+    def replay(path: str, store) -> int:
+        """
+        Load a log written by AppendOnlyLog into store, skipping entries that
+        have expired since. Records moved aside by an interrupted rewrite
+        (path + ".old") are replayed first. A torn trailing record (crash
+        mid-write) is cut off so new appends start on a record boundary.
+        Returns the number of records read.
+        """
+        count = 0
+        for log_path in (path + ".old", path):
+            if not os.path.exists(log_path):
+                continue
+            with open(log_path, "rb") as f:
+                data = f.read()
+            applied, good_end = apply_records(store, data)
+            count += applied
+            if good_end < len(data):
+                with open(log_path, "r+b") as f:
+                    f.truncate(good_end)
+        return count
+
+    def rotate(self) -> str:
+        """
+        Move everything logged so far to path + ".old" and continue in an
+        empty log. Used by snapshot compaction: once a snapshot taken after
+        the rotation is durable, the ".old" file can be deleted.
+        Returns the ".old" path.
+        """
+        old_path = self.path + ".old"
+        with self._flush_lock, self._lock:
+            self._file.write(self._pending)
+            self._pending.clear()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            if os.path.exists(old_path):
+                # A previous rewrite did not finish; keep its records too
+                with open(old_path, "ab") as dst, open(self.path, "rb") as src:
+                    shutil.copyfileobj(src, dst)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, old_path)
+            self._file = open(self.path, "ab")
+        return old_path
+
+    def record_put(self, key: str, value: bytes, expiry: float | None):
+        if self.fsync == "always":
+            self._append(encode_put(key, value, expiry))
+            return
+        # Hot path for buffered policies: pack straight into the buffer
+        key_bytes = key.encode("utf-8")
+        if expiry is None:
+            header = RECORD_HEADER.pack(REC_PUT, 0, 0.0, len(key_bytes), len(value))
+        else:
+            header = RECORD_HEADER.pack(REC_PUTEX, 0, expiry, len(key_bytes), len(value))
+        with self._lock:
+            pending = self._pending
+            pending += header
+            pending += key_bytes
+            pending += value
+
+    def record_delete(self, key: str):
+        self._append(encode_delete(key))
+
+    def _append(self, record: bytes):
+        with self._lock:
+            if self.fsync == "always":
+                self._file.write(record)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            else:
+                self._pending += record
+
+    def flush(self):
+        """
+        Write out buffered records (and fsync, unless the policy is "no").
+        The buffer is swapped out under the append lock, so the write and
+        fsync themselves never block writers.
+        """
+        with self._flush_lock:
+            with self._lock:
+                data, self._pending = self._pending, bytearray()
+            if data:
+                self._file.write(data)
+                self._file.flush()
+                if self.fsync != "no":
+                    os.fsync(self._file.fileno())
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.fsync_interval):
+            self.flush()
+
+    def close(self):
+        self._closed.set()
+        self.flush()
+        with self._flush_lock, self._lock:
+            self._file.close()
+
+
+# ---------- Snapshots ----------
+#
+# A snapshot is SNAPSHOT_MAGIC followed by PUT/PUTEX records in the same
+# format as the log, one per live key.
+
+SNAPSHOT_MAGIC = b"KVSNAP1\n"
+
+
+def write_snapshot(store, path: str, chunk_size: int = 1000) -> int:
+    """
+    Dump store to path without blocking it for the whole dump: keys are
+    copied chunk_size at a time via store.iter_chunks, which releases the
+    store lock between chunks. Written to a temp file, fsynced and renamed
+    into place, so a crash never leaves a half-written snapshot.
+    Returns the number of keys written.
+    """
+    tmp_path = path + ".tmp"
+    count = 0
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        for chunk in store.iter_chunks(chunk_size):
+            f.write(b"".join(encode_put(key, value, expiry)
+                             for key, value, expiry in chunk))
+            count += len(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return count
+
+
+def load_snapshot(path: str, store) -> int:
+    """
+    Load a snapshot into store through an mmap of the file, so records are
+    decoded straight from the page cache. Expired keys are skipped.
+    Returns the number of records read.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return 0
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if mapped[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                raise ValueError(f"{path} is not a key-value snapshot")
+            count, _end = apply_records(store, mapped, len(SNAPSHOT_MAGIC))
+    return count
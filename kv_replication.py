@@ -0,0 +1,305 @@
+import socket
+import struct
+import threading
+import time
+
+from kv_persistence import (RECORD_HEADER, REC_DELETE, encode_delete, encode_put,
+                            iter_records)
+
+
+# ---------- Replication stream ----------
+#
+# A replica opens a normal connection and sends the text command "SYNC".
+# The primary answers "OK SYNC\n" and from then on the connection carries
+# records in the append-only log format (see kv_persistence):
+#
+#   1. full sync: one PUT/PUTEX record per live key
+#   2. one SYNC_END record
+#   3. every later mutation (PUT, PUTEX with absolute expiry, DELETE),
+#      interleaved with HEARTBEAT records
+#
+# Control records use the log header with an empty key. A HEARTBEAT's
+# value is the primary's clock (big-endian float64) when it was queued,
+# so the replica can measure how far behind the stream it is.
+
+REC_SYNC_END = 4
+REC_HEARTBEAT = 5
+
+HEARTBEAT_CLOCK = struct.Struct("!d")
+
+SYNC_END_RECORD = RECORD_HEADER.pack(REC_SYNC_END, 0, 0.0, 0, 0)
+
+
+def encode_heartbeat(now: float) -> bytes:
+    return (RECORD_HEADER.pack(REC_HEARTBEAT, 0, 0.0, 0, HEARTBEAT_CLOCK.size)
+            + HEARTBEAT_CLOCK.pack(now))
+
+
+# ---------- Primary side ----------
+
+class _ReplicaFeed:
+    """
+    Records queued for one replica connection.
+    """
+    __slots__ = ("addr", "pending", "ready", "closed")
+
+    def __init__(self, addr):
+        self.addr = addr
+        self.pending = bytearray()
+        self.ready = threading.Condition(threading.Lock())
+        self.closed = False
+
+
+class ReplicationSource:
+    """
+    Streams a store's mutations to connected replicas.
+
+    Registered as a store listener, so every mutation is encoded once,
+    under the store lock, and appended to each replica's feed; one
+    sender thread per replica drains its feed. A replica whose feed grows
+    past max_backlog bytes (it stopped reading) is disconnected and has to
+    resync from scratch, so a stuck replica cannot exhaust memory.
+    """
+    def __init__(self, store, heartbeat_interval: float = 1.0,
+                 max_backlog: int = 64 << 20):
+        self.store = store
+        self.heartbeat_interval = heartbeat_interval
+        self.max_backlog = max_backlog
+        self.offset = 0  # bytes of mutations produced since startup
+        self._feeds = ()  # replaced, never mutated, so readers need no lock
+        self._lock = threading.Lock()  # guards _feeds and offset
+        self._stopped = threading.Event()
+        store.add_listener(self)
+        threading.Thread(target=self._heartbeat_loop, daemon=True).start()
+
+    @property
+    def connected_replicas(self) -> int:
+        return len(self._feeds)
+
+    def record_put(self, key: str, value: bytes, expiry: float | None):
+        if self._feeds:
+            self._publish(encode_put(key, value, expiry))
+
+    def record_delete(self, key: str):
+        if self._feeds:
+            self._publish(encode_delete(key))
+
+    def _publish(self, record: bytes):
+        with self._lock:
+            self.offset += len(record)
+            for feed in self._feeds:
+                with feed.ready:
+                    if feed.closed:
+                        continue
+                    feed.pending += record
+                    if len(feed.pending) > self.max_backlog:
+                        feed.closed = True
+                        feed.pending.clear()
+                    feed.ready.notify()
+
+    def _heartbeat_loop(self):
+        while not self._stopped.wait(self.heartbeat_interval):
+            if self._feeds:
+                self._publish(encode_heartbeat(time.time()))
+
+    def serve(self, sock: socket.socket, addr):
+        """
+        Run the replication stream on an accepted connection that has just
+        sent SYNC. Blocks until the replica disconnects.
+
+        The feed is registered before the full sync starts, so mutations
+        made while the store is being walked are queued and replayed after
+        SYNC_END. Replaying them over the dump is harmless: records carry
+        final values, not deltas.
+        """
+        feed = _ReplicaFeed(addr)
+        with self._lock:
+            self._feeds = self._feeds + (feed,)
+        print(f"[SERVER] Replica {addr} connected, starting full sync")
+        try:
+            sock.sendall(b"OK SYNC\n")
+            started = time.perf_counter()
+            count = 0
+            for chunk in self.store.iter_chunks():
+                sock.sendall(b"".join(encode_put(key, value, expiry)
+                                      for key, value, expiry in chunk))
+                count += len(chunk)
+            sock.sendall(SYNC_END_RECORD)
+            print(f"[SERVER] Full sync of {count} keys to {addr} sent in "
+                  f"{time.perf_counter() - started:.2f}s")
+            while True:
+                with feed.ready:
+                    while not feed.pending and not feed.closed:
+                        feed.ready.wait()
+                    if feed.closed:
+                        print(f"[SERVER] Replica {addr} fell too far behind, disconnecting")
+                        break
+                    data, feed.pending = feed.pending, bytearray()
+                sock.sendall(data)
+        except OSError:
+            print(f"[SERVER] Replica {addr} disconnected")
+        finally:
+            with self._lock:
+                self._feeds = tuple(f for f in self._feeds if f is not feed)
+
+    def close(self):
+        self._stopped.set()
+        with self._lock:
+            for feed in self._feeds:
+                with feed.ready:
+                    feed.closed = True
+                    feed.ready.notify()
+
+
+# ---------- Replica side ----------
+
+class ReplicaLink:
+    """
+    Keeps a local store in sync with a primary server.
+
+    A background thread connects, sends SYNC and applies the stream.
+    After a full sync, keys that the primary no longer has are deleted,
+    so a replica that reconnects converges without first emptying its
+    store (reads keep being served from the old data meanwhile). On any
+    error the link reconnects after retry_interval and resyncs.
+    """
+    RECV_SIZE = 65536
+    BATCH_SIZE = 1000
+
+    def __init__(self, store, host: str, port: int, retry_interval: float = 1.0):
+        self.store = store
+        self.host = host
+        self.port = port
+        self.retry_interval = retry_interval
+        self.status = "connecting"  # "connecting", "syncing" or "online"
+        self.offset = 0  # stream bytes applied since the last full sync
+        self.lag = None  # seconds behind the primary at the last heartbeat
+        self.last_io = None  # time.time() of the last data received
+        self.full_syncs = 0
+        self._sock = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        """
+        Numeric link state, merged into STATS and /metrics.
+        """
+        stats = {
+            "replica_link_up": int(self.status == "online"),
+            "replication_offset": self.offset,
+            "replication_full_syncs": self.full_syncs,
+        }
+        if self.lag is not None:
+            stats["replication_lag_seconds"] = round(self.lag, 6)
+        if self.last_io is not None:
+            stats["replication_last_io_seconds_ago"] = round(time.time() - self.last_io, 3)
+        return stats
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                with socket.create_connection((self.host, self.port)) as sock:
+                    self._sock = sock
+                    self._sync(sock)
+            except (OSError, ValueError) as exc:
+                if not self._stopped.is_set():
+                    print(f"[REPLICA] Link to {self.host}:{self.port} down: {exc}")
+            finally:
+                self._sock = None
+                self.status = "connecting"
+            self._stopped.wait(self.retry_interval)
+
+    def _sync(self, sock: socket.socket):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.sendall(b"SYNC\n")
+        buf = bytearray()
+        while b"\n" not in buf:
+            data = sock.recv(self.RECV_SIZE)
+            if not data:
+                raise ConnectionError("primary closed the connection")
+            buf += data
+        line, _, rest = bytes(buf).partition(b"\n")
+        if line != b"OK SYNC":
+            raise ValueError(f"primary refused SYNC: {line.decode('utf-8', 'replace')}")
+
+        self.status = "syncing"
+        self.offset = 0
+        self.lag = None
+        print(f"[REPLICA] Full sync from {self.host}:{self.port} started")
+        synced_keys = set()
+        # Appended to and consumed in place, so a record spanning many
+        # reads is not copied again on every read
+        pending = bytearray(rest)
+        while True:
+            if pending:
+                self.last_io = time.time()
+                consumed = self._apply(pending, synced_keys)
+                if synced_keys is not None and self.status == "online":
+                    synced_keys = None
+                del pending[:consumed]
+            data = sock.recv(self.RECV_SIZE)
+            if not data:
+                raise ConnectionError("primary closed the connection")
+            pending += data
+
+    def _apply(self, data: bytearray, synced_keys: set | None) -> int:
+        """
+        Apply every complete record in data; returns the bytes consumed.
+        Puts are batched into restore_many between deletes and control
+        records, like kv_persistence.apply_records.
+        """
+        store = self.store
+        now = time.time()
+        batch = []
+        consumed = 0
+        for op, key, value, expiry, end in iter_records(data):
+            consumed = end
+            if op == REC_HEARTBEAT:
+                (sent,) = HEARTBEAT_CLOCK.unpack(value)
+                self.lag = max(0.0, now - sent)
+                continue
+            if op == REC_SYNC_END:
+                if batch:
+                    store.restore_many(batch)
+                    batch = []
+                self._finish_full_sync(synced_keys)
+                continue
+            if synced_keys is not None and self.status == "syncing":
+                synced_keys.add(key)
+            if op == REC_DELETE or (expiry is not None and expiry <= now):
+                if batch:
+                    store.restore_many(batch)
+                    batch = []
+                store.delete(key)
+            else:
+                batch.append((key, bytes(value), expiry))
+                if len(batch) >= self.BATCH_SIZE:
+                    store.restore_many(batch)
+                    batch = []
+        if batch:
+            store.restore_many(batch)
+        self.offset += consumed
+        return consumed
+
+    def _finish_full_sync(self, synced_keys: set):
+        stale = [key for chunk in self.store.iter_chunks()
+                 for key, _value, _expiry in chunk if key not in synced_keys]
+        if stale:
+            self.store.delete_many(stale)
+        self.status = "online"
+        self.full_syncs += 1
+        print(f"[REPLICA] Full sync done: {len(synced_keys)} keys, "
+              f"{len(stale)} stale keys removed")
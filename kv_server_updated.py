@@ -1,38 +1,514 @@
+import argparse
+import bisect
+import errno
+import heapq
+import math
+import os
+import random
+import re
+import selectors
 import socket
+import struct
+import sys
 import threading
 import time
+import zlib
+from collections import OrderedDict
+from itertools import islice
+
+from kv_metrics import ConnectionProfile, ServerMetrics, SlowLog, start_metrics_http_server
+from kv_persistence import AppendOnlyLog, load_snapshot, write_snapshot
+from kv_replication import ReplicaLink, ReplicationSource
+from kv_tracking import InvalidationTracker
+
+
+# ---------- Eviction policies ----------
+#
+# A policy only tracks key order; KeyValueStore tells it about inserts,
+# reads and removals (all under the store lock) and asks it for a victim
+# when the store is over its limits; victim(skip) never returns skip, the
+# key being written. Every hook is amortized O(1).
+
+class _LRUPolicy:
+    """
+    Least recently used: keys kept in access order.
+    """
+    def __init__(self):
+        self._order = OrderedDict()
+
+    def on_insert(self, key, expiry):
+        self._order[key] = None
+        self._order.move_to_end(key)
+
+    def on_access(self, key):
+        self._order.move_to_end(key)
+
+    def on_remove(self, key):
+        self._order.pop(key, None)
+
+    def victim(self, skip=None):
+        keys = iter(self._order)
+        key = next(keys, None)
+        return next(keys, None) if key == skip else key
+
+
+class _LFUPolicy:
+    """
+    Least frequently used, ties broken by least recent use.
+    Keys are bucketed by hit count so promote/evict are O(1).
+    """
+    def __init__(self):
+        self._freq = {}  # key -> hit count
+        self._buckets = {}  # hit count -> OrderedDict of keys
+        self._min_freq = 0
+
+    def on_insert(self, key, expiry):
+        if key in self._freq:
+            self.on_access(key)
+            return
+        self._freq[key] = 1
+        self._buckets.setdefault(1, OrderedDict())[key] = None
+        self._min_freq = 1
+
+    def on_access(self, key):
+        freq = self._freq[key]
+        bucket = self._buckets[freq]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[freq]
+            if self._min_freq == freq:
+                self._min_freq = freq + 1
+        self._freq[key] = freq + 1
+        self._buckets.setdefault(freq + 1, OrderedDict())[key] = None
+
+    def on_remove(self, key):
+        freq = self._freq.pop(key, None)
+        if freq is None:
+            return
+        bucket = self._buckets[freq]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[freq]
+
+    def victim(self, skip=None):
+        if not self._freq:
+            return None
+        if self._min_freq not in self._buckets:
+            # Only after removals emptied the lowest bucket
+            self._min_freq = min(self._buckets)
+        keys = iter(self._buckets[self._min_freq])
+        key = next(keys)
+        if key != skip:
+            return key
+        key = next(keys, None)
+        if key is None:
+            # skip is alone in the lowest bucket; take the next one up
+            higher = [freq for freq in self._buckets if freq != self._min_freq]
+            if higher:
+                key = next(iter(self._buckets[min(higher)]))
+        return key
+
+
+class _TTLPolicy:
+    """
+    Evict the key closest to expiring first; keys without a TTL are only
+    evicted (oldest first) once no TTL'd key is left.
+    """
+    def __init__(self):
+        self._expiries = {}  # key -> expiry, TTL'd keys only
+        self._heap = []  # (expiry, key), lazily invalidated
+        self._no_ttl = OrderedDict()
+
+    def on_insert(self, key, expiry):
+        self.on_remove(key)
+        if expiry is None:
+            self._no_ttl[key] = None
+            return
+        self._expiries[key] = expiry
+        heapq.heappush(self._heap, (expiry, key))
+        if len(self._heap) > 2 * len(self._expiries) + 64:
+            self._heap = [(exp, k) for exp, k in self._heap
+                          if self._expiries.get(k) == exp]
+            heapq.heapify(self._heap)
+
+    def on_access(self, key):
+        pass
+
+    def on_remove(self, key):
+        if self._expiries.pop(key, None) is None:
+            self._no_ttl.pop(key, None)
+
+    def victim(self, skip=None):
+        heap = self._heap
+        skipped = None
+        key = None
+        while heap:
+            expiry, candidate = heap[0]
+            if self._expiries.get(candidate) != expiry:
+                heapq.heappop(heap)
+            elif candidate == skip:
+                skipped = heapq.heappop(heap)
+            else:
+                key = candidate
+                break
+        if skipped is not None:
+            heapq.heappush(heap, skipped)
+        if key is None:
+            keys = iter(self._no_ttl)
+            key = next(keys, None)
+            if key == skip:
+                key = next(keys, None)
+        return key
+
+
+class _RandomPolicy:
+    """
+    Evict a uniformly random key (list + position map, swap-remove).
+    """
+    def __init__(self):
+        self._keys = []
+        self._pos = {}
+
+    def on_insert(self, key, expiry):
+        if key not in self._pos:
+            self._pos[key] = len(self._keys)
+            self._keys.append(key)
+
+    def on_access(self, key):
+        pass
+
+    def on_remove(self, key):
+        pos = self._pos.pop(key, None)
+        if pos is None:
+            return
+        last = self._keys.pop()
+        if pos < len(self._keys):
+            self._keys[pos] = last
+            self._pos[last] = pos
+
+    def victim(self, skip=None):
+        keys = self._keys
+        if skip not in self._pos:
+            return random.choice(keys) if keys else None
+        if len(keys) < 2:
+            return None
+        # Uniform over every key but skip: a pick of skip stands for the last
+        key = keys[random.randrange(len(keys) - 1)]
+        return keys[-1] if key == skip else key
+
+
+EVICTION_POLICIES = {
+    "lru": _LRUPolicy,
+    "lfu": _LFUPolicy,
+    "ttl": _TTLPolicy,
+    "random": _RandomPolicy,
+}
+
+
+class _SortedKeys:
+    """
+    Sorted set of keys for ordered iteration (SCAN, RANGE).
+
+    Keys are kept in a list of sorted sublists of at most 2 * LOAD keys,
+    plus the last key of each sublist, so add/remove cost two bisects and
+    a memmove of at most 2 * LOAD pointers instead of shifting one huge
+    list. Not thread-safe; KeyValueStore only touches it under its lock.
+    """
+    LOAD = 512
+
+    def __init__(self):
+        self._lists = []
+        self._maxes = []
+
+    def add(self, key: str):
+        """
+        Insert a key that is not already present.
+        """
+        maxes = self._maxes
+        if not maxes:
+            self._lists.append([key])
+            maxes.append(key)
+            return
+        i = bisect.bisect_left(maxes, key)
+        if i == len(maxes):
+            i -= 1
+            self._lists[i].append(key)
+            maxes[i] = key
+        else:
+            bisect.insort(self._lists[i], key)
+        chunk = self._lists[i]
+        if len(chunk) > 2 * self.LOAD:
+            tail = chunk[self.LOAD:]
+            del chunk[self.LOAD:]
+            maxes[i] = chunk[-1]
+            self._lists.insert(i + 1, tail)
+            maxes.insert(i + 1, tail[-1])
+
+    def remove(self, key: str):
+        """
+        Remove a key that is present.
+        """
+        maxes = self._maxes
+        i = bisect.bisect_left(maxes, key)
+        chunk = self._lists[i]
+        j = bisect.bisect_left(chunk, key)
+        del chunk[j]
+        if not chunk:
+            del self._lists[i]
+            del maxes[i]
+        elif j == len(chunk):
+            maxes[i] = chunk[-1]
+
+    def irange(self, start: str | None = None, inclusive: bool = True):
+        """
+        Yield keys in order from start (from the first key if None).
+        The index must not change while the generator is in use.
+        """
+        maxes = self._maxes
+        if start is None:
+            i = j = 0
+        else:
+            find = bisect.bisect_left if inclusive else bisect.bisect_right
+            i = find(maxes, start)
+            if i == len(maxes):
+                return
+            j = find(self._lists[i], start)
+        lists = self._lists
+        for n in range(i, len(lists)):
+            chunk = lists[n]
+            for k in range(j, len(chunk)):
+                yield chunk[k]
+            j = 0
+
+
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+# What INCR and friends accept as an integer; int() would also take
+# "+5", "1_000", surrounding whitespace and non-ASCII digits
+INTEGER_PATTERN = re.compile(rb"-?[0-9]+")
+
+
+# Values up to this size are shared between keys when interning is on;
+# the table stops growing at INTERN_MAX_ENTRIES distinct values.
+INTERN_MAX_SIZE = 64
+INTERN_MAX_ENTRIES = 1 << 16
+
+
+# Compressed values are stored as COMPRESS_HEADER (the uncompressed
+# length) followed by a zlib stream.
+COMPRESS_HEADER = struct.Struct("!I")
+
+
+class _Compressed(bytes):
+    """
+    A stored value that holds a compressed payload. The type itself is
+    the flag, so values below the threshold are stored untouched.
+    """
+    __slots__ = ()
+
+
+def train_compress_dict(samples, size: int = 32768, chunk: int = 32) -> bytes:
+    """
+    Build a preset zlib dictionary from sample values: chunk-byte
+    substrings (taken every chunk // 4 bytes) that occur in at least two
+    samples, most common last, since zlib reaches the end of the
+    dictionary with the shortest distances.
+    """
+    counts = {}
+    step = max(1, chunk // 4)
+    for sample in samples:
+        seen = {sample[i:i + chunk] for i in range(0, max(1, len(sample) - chunk + 1), step)}
+        for piece in seen:
+            counts[piece] = counts.get(piece, 0) + 1
+    common = sorted((n, piece) for piece, n in counts.items() if n > 1)
+    out = []
+    total = 0
+    for _n, piece in reversed(common):
+        if total + len(piece) > size:
+            break
+        out.append(piece)
+        total += len(piece)
+    return b"".join(reversed(out))
+
+
+def _entry_size(key: str, value) -> int:
+    """
+    Approximate memory charged to one entry: key, value, its dict slot
+    and its slot in the ordered index.
+    """
+    return sys.getsizeof(key) + sys.getsizeof(value) + 48
 
 
 class KeyValueStore:
     """
     Thread-safe in-memory key-value store with optional TTL per key.
-    Internally stores: key -> (value, expiry_timestamp or None)
+    Internally stores: key -> value bytes, plus key -> absolute expiry
+    timestamp in a second dict that only holds keys with a TTL. Keeping
+    no per-key record object saves a tuple (and, for keys without a TTL,
+    a float) per entry, and lookups skip the expiry check entirely while
+    no key has a TTL.
+
+    Keys with a TTL are also indexed in a min-heap of (expiry, key), so
+    cleanup_expired only visits keys that are actually due. Heap entries
+    are invalidated lazily: an entry whose expiry no longer matches the
+    key's current expiry (overwritten or deleted) is simply discarded
+    when it reaches the top.
+
+    With intern_values, small values (up to INTERN_MAX_SIZE bytes) are
+    deduplicated, so keys holding the same flag or counter value share
+    one bytes object.
+
+    With compress_threshold set, values of at least that many bytes are
+    zlib-compressed (optionally against a preset compress_dict, see
+    train_compress_dict) when that makes them smaller. Compression runs
+    before the lock is taken and decompression after it is released;
+    listeners, snapshots and readers only ever see the original bytes.
+
+    With max_keys and/or max_memory (approximate bytes) set, a put that
+    takes the store over a limit evicts keys chosen by eviction_policy
+    ("lru", "lfu", "ttl" or "random") until it is back under.
     """
-    def __init__(self):
+    def __init__(self, expiry_wakeup: threading.Event | None = None,
+                 max_keys: int | None = None, max_memory: int | None = None,
+                 eviction_policy: str = "lru", intern_values: bool = False,
+                 compress_threshold: int | None = None, compress_level: int = 6,
+                 compress_dict: bytes | None = None):
+        if eviction_policy not in EVICTION_POLICIES:
+            raise ValueError(
+                f"eviction_policy must be one of {sorted(EVICTION_POLICIES)}, "
+                f"got {eviction_policy!r}"
+            )
         self._store = {}
+        self._expiries = {}  # key -> absolute expiry, keys with a TTL only
+        self._interned = {} if intern_values else None
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self.compress_dict = compress_dict
+        self._compressed_values = 0
+        self._compression_saved = 0  # bytes saved by the values stored now
         self._lock = threading.Lock()
+        self.max_keys = max_keys
+        self.max_memory = max_memory
+        self.eviction_policy = eviction_policy
+        self._policy = None
+        if max_keys is not None or max_memory is not None:
+            self._policy = EVICTION_POLICIES[eviction_policy]()
+        self._used_memory = 0  # only tracked when max_memory is set
+        self.evictions = 0
+        self.expired = 0
+        self._expiry_heap = []
+        # Set whenever a PUTEX creates a deadline earlier than any known one,
+        # so the cleaner can sleep until the next deadline instead of polling.
+        self.expiry_wakeup = expiry_wakeup or threading.Event()
+        # Mutation listeners (e.g. AppendOnlyLog), called under the lock so
+        # they observe writes in the order they were applied.
+        self._listeners = []
+        self._index = _SortedKeys()  # every key in _store, in sorted order
+        # CAS version tokens, only for keys handed out by gets(); any write
+        # or removal drops the key's entry, which invalidates its token.
+        self._versions = {}
+        self._next_version = 0
+
+    def add_listener(self, listener):
+        """
+        Register an object with record_put(key, value, expiry) and
+        record_delete(key) methods, called for every PUT/PUTEX (expiry is
+        absolute) and every DELETE or eviction of a live key.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    # ---------- Value compression ----------
+
+    def _compress(self, value: bytes) -> bytes:
+        """
+        Stored form of value: a _Compressed payload if value is over the
+        threshold and compresses, else value itself.
+        """
+        threshold = self.compress_threshold
+        if threshold is None or len(value) < threshold:
+            return value
+        if self.compress_dict is None:
+            data = zlib.compress(value, self.compress_level)
+        else:
+            compressor = zlib.compressobj(self.compress_level, zdict=self.compress_dict)
+            data = compressor.compress(value) + compressor.flush()
+        if COMPRESS_HEADER.size + len(data) >= len(value):
+            return value
+        return _Compressed(COMPRESS_HEADER.pack(len(value)) + data)
+
+    def _decompress(self, stored):
+        """
+        Original bytes of a stored value (None passes through).
+        """
+        if type(stored) is not _Compressed:
+            return stored
+        (size,) = COMPRESS_HEADER.unpack_from(stored)
+        data = memoryview(stored)[COMPRESS_HEADER.size:]
+        if self.compress_dict is None:
+            return zlib.decompress(data, bufsize=size)
+        return zlib.decompressobj(zdict=self.compress_dict).decompress(data)
+
+    def _count_compressed_unlocked(self, stored, sign: int):
+        if type(stored) is _Compressed:
+            self._compressed_values += sign
+            self._compression_saved += sign * (
+                COMPRESS_HEADER.unpack_from(stored)[0] - len(stored))
+
+    def _remove_unlocked(self, key: str, value: bytes):
+        """
+        Internal: assumes lock is held and value is self._store[key].
+        """
+        del self._store[key]
+        self._index.remove(key)
+        if self._compressed_values:
+            self._count_compressed_unlocked(value, -1)
+        if self._expiries:
+            self._expiries.pop(key, None)
+        if self._versions:
+            self._versions.pop(key, None)
+        if self._policy is not None:
+            self._policy.on_remove(key)
+            if self.max_memory is not None:
+                self._used_memory -= _entry_size(key, value)
 
     def _get_unlocked(self, key: str):
         """
         Internal: assumes lock is held.
         Returns value if present and not expired, else None.
         """
-        record = self._store.get(key)
-        if record is None:
+        value = self._store.get(key)
+        if value is None:
             return None
 
-        value, expiry = record
-        if expiry is not None and expiry <= time.time():
-            # Expired – delete and treat as missing
-            del self._store[key]
-            return None
+        if self._expiries:
+            expiry = self._expiries.get(key)
+            if expiry is not None and expiry <= time.time():
+                # Expired – delete and treat as missing
+                self._remove_unlocked(key, value)
+                self.expired += 1
+                return None
+        if self._policy is not None:
+            self._policy.on_access(key)
         return value
 
     def get(self, key: str):
         with self._lock:
-            return self._get_unlocked(key)
+            value = self._get_unlocked(key)
+        return self._decompress(value)
 
-    def put(self, key: str, value: str, ttl: float | None = None):
+    def get_many(self, keys: list[str]) -> list:
+        """
+        Look up several keys under one lock acquisition.
+        Returns values in the same order, None for missing/expired keys.
+        """
+        with self._lock:
+            values = [self._get_unlocked(key) for key in keys]
+        if self.compress_threshold is not None:
+            values = [self._decompress(value) for value in values]
+        return values
+
+    def put(self, key: str, value: bytes, ttl: float | None = None):
         """
         Store a key with optional TTL (in seconds).
         If ttl is None, key does not expire.
@@ -40,8 +516,206 @@ class KeyValueStore:
         expiry = None
         if ttl is not None:
             expiry = time.time() + ttl
+        stored = self._compress(value)
+        with self._lock:
+            self._put_unlocked(key, value, expiry, stored)
+
+    def put_many(self, items: list[tuple[str, bytes]], ttl: float | None = None):
+        """
+        Store several (key, value) pairs atomically, with an optional shared TTL.
+        """
+        expiry = None
+        if ttl is not None:
+            expiry = time.time() + ttl
+        stored = [self._compress(value) for _key, value in items]
+        with self._lock:
+            for (key, value), packed in zip(items, stored):
+                self._put_unlocked(key, value, expiry, packed)
+
+    def restore(self, key: str, value: bytes, expiry: float | None):
+        """
+        Store a key with an absolute expiry timestamp (used when loading
+        persisted data).
+        """
+        stored = self._compress(value)
+        with self._lock:
+            self._put_unlocked(key, value, expiry, stored)
+
+    def restore_many(self, items: list[tuple[str, bytes, float | None]]):
+        """
+        restore() for a batch of (key, value, expiry) under one lock.
+        """
+        stored = [self._compress(value) for _key, value, _expiry in items]
+        with self._lock:
+            for (key, value, expiry), packed in zip(items, stored):
+                self._put_unlocked(key, value, expiry, packed)
+
+    # ---------- Atomic read-modify-write ----------
+
+    def incr(self, key: str, delta: int, ttl: float | None = None) -> int:
+        """
+        Add delta to the integer stored at key (a missing key counts as 0)
+        and return the new value. An existing TTL is kept; ttl only applies
+        when the counter is created, so a fixed-window rate limiter needs a
+        single call per request. Raises ValueError if the value is not a
+        decimal integer and OverflowError outside the signed 64-bit range.
+        """
+        with self._lock:
+            current = self._decompress(self._get_unlocked(key))
+            if current is None:
+                number = 0
+                expiry = None if ttl is None else time.time() + ttl
+            else:
+                if INTEGER_PATTERN.fullmatch(current) is None:
+                    raise ValueError("value is not an integer")
+                number = int(current)
+                expiry = self._expiries.get(key)
+            number += delta
+            if not INT64_MIN <= number <= INT64_MAX:
+                raise OverflowError("increment or decrement would overflow")
+            self._put_unlocked(key, str(number).encode("ascii"), expiry)
+            return number
+
+    def append(self, key: str, suffix: bytes) -> int:
+        """
+        Append suffix to the value at key (creating it if missing), keeping
+        any TTL. Returns the new length.
+
+        The (de)compression happens outside the lock: the new value is
+        built from a snapshot of the old one and only stored if the key
+        still holds that snapshot, otherwise the append is retried.
+        """
+        while True:
+            with self._lock:
+                old = self._get_unlocked(key)
+                expiry = None if old is None else self._expiries.get(key)
+            current = self._decompress(old)
+            value = suffix if current is None else current + suffix
+            stored = self._compress(value)
+            with self._lock:
+                if (self._store.get(key) is old and self._expiries.get(key) == expiry
+                        and (expiry is None or expiry > time.time())):
+                    self._put_unlocked(key, value, expiry, stored)
+                    return len(value)
+
+    def getset(self, key: str, value: bytes):
+        """
+        Store value without a TTL and return the previous value (None if
+        the key was missing or expired).
+        """
+        stored = self._compress(value)
+        with self._lock:
+            old = self._get_unlocked(key)
+            self._put_unlocked(key, value, None, stored)
+        return self._decompress(old)
+
+    def gets(self, key: str):
+        """
+        Return (value, version) for a later cas(), or None if missing.
+        The version changes whenever the key is written or removed.
+        """
+        with self._lock:
+            value = self._get_unlocked(key)
+            if value is None:
+                return None
+            version = self._versions.get(key)
+            if version is None:
+                self._next_version += 1
+                version = self._versions[key] = self._next_version
+        return self._decompress(value), version
+
+    def cas(self, key: str, version: int, value: bytes, ttl: float | None = None):
+        """
+        Compare-and-set: store value only if key still has the version
+        returned by gets(). Returns True if stored, False if the key was
+        modified since, None if it is missing or expired.
+        """
+        expiry = None
+        if ttl is not None:
+            expiry = time.time() + ttl
+        stored = self._compress(value)
         with self._lock:
-            self._store[key] = (value, expiry)
+            if self._get_unlocked(key) is None:
+                return None
+            if self._versions.get(key) != version:
+                return False
+            self._put_unlocked(key, value, expiry, stored)
+            return True
+
+    def _put_unlocked(self, key: str, value: bytes, expiry: float | None, stored=None):
+        """
+        Internal: assumes lock is held. stored is value as _compress()
+        returned it, if the caller compressed outside the lock.
+        """
+        for listener in self._listeners:
+            listener.record_put(key, value, expiry)
+        if self._versions:
+            self._versions.pop(key, None)
+        if stored is None:
+            stored = self._compress(value)
+        if stored is not value:
+            self._count_compressed_unlocked(stored, 1)
+        else:
+            interned = self._interned
+            if interned is not None and len(value) <= INTERN_MAX_SIZE:
+                shared = interned.get(value)
+                if shared is not None:
+                    stored = shared
+                elif len(interned) < INTERN_MAX_ENTRIES:
+                    interned[value] = value
+        value = stored
+        store = self._store
+        old = store.get(key)
+        if old is None:
+            self._index.add(key)
+        elif self._compressed_values:
+            self._count_compressed_unlocked(old, -1)
+        store[key] = value
+        if expiry is not None:
+            self._expiries[key] = expiry
+            self._schedule_expiry_unlocked(key, expiry)
+        elif self._expiries:
+            self._expiries.pop(key, None)
+        if self._policy is not None:
+            self._policy.on_insert(key, expiry)
+            if self.max_memory is not None:
+                if old is not None:
+                    self._used_memory -= _entry_size(key, old)
+                self._used_memory += _entry_size(key, value)
+            self._evict_unlocked(keep=key)
+
+    def _over_limit_unlocked(self) -> bool:
+        if self.max_keys is not None and len(self._store) > self.max_keys:
+            return True
+        return self.max_memory is not None and self._used_memory > self.max_memory
+
+    def _evict_unlocked(self, keep: str | None = None):
+        """
+        Internal: assumes lock is held.
+        Evict victims until the store is within its limits. The key just
+        written (keep) is never evicted by its own put.
+        """
+        while self._over_limit_unlocked():
+            victim = self._policy.victim(keep)
+            if victim is None:
+                return
+            self._remove_unlocked(victim, self._store[victim])
+            self.evictions += 1
+            for listener in self._listeners:
+                listener.record_delete(victim)
+
+    def _schedule_expiry_unlocked(self, key: str, expiry: float):
+        heap = self._expiry_heap
+        if not heap or expiry < heap[0][0]:
+            self.expiry_wakeup.set()
+        heapq.heappush(heap, (expiry, key))
+
+        # Overwritten TTLs leave stale entries behind; rebuild once they
+        # outnumber live ones so the heap stays O(keys with TTL).
+        if len(heap) > 2 * len(self._expiries) + 64:
+            expiries = self._expiries
+            self._expiry_heap = [(exp, k) for exp, k in heap if expiries.get(k) == exp]
+            heapq.heapify(self._expiry_heap)
 
     def delete(self, key: str) -> bool:
         """
@@ -49,32 +723,367 @@ class KeyValueStore:
         Returns True if a key was deleted, False otherwise.
         """
         with self._lock:
-            record = self._store.get(key)
-            if record is None:
-                return False
+            return self._delete_unlocked(key)
 
-            value, expiry = record
-            if expiry is not None and expiry <= time.time():
-                # Already expired – clean up and treat as not found
-                del self._store[key]
-                return False
+    def delete_many(self, keys: list[str]) -> int:
+        """
+        Delete several keys atomically. Returns how many were deleted.
+        """
+        with self._lock:
+            return sum(self._delete_unlocked(key) for key in keys)
 
-            del self._store[key]
-            return True
+    def _delete_unlocked(self, key: str) -> bool:
+        """
+        Internal: assumes lock is held.
+        """
+        value = self._store.get(key)
+        if value is None:
+            return False
+
+        expiry = self._expiries.get(key) if self._expiries else None
+        self._remove_unlocked(key, value)
+        # An already expired key is cleaned up but treated as not found
+        if expiry is not None and expiry <= time.time():
+            self.expired += 1
+            return False
+        for listener in self._listeners:
+            listener.record_delete(key)
+        return True
+
+    # ---------- Ordered access ----------
+
+    def scan(self, after: str | None = None, prefix: str = "", count: int = 10) -> list[str]:
+        """
+        Up to count live keys in sorted order, strictly after `after` (from
+        the first key if None), limited to keys starting with prefix. The
+        lock is held for O(log n + count), never for a full walk.
+        """
+        start, inclusive = after, False
+        if prefix and (after is None or after < prefix):
+            start, inclusive = prefix, True
+        now = time.time()
+        keys = []
+        with self._lock:
+            expiries = self._expiries
+            for key in self._index.irange(start, inclusive):
+                if prefix and not key.startswith(prefix):
+                    break
+                if expiries and (expiry := expiries.get(key)) is not None and expiry <= now:
+                    continue
+                keys.append(key)
+                if len(keys) >= count:
+                    break
+        return keys
+
+    def range_items(self, low: str | None, low_inclusive: bool, high: str | None,
+                    high_inclusive: bool, count: int) -> list[tuple[str, bytes]]:
+        """
+        Up to count live (key, value) pairs with low <= key <= high in
+        sorted order; None bounds are open and the *_inclusive flags turn
+        <= into <.
+        """
+        now = time.time()
+        items = []
+        with self._lock:
+            store = self._store
+            expiries = self._expiries
+            for key in self._index.irange(low, low_inclusive):
+                if high is not None and (key > high or (key == high and not high_inclusive)):
+                    break
+                if expiries and (expiry := expiries.get(key)) is not None and expiry <= now:
+                    continue
+                items.append((key, store[key]))
+                if len(items) >= count:
+                    break
+        if self.compress_threshold is not None:
+            items = [(key, self._decompress(value)) for key, value in items]
+        return items
+
+    def iter_chunks(self, chunk_size: int = 1000):
+        """
+        Yield the live contents as lists of (key, value, expiry) tuples of at
+        most chunk_size entries. The lock is held only while one chunk is
+        copied, so a full dump never stalls other clients for long. Keys
+        written during the walk may or may not be included.
+        """
+        with self._lock:
+            keys = list(self._store)
+        for start in range(0, len(keys), chunk_size):
+            now = time.time()
+            chunk = []
+            with self._lock:
+                store = self._store
+                expiries = self._expiries
+                for key in keys[start:start + chunk_size]:
+                    value = store.get(key)
+                    if value is None:
+                        continue
+                    expiry = expiries.get(key)
+                    if expiry is None or expiry > now:
+                        chunk.append((key, value, expiry))
+            if chunk and self.compress_threshold is not None:
+                chunk = [(key, self._decompress(value), expiry) for key, value, expiry in chunk]
+            if chunk:
+                yield chunk
+
+    def stats(self) -> dict:
+        """
+        Snapshot of size and eviction counters, for the STATS command.
+        """
+        with self._lock:
+            stats = {
+                "keys": len(self._store),
+                "ttl_keys": len(self._expiries),
+                "expired_keys": self.expired,
+                "evictions": self.evictions,
+            }
+            if self.max_memory is not None:
+                stats["used_memory"] = self._used_memory
+            if self._interned is not None:
+                stats["interned_values"] = len(self._interned)
+            if self.compress_threshold is not None:
+                stats["compressed_values"] = self._compressed_values
+                stats["compression_saved_bytes"] = self._compression_saved
+            return stats
+
+    def next_expiry(self) -> float | None:
+        """
+        Earliest pending deadline (possibly stale), or None if no key has a TTL.
+        """
+        with self._lock:
+            return self._expiry_heap[0][0] if self._expiry_heap else None
 
     def cleanup_expired(self):
         """
-        Remove all expired keys in one sweep.
-        Called periodically by server background thread.
+        Remove every key whose deadline has passed.
+        Cost is proportional to the number of due heap entries, not to
+        the size of the store. Called by the server background thread.
         """
         now = time.time()
         with self._lock:
-            to_delete = [
-                k for k, (v, expiry) in self._store.items()
-                if expiry is not None and expiry <= now
-            ]
-            for k in to_delete:
-                del self._store[k]
+            heap = self._expiry_heap
+            expiries = self._expiries
+            while heap and heap[0][0] <= now:
+                expiry, key = heapq.heappop(heap)
+                if expiries.get(key) == expiry:
+                    self._remove_unlocked(key, self._store[key])
+                    self.expired += 1
+
+
+class ShardedKeyValueStore:
+    """
+    KeyValueStore split into N independently locked segments.
+    Each key is hashed to one segment, so operations on keys in different
+    segments never contend for the same lock. Exposes the same
+    get/put/delete/cleanup_expired API as KeyValueStore.
+    """
+    def __init__(self, shards: int = 16, max_keys: int | None = None,
+                 max_memory: int | None = None, eviction_policy: str = "lru",
+                 **store_options):
+        """
+        max_keys / max_memory are split evenly across segments and enforced
+        per segment, so eviction never needs more than one lock. Other
+        store_options (interning, compression) apply to every segment.
+        """
+        if shards < 1:
+            raise ValueError("shards must be >= 1")
+        if max_keys is not None:
+            max_keys = -(-max_keys // shards)
+        if max_memory is not None:
+            max_memory = -(-max_memory // shards)
+        # One shared wakeup event, so the cleaner notices a new earliest
+        # deadline in any segment.
+        self.expiry_wakeup = threading.Event()
+        self._shards = [
+            KeyValueStore(self.expiry_wakeup, max_keys=max_keys,
+                          max_memory=max_memory, eviction_policy=eviction_policy,
+                          **store_options)
+            for _ in range(shards)
+        ]
+
+    def _shard_for(self, key: str) -> KeyValueStore:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _group_by_shard(self, keys) -> dict:
+        """
+        Map shard -> list of positions in keys belonging to it.
+        """
+        groups = {}
+        n = len(self._shards)
+        for pos, key in enumerate(keys):
+            groups.setdefault(self._shards[hash(key) % n], []).append(pos)
+        return groups
+
+    def get(self, key: str):
+        return self._shard_for(key).get(key)
+
+    def get_many(self, keys: list[str]) -> list:
+        """
+        Multi-key operations lock each involved segment once; they are
+        atomic per segment, not across the whole keyspace.
+        """
+        results = [None] * len(keys)
+        for shard, positions in self._group_by_shard(keys).items():
+            values = shard.get_many([keys[pos] for pos in positions])
+            for pos, value in zip(positions, values):
+                results[pos] = value
+        return results
+
+    def put(self, key: str, value: bytes, ttl: float | None = None):
+        self._shard_for(key).put(key, value, ttl=ttl)
+
+    def put_many(self, items: list[tuple[str, bytes]], ttl: float | None = None):
+        for shard, positions in self._group_by_shard([k for k, _v in items]).items():
+            shard.put_many([items[pos] for pos in positions], ttl=ttl)
+
+    def restore(self, key: str, value: bytes, expiry: float | None):
+        self._shard_for(key).restore(key, value, expiry)
+
+    def restore_many(self, items: list[tuple[str, bytes, float | None]]):
+        for shard, positions in self._group_by_shard([item[0] for item in items]).items():
+            shard.restore_many([items[pos] for pos in positions])
+
+    def incr(self, key: str, delta: int, ttl: float | None = None) -> int:
+        return self._shard_for(key).incr(key, delta, ttl)
+
+    def append(self, key: str, suffix: bytes) -> int:
+        return self._shard_for(key).append(key, suffix)
+
+    def getset(self, key: str, value: bytes):
+        return self._shard_for(key).getset(key, value)
+
+    def gets(self, key: str):
+        return self._shard_for(key).gets(key)
+
+    def cas(self, key: str, version: int, value: bytes, ttl: float | None = None):
+        return self._shard_for(key).cas(key, version, value, ttl)
+
+    def add_listener(self, listener):
+        """
+        The listener must be thread-safe: segments call it concurrently.
+        """
+        for shard in self._shards:
+            shard.add_listener(listener)
+
+    def delete(self, key: str) -> bool:
+        return self._shard_for(key).delete(key)
+
+    def delete_many(self, keys: list[str]) -> int:
+        return sum(
+            shard.delete_many([keys[pos] for pos in positions])
+            for shard, positions in self._group_by_shard(keys).items()
+        )
+
+    def scan(self, after: str | None = None, prefix: str = "", count: int = 10) -> list[str]:
+        """
+        Every segment returns its first count matches; the global page is
+        the first count of their sorted merge.
+        """
+        pages = [shard.scan(after, prefix, count) for shard in self._shards]
+        return list(islice(heapq.merge(*pages), count))
+
+    def range_items(self, low: str | None, low_inclusive: bool, high: str | None,
+                    high_inclusive: bool, count: int) -> list[tuple[str, bytes]]:
+        pages = [shard.range_items(low, low_inclusive, high, high_inclusive, count)
+                 for shard in self._shards]
+        return list(islice(heapq.merge(*pages), count))
+
+    def iter_chunks(self, chunk_size: int = 1000):
+        for shard in self._shards:
+            yield from shard.iter_chunks(chunk_size)
+
+    def stats(self) -> dict:
+        totals = {}
+        for shard in self._shards:
+            for name, value in shard.stats().items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def next_expiry(self) -> float | None:
+        deadlines = [d for d in (shard.next_expiry() for shard in self._shards)
+                     if d is not None]
+        return min(deadlines) if deadlines else None
+
+    def cleanup_expired(self):
+        """
+        Sweep one segment at a time; only that segment's lock is held
+        while it is being swept.
+        """
+        for shard in self._shards:
+            shard.cleanup_expired()
+
+
+class _ClientConnection:
+    """
+    Per-client protocol state. inbuf and binary are used by both front
+    ends; outbuf and events only by the event loop.
+    """
+    __slots__ = ("sock", "addr", "inbuf", "outbuf", "events", "closed", "binary",
+                 "stream", "profile", "tracking")
+
+    def __init__(self, sock: socket.socket, addr):
+        self.sock = sock
+        self.addr = addr
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+        self.events = selectors.EVENT_READ
+        self.closed = False
+        self.binary = False  # switched on by the BINARY command
+        # serve(sock, addr) that takes the connection over after SYNC or
+        # INVALIDATIONS (replication stream, invalidation channel)
+        self.stream = None
+        self.profile = None  # ConnectionProfile while PROFILE START is active
+        self.tracking = None  # invalidation channel id after TRACKING ON
+
+
+# ---------- Binary protocol ----------
+#
+# Negotiated per connection by sending the text command "BINARY" (reply
+# "OK BINARY"); every byte after that line is binary frames.
+#
+# Request:  op (u8) | flags (u8) | key_len (u16) | value_len (u32) | key | value
+# Response: status (u8) | value_len (u32) | value
+#
+# All integers are big-endian. PUTEX carries its TTL as a big-endian
+# float64 in front of the value (value_len includes those 8 bytes).
+
+BIN_REQUEST_HEADER = struct.Struct("!BBHI")
+BIN_RESPONSE_HEADER = struct.Struct("!BI")
+BIN_TTL = struct.Struct("!d")
+
+OP_GET = 1
+OP_PUT = 2
+OP_PUTEX = 3
+OP_DELETE = 4
+OP_QUIT = 5
+
+# Binary ops are reported under the same names as their text commands
+BIN_OP_NAMES = {OP_GET: "GET", OP_PUT: "PUT", OP_PUTEX: "PUTEX",
+                OP_DELETE: "DELETE", OP_QUIT: "QUIT"}
+
+STATUS_OK = 0
+STATUS_VALUE = 1
+STATUS_NOT_FOUND = 2
+STATUS_DELETED = 3
+STATUS_ERROR = 4
+STATUS_BYE = 5
+
+# accept() errors that clear up once connections close
+OUT_OF_FDS = (errno.EMFILE, errno.ENFILE)
+
+
+def raise_fd_limit():
+    """
+    Every client holds a socket; lift the soft descriptor limit to the
+    hard one so tens of thousands of connections fit (Unix only).
+    """
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
 
 
 class KeyValueServer:
@@ -86,7 +1095,30 @@ class KeyValueServer:
       - PUTEX <key> <ttl_seconds> <value...>
       - GET <key>
       - DELETE <key>
+      - MGET <key> [<key>...]
+      - MSET <key> <value> [<key> <value>...]   (single-word values)
+      - MDEL <key> [<key>...]
+      - INCR / DECR <key> [<ttl_seconds>]
+      - INCRBY / DECRBY <key> <delta> [<ttl_seconds>]
+          (atomic; a missing key counts as 0 and gets ttl_seconds if given)
+      - APPEND <key> <value...>
+      - GETSET <key> <value...>
+      - GETS <key>
+      - CAS <key> <version> <value...>   (store only if unchanged since GETS)
+      - SCAN <cursor> [MATCH <prefix>] [COUNT <n>]   (keys in sorted order)
+      - RANGE <min> <max> [COUNT <n>]   (bounds "[key", "(key", "-", "+")
+      - STATS
+      - SLOWLOG GET [<n>] | LEN | RESET   (commands over the slowlog threshold)
+      - PROFILE START cpu|mem | STOP [<n>]   (profile this connection)
+      - BGSAVE   (start a background snapshot; needs a snapshot path)
       - QUIT
+      - BINARY   (switch this connection to binary framing, see OP_* below)
+      - SYNC     (turn this connection into a replication stream, see
+                  kv_replication)
+      - INVALIDATIONS   (turn this connection into an invalidation
+                         channel, see kv_tracking)
+      - TRACKING ON REDIRECT <channel id> | OFF   (announce changes to keys
+                         this connection reads on that channel)
 
     Responses:
       - PUT / PUTEX success: "OK"
@@ -94,98 +1126,678 @@ class KeyValueServer:
       - GET (missing/expired): "NOT_FOUND"
       - DELETE (success): "DELETED"
       - DELETE (missing/expired): "NOT_FOUND"
+      - MGET: "VALUES <n>" followed by n lines, one per key in request
+              order, each "VALUE <value>" or "NOT_FOUND"
+      - MSET: "OK"
+      - MDEL: "DELETED <count>"
+      - INCR / DECR / INCRBY / DECRBY: "VALUE <new value>"
+      - APPEND: "LENGTH <new length>"
+      - GETSET: "VALUE <old value>" or "NOT_FOUND"
+      - GETS: "VALUE <version> <value>" or "NOT_FOUND"
+      - CAS: "OK", "EXISTS" (changed since GETS) or "NOT_FOUND"
+      - SCAN: "KEYS <next cursor> <n>" followed by n keys; the cursor is
+              "0" once the scan is complete
+      - RANGE: "ITEMS <n>" followed by n "<key> <value>" lines
+      - STATS: "STATS <name>=<value> ..." on one line (store size,
+               evictions, expirations, clients, hit rate, per-command
+               call counts and average latency)
+      - SLOWLOG GET: "ENTRIES <n>" followed by n lines, newest first,
+                     "<id> <unix time> <usec> <client> <command...>"
+      - SLOWLOG LEN: "LENGTH <n>"; SLOWLOG RESET: "OK"
+      - PROFILE START: "OK"
+      - PROFILE STOP: "PROFILE <n>" followed by n report lines (top
+                      functions by cumulative time, or top allocation
+                      growth for mem)
+      - BGSAVE: "OK Background save started"
       - QUIT: "BYE"
+      - BINARY: "OK BINARY"
+      - SYNC: "OK SYNC", then the replication stream
+      - INVALIDATIONS: "OK INVALIDATIONS <id>", then "INVALIDATE <key>" lines
+      - TRACKING: "OK"
       - invalid: "ERROR <message>"
+      - writes on a replica: "ERROR READONLY <message>"
+
+    Values are stored as bytes; the text protocol stores the UTF-8 encoding
+    of the joined value words, the binary protocol stores raw bytes (values
+    containing newlines can only be read back safely over binary framing).
     """
-    def __init__(self, host: str = "127.0.0.1", port: int = 5000):
+    MODES = ("threaded", "eventloop")
+    COMMANDS = frozenset({"PUT", "PUTEX", "GET", "DELETE", "MGET", "MSET", "MDEL",
+                          "INCR", "INCRBY", "DECR", "DECRBY", "APPEND", "GETSET",
+                          "GETS", "CAS", "SCAN", "RANGE", "STATS", "SLOWLOG", "BGSAVE",
+                          "QUIT"})
+    RECV_SIZE = 65536
+    MAX_PENDING_OUTPUT = 1 << 20  # bytes queued for a client before we stop reading
+    ACCEPT_BACKOFF = 0.1  # seconds without accepting after running out of descriptors
+    DEFAULT_PAGE_COUNT = 10  # SCAN / RANGE page size
+    MAX_PAGE_COUNT = 10000
+    WRITE_COMMANDS = frozenset({"PUT", "PUTEX", "DELETE", "MSET", "MDEL", "INCR",
+                                "INCRBY", "DECR", "DECRBY", "APPEND", "GETSET", "CAS"})
+    TRACKED_READS = frozenset({"GET", "MGET", "GETS"})
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 5000,
+                 mode: str = "threaded", shards: int = 1,
+                 max_keys: int | None = None, max_memory: int | None = None,
+                 eviction_policy: str = "lru", intern_values: bool = False,
+                 compress_threshold: int | None = None, compress_level: int = 6,
+                 compress_dict: bytes | None = None,
+                 aof_path: str | None = None, aof_fsync: str = "everysec",
+                 aof_fsync_interval_ms: int = 1000,
+                 snapshot_path: str | None = None,
+                 snapshot_interval: float | None = None,
+                 metrics_port: int | None = None,
+                 slowlog_threshold: float | None = 0.01, slowlog_max_len: int = 128,
+                 reuse_port: bool = False,
+                 store: "KeyValueStore | ShardedKeyValueStore | None" = None,
+                 replica_of: tuple[str, int] | None = None):
+        """
+        mode selects the connection front end:
+          - "threaded":  one thread per client connection
+          - "eventloop": single thread multiplexing every connection with
+                         non-blocking sockets and the selectors module
+        Both modes speak the same protocol through process_command.
+
+        shards > 1 splits the keyspace across that many independently
+        locked segments (see ShardedKeyValueStore).
+
+        max_keys / max_memory bound the store; eviction_policy picks which
+        keys go when a limit is hit (see KeyValueStore). intern_values
+        shares one copy of each small repeated value between keys.
+        compress_threshold enables zlib compression of values of at least
+        that many bytes, against compress_dict if given.
+
+        aof_path enables the append-only log: it is replayed into the store
+        on startup and every later mutation is appended to it, fsynced per
+        aof_fsync ("always", "everysec" or "no", see AppendOnlyLog).
+
+        Text and binary commands that take at least slowlog_threshold
+        seconds (None disables it) are kept in a SLOWLOG ring buffer of
+        slowlog_max_len entries.
+
+        reuse_port sets SO_REUSEPORT on the listening socket, so several
+        processes can accept on the same port (see kv_multiproc.py).
+
+        store serves an existing store instead of creating one. Its owner
+        stays responsible for expiry cleanup and persistence, so no
+        cleaner thread is started and aof_path / snapshot_path are ignored.
+
+        replica_of=(host, port) makes this server a read-only replica of
+        that primary: it full-syncs, then applies the primary's mutation
+        stream (see ReplicaLink) and rejects writes. Any server, replicas
+        included, serves replicas that connect and send SYNC.
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"mode must be one of {self.MODES}, got {mode!r}")
         self.host = host
         self.port = port
-        self.store = KeyValueStore()
+        self.mode = mode
+        self.reuse_port = reuse_port
+        self._owns_store = store is None
+        store_options = dict(max_keys=max_keys, max_memory=max_memory,
+                             eviction_policy=eviction_policy, intern_values=intern_values,
+                             compress_threshold=compress_threshold,
+                             compress_level=compress_level, compress_dict=compress_dict)
+        if store is not None:
+            self.store = store
+            aof_path = snapshot_path = None
+        elif shards > 1:
+            self.store = ShardedKeyValueStore(shards, **store_options)
+        else:
+            self.store = KeyValueStore(**store_options)
+
+        self.metrics = ServerMetrics()
+        self.slowlog = SlowLog(slowlog_threshold, slowlog_max_len)
+        self.metrics_port = metrics_port
+
+        self.replica_of = replica_of
+        self.replica_link = None
+        if replica_of is not None:
+            self.replica_link = ReplicaLink(self.store, *replica_of)
+        self.replication = None  # ReplicationSource, created by the first SYNC
+        self.tracker = None  # InvalidationTracker, created by the first INVALIDATIONS
+        self._replication_lock = threading.Lock()  # also guards tracker creation
+
+        self.snapshot_path = snapshot_path
+        self._snapshot_lock = threading.Lock()
+        if snapshot_path is not None:
+            loaded = load_snapshot(snapshot_path, self.store)
+            print(f"[SERVER] Loaded {loaded} keys from snapshot {snapshot_path}")
+
+        self.aof = None
+        if aof_path is not None:
+            replayed = AppendOnlyLog.replay(aof_path, self.store)
+            print(f"[SERVER] Replayed {replayed} log records from {aof_path}")
+            self.aof = AppendOnlyLog(aof_path, fsync=aof_fsync,
+                                     fsync_interval_ms=aof_fsync_interval_ms)
+            self.store.add_listener(self.aof)
         self._shutdown_event = threading.Event()
+        self._listen_sock = None
+        self._accept_paused_until = None  # eventloop mode, see _accept_ready
 
         # Start background cleaner thread for expired keys
-        self._cleaner_thread = threading.Thread(
-            target=self._cleanup_loop,
-            args=(1.0,),  # interval in seconds
-            daemon=True,
-        )
-        self._cleaner_thread.start()
+        self._cleaner_thread = None
+        if self._owns_store:
+            self._cleaner_thread = threading.Thread(
+                target=self._cleanup_loop,
+                daemon=True,
+            )
+            self._cleaner_thread.start()
+
+        if snapshot_path is not None and snapshot_interval is not None:
+            threading.Thread(
+                target=self._snapshot_loop,
+                args=(snapshot_interval,),
+                daemon=True,
+            ).start()
 
-    def _cleanup_loop(self, interval: float):
+    def _cleanup_loop(self):
         """
-        Periodically clean up expired keys until shutdown.
+        Sleep until the earliest TTL deadline (or until a PUTEX sets an
+        earlier one), remove whatever has expired, repeat until shutdown.
         """
+        wakeup = self.store.expiry_wakeup
         while not self._shutdown_event.is_set():
-            time.sleep(interval)
+            deadline = self.store.next_expiry()
+            timeout = None
+            if deadline is not None:
+                timeout = min(max(0.0, deadline - time.time()), threading.TIMEOUT_MAX)
+            wakeup.wait(timeout)
+            wakeup.clear()
             self.store.cleanup_expired()
 
+    def snapshot(self) -> bool:
+        """
+        Write a snapshot and compact the log: the log is rotated aside
+        first, so every mutation is either covered by the snapshot or
+        still in the new log; the rotated part is dropped once the
+        snapshot is durable. Returns False if a snapshot is already running.
+        """
+        if not self._snapshot_lock.acquire(blocking=False):
+            return False
+        try:
+            old_log = self.aof.rotate() if self.aof is not None else None
+            started = time.perf_counter()
+            count = write_snapshot(self.store, self.snapshot_path)
+            if old_log is not None:
+                os.remove(old_log)
+            elapsed = time.perf_counter() - started
+            print(f"[SERVER] Snapshot of {count} keys written in {elapsed:.2f}s")
+            return True
+        finally:
+            self._snapshot_lock.release()
+
+    def _snapshot_loop(self, interval: float):
+        while not self._shutdown_event.wait(interval):
+            self.snapshot()
+
     def start(self):
         """
         Start the server and begin accepting connections.
         """
+        raise_fd_limit()
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as srv_sock:
             srv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.reuse_port:
+                srv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             srv_sock.bind((self.host, self.port))
-            srv_sock.listen()
-            print(f"[SERVER] Listening on {self.host}:{self.port}")
+            srv_sock.listen(socket.SOMAXCONN)
+            self._listen_sock = srv_sock
+            print(f"[SERVER] Listening on {self.host}:{self.port} ({self.mode} mode)")
+            metrics_httpd = None
+            if self.metrics_port is not None:
+                metrics_httpd = start_metrics_http_server(
+                    self.host, self.metrics_port, self.render_metrics)
+                print(f"[SERVER] Metrics at http://{self.host}:{self.metrics_port}/metrics")
+            if self.replica_link is not None:
+                self.replica_link.start()
+                print(f"[SERVER] Replicating from {self.replica_of[0]}:{self.replica_of[1]}")
 
             try:
-                while not self._shutdown_event.is_set():
-                    try:
-                        conn, addr = srv_sock.accept()
-                    except OSError:
-                        break  # socket closed
-                    print(f"[SERVER] New connection from {addr}")
-                    client_thread = threading.Thread(
-                        target=self.handle_client,
-                        args=(conn, addr),
-                        daemon=True,
-                    )
-                    client_thread.start()
+                if self.mode == "eventloop":
+                    self._serve_eventloop(srv_sock)
+                else:
+                    self._serve_threaded(srv_sock)
             except KeyboardInterrupt:
                 print("\n[SERVER] Shutting down (KeyboardInterrupt)...")
             finally:
                 self._shutdown_event.set()
+                if self._owns_store:
+                    self.store.expiry_wakeup.set()  # release the cleaner thread
+                if metrics_httpd is not None:
+                    metrics_httpd.shutdown()
+                if self.replica_link is not None:
+                    self.replica_link.stop()
+                if self.replication is not None:
+                    self.replication.close()
+                if self.tracker is not None:
+                    self.tracker.close()
+                if self.aof is not None:
+                    self.aof.close()
                 print("[SERVER] Server stopped.")
 
+    def stop(self):
+        """
+        Make start(), running in another thread, return and shut down as it
+        does on Ctrl+C (closing the append-only log and replication).
+        """
+        self._shutdown_event.set()
+        if self._listen_sock is not None:
+            try:
+                self._listen_sock.shutdown(socket.SHUT_RDWR)  # wake accept()
+            except OSError:
+                pass
+
+    def render_metrics(self) -> str:
+        return self.metrics.prometheus(self._stats())
+
+    def _stats(self) -> dict:
+        """
+        Store statistics plus replication and tracking state, for STATS
+        and /metrics.
+        """
+        stats = self.store.stats()
+        if self.replica_link is not None:
+            stats.update(self.replica_link.stats())
+        if self.replication is not None:
+            stats["connected_replicas"] = self.replication.connected_replicas
+            stats["replication_source_offset"] = self.replication.offset
+        if self.tracker is not None:
+            stats.update(self.tracker.stats())
+        return stats
+
+    def _replication_source(self) -> ReplicationSource:
+        with self._replication_lock:
+            if self.replication is None:
+                self.replication = ReplicationSource(self.store)
+            return self.replication
+
+    def _invalidation_tracker(self) -> InvalidationTracker:
+        with self._replication_lock:
+            if self.tracker is None:
+                self.tracker = InvalidationTracker(self.store)
+            return self.tracker
+
+    def _serve_threaded(self, srv_sock: socket.socket):
+        """
+        Accept loop for "threaded" mode: one daemon thread per connection.
+        """
+        while not self._shutdown_event.is_set():
+            try:
+                conn, addr = srv_sock.accept()
+            except OSError as e:
+                if e.errno in OUT_OF_FDS and not self._shutdown_event.is_set():
+                    time.sleep(self.ACCEPT_BACKOFF)
+                    continue
+                break  # socket closed
+            print(f"[SERVER] New connection from {addr}")
+            client_thread = threading.Thread(
+                target=self.handle_client,
+                args=(conn, addr),
+                daemon=True,
+            )
+            client_thread.start()
+
+    # ---------- Event-loop mode ----------
+
+    def _serve_eventloop(self, srv_sock: socket.socket):
+        """
+        Accept and serve every connection from this thread.
+        Each client costs one socket plus two small buffers, no thread stack.
+        """
+        sel = selectors.DefaultSelector()
+        srv_sock.setblocking(False)
+        sel.register(srv_sock, selectors.EVENT_READ, None)
+        try:
+            while not self._shutdown_event.is_set():
+                timeout = 1.0
+                if self._accept_paused_until is not None:
+                    timeout = self._accept_paused_until - time.monotonic()
+                    if timeout <= 0:
+                        self._accept_paused_until = None
+                        sel.register(srv_sock, selectors.EVENT_READ, None)
+                        timeout = 1.0
+                for key, mask in sel.select(timeout=timeout):
+                    conn_state = key.data
+                    if conn_state is None:
+                        self._accept_ready(sel, srv_sock)
+                        continue
+                    if mask & selectors.EVENT_READ:
+                        self._read_ready(sel, conn_state)
+                    if mask & selectors.EVENT_WRITE and not conn_state.closed:
+                        self._write_ready(sel, conn_state)
+        finally:
+            for key in list(sel.get_map().values()):
+                if key.data is not None:
+                    key.fileobj.close()
+            sel.close()
+
+    def _accept_ready(self, sel: selectors.BaseSelector, srv_sock: socket.socket):
+        """
+        Accept every pending connection (the listen socket is level-triggered,
+        draining it in one go avoids a select() round per client).
+        Out of descriptors, the listen socket is taken out of the selector
+        for ACCEPT_BACKOFF, since it would otherwise report ready again at
+        once and spin the loop while no connection can be accepted.
+        """
+        while True:
+            try:
+                conn, addr = srv_sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                if e.errno in OUT_OF_FDS:
+                    sel.unregister(srv_sock)
+                    self._accept_paused_until = time.monotonic() + self.ACCEPT_BACKOFF
+                return  # anything else: retry on next wakeup
+            conn.setblocking(False)
+            sel.register(conn, selectors.EVENT_READ, _ClientConnection(conn, addr))
+            self.metrics.client_connected()
+
+    def _read_ready(self, sel: selectors.BaseSelector, state: "_ClientConnection"):
+        try:
+            data = state.sock.recv(self.RECV_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self._close_eventloop_conn(sel, state)
+            return
+        if not data:
+            self._close_eventloop_conn(sel, state)
+            return
+
+        state.inbuf += data
+        out = self._process_buffer(state)
+        if state.stream is not None:
+            # Streams block on their socket; give the connection a thread
+            sel.unregister(state.sock)
+            state.sock.setblocking(True)
+            state.outbuf += out
+            threading.Thread(target=self._serve_stream, args=(state,), daemon=True).start()
+            return
+        if out:
+            state.outbuf += out
+            self._write_ready(sel, state)
+
+    def _write_ready(self, sel: selectors.BaseSelector, state: "_ClientConnection"):
+        if state.outbuf:
+            try:
+                sent = state.sock.send(state.outbuf)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError:
+                self._close_eventloop_conn(sel, state)
+                return
+            del state.outbuf[:sent]
+
+        # Only ask for write readiness while output is pending, and stop
+        # reading from clients that do not consume their responses.
+        if not state.outbuf:
+            events = selectors.EVENT_READ
+        elif len(state.outbuf) > self.MAX_PENDING_OUTPUT:
+            events = selectors.EVENT_WRITE
+        else:
+            events = selectors.EVENT_READ | selectors.EVENT_WRITE
+        if events != state.events:
+            state.events = events
+            sel.modify(state.sock, events, state)
+
+    def _close_eventloop_conn(self, sel: selectors.BaseSelector, state: "_ClientConnection"):
+        state.closed = True
+        if state.profile is not None:
+            state.profile.stop()
+            state.profile = None
+        self.metrics.client_disconnected()
+        try:
+            sel.unregister(state.sock)
+        except (KeyError, ValueError):
+            pass
+        state.sock.close()
+
     def handle_client(self, conn: socket.socket, addr):
         """
         Handle a single client connection.
+
+        Requests may be pipelined: every complete command already received
+        is executed in order and all of their responses go out in one
+        sendall, so N queued commands cost one write instead of N.
         """
-        with conn:
-            file = conn.makefile("r")
-            while True:
-                line = file.readline()
-                if not line:
-                    print(f"[SERVER] Connection closed by {addr}")
-                    break
+        self.metrics.client_connected()
+        try:
+            with conn:
+                self._serve_connection(conn, addr)
+        finally:
+            self.metrics.client_disconnected()
+            self.metrics.retire_thread()
 
-                line = line.strip()
-                if not line:
-                    continue
+    def _serve_connection(self, conn: socket.socket, addr):
+        state = _ClientConnection(conn, addr)
+        try:
+            self._serve_requests(conn, addr, state)
+        finally:
+            if state.profile is not None:
+                state.profile.stop()
+
+    def _serve_requests(self, conn: socket.socket, addr, state: _ClientConnection):
+        while True:
+            try:
+                data = conn.recv(self.RECV_SIZE)
+            except OSError:
+                data = b""  # reset by peer
+            if not data:
+                print(f"[SERVER] Connection closed by {addr}")
+                break
+
+            state.inbuf += data
+            out = self._process_buffer(state)
+            if state.stream is not None:
+                state.outbuf += out
+                self._serve_stream(state)
+                break
+            if not out:
+                continue
+            try:
+                conn.sendall(out)
+            except (BrokenPipeError, ConnectionResetError):
+                print(f"[SERVER] Connection lost with {addr}")
+                break
+
+    def _serve_stream(self, state: _ClientConnection):
+        """
+        Hand a connection that sent SYNC or INVALIDATIONS over to its
+        stream, after flushing the responses to whatever it sent before.
+        """
+        try:
+            if state.outbuf:
+                state.sock.sendall(state.outbuf)
+            state.stream(state.sock, state.addr)
+        except OSError:
+            pass
+        finally:
+            if self.mode == "eventloop":
+                self.metrics.client_disconnected()
+                state.sock.close()
 
-                response = self.process_command(line)
-                try:
-                    conn.sendall((response + "\n").encode("utf-8"))
-                except (BrokenPipeError, ConnectionResetError):
-                    print(f"[SERVER] Connection lost with {addr}")
+    def _process_buffer(self, state: _ClientConnection) -> bytearray:
+        """
+        Execute every complete request in state.inbuf, in order, and remove
+        them from it. Returns the encoded responses (possibly empty); a
+        trailing partial request is left in the buffer for the next read.
+        """
+        if state.profile is not None:
+            state.profile.resume()
+        try:
+            return self._process_requests(state)
+        finally:
+            if state.profile is not None:
+                state.profile.pause()
+
+    def _process_requests(self, state: _ClientConnection) -> bytearray:
+        buf = state.inbuf
+        out = bytearray()
+        start = 0
+        lines = []  # plain commands, run together by _execute_lines
+        while not state.binary:
+            nl = buf.find(b"\n", start)
+            if nl == -1:
+                break
+            line = buf[start:nl].decode("utf-8", errors="replace").strip()
+            start = nl + 1
+            if not line:
+                continue
+            upper = line.upper()
+            if upper not in ("BINARY", "SYNC", "INVALIDATIONS"):
+                lines.append(line)
+                continue
+            self._execute_lines(lines, state, out)
+            lines = []
+            if upper == "BINARY":
+                state.binary = True
+                out += b"OK BINARY\n"
+                continue
+            if upper == "SYNC":
+                state.stream = self._replication_source().serve
+            else:
+                state.stream = self._invalidation_tracker().serve
+            break
+        self._execute_lines(lines, state, out)
+        if state.binary:
+            start = self._process_binary(buf, start, out, state.addr)
+        if start:
+            del buf[:start]
+        return out
+
+    def _execute_lines(self, lines: list[str], state: _ClientConnection, out: bytearray):
+        """
+        Run pipelined command lines in order, appending their responses
+        to out.
+        """
+        for line in lines:
+            out += self.process_command(line, state).encode("utf-8")
+            out += b"\n"
+
+    def _process_binary(self, buf: bytearray, start: int, out: bytearray, addr=None) -> int:
+        """
+        Execute complete binary frames in buf from offset start, appending
+        responses to out. Returns the offset of the first unconsumed byte.
+        Frames are sliced through a memoryview, so the request bytes are
+        only copied when a PUT value has to be stored.
+        """
+        header_size = BIN_REQUEST_HEADER.size
+        end = len(buf)
+        view = memoryview(buf)
+        frames = []
+        try:
+            while end - start >= header_size:
+                op, _flags, key_len, value_len = BIN_REQUEST_HEADER.unpack_from(buf, start)
+                key_start = start + header_size
+                value_start = key_start + key_len
+                frame_end = value_start + value_len
+                if frame_end > end:
                     break
+                start = frame_end
+                key = str(view[key_start:value_start], "utf-8", "replace")
+                frames.append((op, key, view[value_start:frame_end]))
+            self._execute_frames(frames, out, addr)
+        finally:
+            for _op, _key, value in frames:
+                value.release()  # buf is resized once they are handled
+            view.release()
+        return start
 
-    def process_command(self, line: str) -> str:
+    def _execute_frames(self, frames: list[tuple[int, str, memoryview]], out: bytearray,
+                        addr=None):
+        """
+        Run pipelined binary requests (op, key, value) in order, appending
+        their responses to out.
+        """
+        for op, key, value in frames:
+            self._execute_binary(op, key, value, out, addr)
+
+    def _execute_binary(self, op: int, key: str, value: memoryview, out: bytearray,
+                        addr=None):
+        started = time.perf_counter()
+        self._dispatch_binary(op, key, value, out)
+        elapsed = time.perf_counter() - started
+        name = BIN_OP_NAMES.get(op, "UNKNOWN")
+        self.metrics.observe(name, elapsed)
+        if elapsed >= self.slowlog.threshold:
+            self.slowlog.record([name, key], elapsed, addr)
+
+    def _dispatch_binary(self, op: int, key: str, value: memoryview, out: bytearray):
+        if self.replica_of is not None and op in (OP_PUT, OP_PUTEX, OP_DELETE):
+            self._binary_error(out, "READONLY You can't write against a replica")
+            return
+        if op == OP_GET:
+            stored = self.store.get(key)
+            if stored is None:
+                self.metrics.record_lookups(0, 1)
+                out += BIN_RESPONSE_HEADER.pack(STATUS_NOT_FOUND, 0)
+            else:
+                self.metrics.record_lookups(1, 0)
+                out += BIN_RESPONSE_HEADER.pack(STATUS_VALUE, len(stored))
+                out += stored
+        elif op == OP_PUT:
+            self.store.put(key, bytes(value))
+            out += BIN_RESPONSE_HEADER.pack(STATUS_OK, 0)
+        elif op == OP_PUTEX:
+            if len(value) < BIN_TTL.size:
+                self._binary_error(out, "PUTEX value must start with a float64 ttl")
+                return
+            (ttl,) = BIN_TTL.unpack_from(value)
+            if not (math.isfinite(ttl) and ttl > 0):
+                self._binary_error(out, "ttl_seconds must be a finite number > 0")
+                return
+            self.store.put(key, bytes(value[BIN_TTL.size:]), ttl=ttl)
+            out += BIN_RESPONSE_HEADER.pack(STATUS_OK, 0)
+        elif op == OP_DELETE:
+            status = STATUS_DELETED if self.store.delete(key) else STATUS_NOT_FOUND
+            out += BIN_RESPONSE_HEADER.pack(status, 0)
+        elif op == OP_QUIT:
+            out += BIN_RESPONSE_HEADER.pack(STATUS_BYE, 0)
+        else:
+            self._binary_error(out, f"Unknown opcode: {op}")
+
+    @staticmethod
+    def _binary_error(out: bytearray, message: str):
+        payload = message.encode("utf-8")
+        out += BIN_RESPONSE_HEADER.pack(STATUS_ERROR, len(payload))
+        out += payload
+
+    def process_command(self, line: str, state: _ClientConnection | None = None) -> str:
         """
         Parse and execute a command string, return a response string.
+        The execution time is recorded per command in self.metrics, and
+        in the slow log if it reaches the threshold. state is the client
+        connection, if any (needed by PROFILE).
         """
         parts = line.split()
         if not parts:
             return "ERROR Empty command"
 
         cmd = parts[0].upper()
+        if cmd == "PROFILE":
+            return self._profile_command(parts, state)
+        if cmd == "TRACKING":
+            return self._tracking_command(parts, state)
+        if state is not None and state.tracking is not None and cmd in self.TRACKED_READS:
+            self.tracker.track(parts[1:] if cmd == "MGET" else parts[1:2], state.tracking)
+        started = time.perf_counter()
+        response = self._execute_command(cmd, parts)
+        elapsed = time.perf_counter() - started
+        self.metrics.observe(cmd if cmd in self.COMMANDS else "UNKNOWN", elapsed)
+        if elapsed >= self.slowlog.threshold:
+            self.slowlog.record(parts, elapsed, state.addr if state is not None else None)
+        return response
+
+    def _execute_command(self, cmd: str, parts: list[str]) -> str:
+        if self.replica_of is not None and cmd in self.WRITE_COMMANDS:
+            return "ERROR READONLY You can't write against a replica"
 
         if cmd == "PUT":
             if len(parts) < 3:
                 return "ERROR Usage: PUT <key> <value>"
             key = parts[1]
-            value = " ".join(parts[2:])
+            value = " ".join(parts[2:]).encode("utf-8")
             self.store.put(key, value)  # no TTL
             return "OK"
 
@@ -200,10 +1812,10 @@ class KeyValueServer:
             except ValueError:
                 return "ERROR ttl_seconds must be a number"
 
-            if ttl <= 0:
-                return "ERROR ttl_seconds must be > 0"
+            if not math.isfinite(ttl) or ttl <= 0:
+                return "ERROR ttl_seconds must be a finite number > 0"
 
-            value = " ".join(parts[3:])
+            value = " ".join(parts[3:]).encode("utf-8")
             self.store.put(key, value, ttl=ttl)
             return "OK"
 
@@ -213,8 +1825,10 @@ class KeyValueServer:
             key = parts[1]
             value = self.store.get(key)
             if value is None:
+                self.metrics.record_lookups(0, 1)
                 return "NOT_FOUND"
-            return f"VALUE {value}"
+            self.metrics.record_lookups(1, 0)
+            return f"VALUE {value.decode('utf-8', 'replace')}"
 
         elif cmd == "DELETE":
             if len(parts) != 2:
@@ -223,13 +1837,355 @@ class KeyValueServer:
             deleted = self.store.delete(key)
             return "DELETED" if deleted else "NOT_FOUND"
 
+        elif cmd == "MGET":
+            if len(parts) < 2:
+                return "ERROR Usage: MGET <key> [<key>...]"
+            values = self.store.get_many(parts[1:])
+            misses = values.count(None)
+            self.metrics.record_lookups(len(values) - misses, misses)
+            lines = [f"VALUES {len(values)}"]
+            for value in values:
+                if value is None:
+                    lines.append("NOT_FOUND")
+                else:
+                    lines.append(f"VALUE {value.decode('utf-8', 'replace')}")
+            return "\n".join(lines)
+
+        elif cmd == "MSET":
+            if len(parts) < 3 or len(parts) % 2 == 0:
+                return "ERROR Usage: MSET <key> <value> [<key> <value>...]"
+            values = [value.encode("utf-8") for value in parts[2::2]]
+            self.store.put_many(list(zip(parts[1::2], values)))
+            return "OK"
+
+        elif cmd == "MDEL":
+            if len(parts) < 2:
+                return "ERROR Usage: MDEL <key> [<key>...]"
+            return f"DELETED {self.store.delete_many(parts[1:])}"
+
+        elif cmd in ("INCR", "DECR", "INCRBY", "DECRBY"):
+            return self._incr_command(cmd, parts)
+
+        elif cmd == "APPEND":
+            if len(parts) < 3:
+                return "ERROR Usage: APPEND <key> <value>"
+            suffix = " ".join(parts[2:]).encode("utf-8")
+            return f"LENGTH {self.store.append(parts[1], suffix)}"
+
+        elif cmd == "GETSET":
+            if len(parts) < 3:
+                return "ERROR Usage: GETSET <key> <value>"
+            old = self.store.getset(parts[1], " ".join(parts[2:]).encode("utf-8"))
+            if old is None:
+                return "NOT_FOUND"
+            return f"VALUE {old.decode('utf-8', 'replace')}"
+
+        elif cmd == "GETS":
+            if len(parts) != 2:
+                return "ERROR Usage: GETS <key>"
+            found = self.store.gets(parts[1])
+            if found is None:
+                self.metrics.record_lookups(0, 1)
+                return "NOT_FOUND"
+            self.metrics.record_lookups(1, 0)
+            value, version = found
+            return f"VALUE {version} {value.decode('utf-8', 'replace')}"
+
+        elif cmd == "CAS":
+            # CAS <key> <version> <value...>
+            if len(parts) < 4:
+                return "ERROR Usage: CAS <key> <version> <value>"
+            try:
+                version = int(parts[2])
+            except ValueError:
+                return "ERROR version must be an integer"
+            stored = self.store.cas(parts[1], version, " ".join(parts[3:]).encode("utf-8"))
+            if stored is None:
+                return "NOT_FOUND"
+            return "OK" if stored else "EXISTS"
+
+        elif cmd == "SCAN":
+            return self._scan_command(parts)
+
+        elif cmd == "RANGE":
+            return self._range_command(parts)
+
+        elif cmd == "STATS":
+            if len(parts) != 1:
+                return "ERROR Usage: STATS"
+            stats = self.metrics.summary(self._stats())
+            return "STATS " + " ".join(f"{name}={value}" for name, value in stats.items())
+
+        elif cmd == "SLOWLOG":
+            return self._slowlog_command(parts)
+
+        elif cmd == "BGSAVE":
+            if len(parts) != 1:
+                return "ERROR Usage: BGSAVE"
+            if self.snapshot_path is None:
+                return "ERROR Snapshots are not enabled"
+            if self._snapshot_lock.locked():
+                return "ERROR Background save already in progress"
+            threading.Thread(target=self.snapshot, daemon=True).start()
+            return "OK Background save started"
+
         elif cmd == "QUIT":
             return "BYE"
 
         else:
             return f"ERROR Unknown command: {cmd}"
 
+    def _slowlog_command(self, parts: list[str]) -> str:
+        sub = parts[1].upper() if len(parts) > 1 else ""
+        if sub == "GET" and len(parts) <= 3:
+            count = 10
+            if len(parts) == 3:
+                count = self._page_count(parts[2])
+                if count is None:
+                    return f"ERROR count must be an integer in 1..{self.MAX_PAGE_COUNT}"
+            lines = [f"{entry_id} {int(timestamp)} {round(seconds * 1e6)} {client} "
+                     + " ".join(args)
+                     for entry_id, timestamp, seconds, client, args in self.slowlog.get(count)]
+            return "\n".join([f"ENTRIES {len(lines)}"] + lines)
+        if sub == "LEN" and len(parts) == 2:
+            return f"LENGTH {len(self.slowlog)}"
+        if sub == "RESET" and len(parts) == 2:
+            self.slowlog.reset()
+            return "OK"
+        return "ERROR Usage: SLOWLOG GET [<count>] | LEN | RESET"
+
+    def _tracking_command(self, parts: list[str], state: _ClientConnection | None) -> str:
+        """
+        TRACKING ON REDIRECT <id> / TRACKING OFF for the calling connection.
+        Repeating TRACKING ON is cheap, so clients may prefix every
+        tracked read with it and never worry about reconnects.
+        """
+        if state is None:
+            return "ERROR TRACKING needs a client connection"
+        sub = parts[1].upper() if len(parts) > 1 else ""
+        if sub == "OFF" and len(parts) == 2:
+            state.tracking = None
+            return "OK"
+        if sub == "ON" and len(parts) == 4 and parts[2].upper() == "REDIRECT":
+            try:
+                channel_id = int(parts[3])
+            except ValueError:
+                return "ERROR channel id must be an integer"
+            if self.tracker is None or not self.tracker.has_channel(channel_id):
+                return f"ERROR No invalidation channel {channel_id}"
+            state.tracking = channel_id
+            return "OK"
+        return "ERROR Usage: TRACKING ON REDIRECT <channel id> | OFF"
+
+    def _profile_command(self, parts: list[str], state: _ClientConnection | None) -> str:
+        """
+        PROFILE START cpu|mem / PROFILE STOP [<n>] for the calling
+        connection. Costs nothing on connections that never use it.
+        """
+        if state is None:
+            return "ERROR PROFILE needs a client connection"
+        sub = parts[1].upper() if len(parts) > 1 else ""
+        if sub == "START" and len(parts) == 3:
+            kind = parts[2].lower()
+            if kind not in ConnectionProfile.KINDS:
+                return "ERROR Usage: PROFILE START cpu|mem"
+            if state.profile is not None:
+                return "ERROR Profile already running on this connection"
+            state.profile = ConnectionProfile(kind)
+            state.profile.resume()  # _process_buffer pauses it after this batch
+            return "OK"
+        if sub == "STOP" and len(parts) <= 3:
+            limit = 20
+            if len(parts) == 3:
+                limit = self._page_count(parts[2])
+                if limit is None:
+                    return f"ERROR count must be an integer in 1..{self.MAX_PAGE_COUNT}"
+            if state.profile is None:
+                return "ERROR No profile running on this connection"
+            profile, state.profile = state.profile, None
+            lines = profile.stop(limit)
+            return "\n".join([f"PROFILE {len(lines)}"] + lines)
+        return "ERROR Usage: PROFILE START cpu|mem | STOP [<count>]"
+
+    def _page_count(self, value: str) -> int | None:
+        try:
+            count = int(value)
+        except ValueError:
+            return None
+        return count if 1 <= count <= self.MAX_PAGE_COUNT else None
+
+    def _scan_command(self, parts: list[str]) -> str:
+        """
+        SCAN <cursor> [MATCH <prefix>] [COUNT <n>]
+
+        The cursor is the hex-encoded last key of the previous page ("0"
+        to start), so it needs no server-side state, stays valid across
+        connections and never skips or repeats keys that exist for the
+        whole scan.
+        """
+        usage = "ERROR Usage: SCAN <cursor> [MATCH <prefix>] [COUNT <n>]"
+        if len(parts) < 2 or len(parts) % 2 != 0:
+            return usage
+        after = None
+        if parts[1] != "0":
+            try:
+                after = bytes.fromhex(parts[1]).decode("utf-8")
+            except ValueError:
+                return "ERROR Invalid cursor"
+        prefix = ""
+        count = self.DEFAULT_PAGE_COUNT
+        for option, value in zip(parts[2::2], parts[3::2]):
+            option = option.upper()
+            if option == "MATCH":
+                # Prefix match; a trailing "*" is accepted for glob habits
+                prefix = value[:-1] if value.endswith("*") else value
+            elif option == "COUNT":
+                count = self._page_count(value)
+                if count is None:
+                    return f"ERROR COUNT must be between 1 and {self.MAX_PAGE_COUNT}"
+            else:
+                return usage
+        keys = self.store.scan(after, prefix, count)
+        cursor = keys[-1].encode("utf-8").hex() if len(keys) == count else "0"
+        return "\n".join([f"KEYS {cursor} {len(keys)}"] + keys)
+
+    def _range_command(self, parts: list[str]) -> str:
+        """
+        RANGE <min> <max> [COUNT <n>]
+
+        Bounds are "[key" (inclusive), "(key" (exclusive), "-" or "+"
+        (open). To fetch the next page, repeat with min "(<last key>".
+        """
+        usage = "ERROR Usage: RANGE <min> <max> [COUNT <n>]"
+        if len(parts) not in (3, 5) or (len(parts) == 5 and parts[3].upper() != "COUNT"):
+            return usage
+        bounds = []
+        for bound, open_bound in ((parts[1], "-"), (parts[2], "+")):
+            if bound == open_bound:
+                bounds += [None, True]
+            elif bound[:1] in ("[", "("):
+                bounds += [bound[1:], bound[0] == "["]
+            else:
+                return "ERROR min and max must start with '[' or '(', or be '-' / '+'"
+        count = self.DEFAULT_PAGE_COUNT
+        if len(parts) == 5:
+            count = self._page_count(parts[4])
+            if count is None:
+                return f"ERROR COUNT must be between 1 and {self.MAX_PAGE_COUNT}"
+        items = self.store.range_items(*bounds, count)
+        lines = [f"ITEMS {len(items)}"]
+        for key, value in items:
+            lines.append(f"{key} {value.decode('utf-8', 'replace')}")
+        return "\n".join(lines)
+
+    def _incr_command(self, cmd: str, parts: list[str]) -> str:
+        """
+        INCR/DECR <key> [<ttl_seconds>] and INCRBY/DECRBY <key> <delta> [<ttl_seconds>].
+        """
+        by = cmd.endswith("BY")
+        usage = f"ERROR Usage: {cmd} <key>{' <delta>' if by else ''} [<ttl_seconds>]"
+        args = parts[2:]
+        if len(parts) < 2 or (by and not args) or len(args) > (2 if by else 1):
+            return usage
+        delta = 1
+        if by:
+            delta = args.pop(0)
+            if INTEGER_PATTERN.fullmatch(delta.encode()) is None:
+                return "ERROR delta must be an integer"
+            try:
+                delta = int(delta)
+            except ValueError:  # more digits than int() converts
+                return "ERROR delta must be an integer"
+        if cmd.startswith("DECR"):
+            delta = -delta
+        ttl = None
+        if args:
+            try:
+                ttl = float(args[0])
+            except ValueError:
+                return "ERROR ttl_seconds must be a number"
+            if not math.isfinite(ttl) or ttl <= 0:
+                return "ERROR ttl_seconds must be a finite number > 0"
+        try:
+            return f"VALUE {self.store.incr(parts[1], delta, ttl)}"
+        except ValueError:
+            return "ERROR Value is not an integer"
+        except OverflowError:
+            return "ERROR Increment or decrement would overflow"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="TCP key-value server with TTL support")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--mode", choices=KeyValueServer.MODES, default="threaded",
+                        help="connection front end (default: threaded)")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="number of independently locked store segments (default: 1)")
+    parser.add_argument("--max-keys", type=int, default=None,
+                        help="evict keys once the store holds more than this many")
+    parser.add_argument("--max-memory", type=int, default=None,
+                        help="evict keys once approximate usage exceeds this many bytes")
+    parser.add_argument("--eviction-policy", choices=sorted(EVICTION_POLICIES),
+                        default="lru", help="which keys to evict first (default: lru)")
+    parser.add_argument("--intern-values", action="store_true",
+                        help=f"share small (<= {INTERN_MAX_SIZE} byte) repeated values "
+                             "between keys to save memory")
+    parser.add_argument("--compress-threshold", type=int, default=None, metavar="BYTES",
+                        help="zlib-compress values of at least BYTES bytes (default: off)")
+    parser.add_argument("--compress-level", type=int, default=6, choices=range(0, 10),
+                        metavar="0-9", help="zlib compression level (default: 6)")
+    parser.add_argument("--compress-dict", default=None, metavar="PATH",
+                        help="preset zlib dictionary, e.g. written from "
+                             "train_compress_dict(samples) (default: none)")
+    parser.add_argument("--aof", default=None, metavar="PATH",
+                        help="append-only log file for persistence (default: off)")
+    parser.add_argument("--aof-fsync", choices=AppendOnlyLog.FSYNC_POLICIES,
+                        default="everysec", help="log fsync policy (default: everysec)")
+    parser.add_argument("--aof-fsync-interval-ms", type=int, default=1000,
+                        help="group-commit interval for everysec/no (default: 1000)")
+    parser.add_argument("--snapshot", default=None, metavar="PATH",
+                        help="snapshot file loaded on startup and written by BGSAVE")
+    parser.add_argument("--snapshot-interval", type=float, default=None, metavar="SECONDS",
+                        help="also take a snapshot every SECONDS (default: only on BGSAVE)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus metrics over HTTP on this port (default: off)")
+    parser.add_argument("--slowlog-threshold-us", type=int, default=10000, metavar="USEC",
+                        help="log commands that take at least USEC microseconds; "
+                             "negative disables (default: 10000)")
+    parser.add_argument("--slowlog-max-len", type=int, default=128,
+                        help="slow log entries kept (default: 128)")
+    parser.add_argument("--replica-of", default=None, metavar="HOST:PORT",
+                        help="run as a read-only replica of this primary (default: off)")
+    args = parser.parse_args(argv)
+    if args.compress_dict is not None:
+        with open(args.compress_dict, "rb") as f:
+            args.compress_dict = f.read()
+    if args.replica_of is not None:
+        host, _, port = args.replica_of.rpartition(":")
+        if not host or not port.isdigit():
+            parser.error("--replica-of must be HOST:PORT")
+        args.replica_of = (host, int(port))
+    return args
+
 
 if __name__ == "__main__":
-    server = KeyValueServer(host="127.0.0.1", port=5000)
+    args = parse_args()
+    server = KeyValueServer(host=args.host, port=args.port, mode=args.mode,
+                            shards=args.shards, max_keys=args.max_keys,
+                            max_memory=args.max_memory,
+                            eviction_policy=args.eviction_policy,
+                            intern_values=args.intern_values,
+                            compress_threshold=args.compress_threshold,
+                            compress_level=args.compress_level,
+                            compress_dict=args.compress_dict,
+                            aof_path=args.aof, aof_fsync=args.aof_fsync,
+                            aof_fsync_interval_ms=args.aof_fsync_interval_ms,
+                            snapshot_path=args.snapshot,
+                            snapshot_interval=args.snapshot_interval,
+                            metrics_port=args.metrics_port,
+                            slowlog_threshold=(None if args.slowlog_threshold_us < 0
+                                               else args.slowlog_threshold_us / 1e6),
+                            slowlog_max_len=args.slowlog_max_len,
+                            replica_of=args.replica_of)
     server.start()
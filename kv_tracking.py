@@ -0,0 +1,154 @@
+import socket
+import threading
+
+
+# ---------- Invalidation channel protocol ----------
+#
+# Client-side caching with server-assisted invalidation, in the style of
+# Redis' RESP2 tracking with REDIRECT:
+#
+#   1. The client opens one connection and sends "INVALIDATIONS". The
+#      server answers "OK INVALIDATIONS <id>" and from then on only writes
+#      "INVALIDATE <key>" lines to it.
+#   2. On its ordinary connections the client sends
+#      "TRACKING ON REDIRECT <id>". Every key that connection then reads
+#      (GET, MGET, GETS) is remembered for channel <id>.
+#   3. The next write, delete or eviction of a remembered key sends
+#      "INVALIDATE <key>" on the channel once and forgets the key, until
+#      it is read again.
+#
+# Keys that expire are not announced; clients bound staleness for those
+# with a local TTL.
+
+
+class _Channel:
+    """
+    Invalidations queued for one channel connection.
+    """
+    __slots__ = ("id", "addr", "pending", "ready", "closed")
+
+    def __init__(self, channel_id: int, addr):
+        self.id = channel_id
+        self.addr = addr
+        self.pending = bytearray()
+        self.ready = threading.Condition(threading.Lock())
+        self.closed = False
+
+
+class InvalidationTracker:
+    """
+    Remembers which channels read which keys and pushes an invalidation
+    to them when the key changes.
+
+    Registered as a store listener, so record_put/record_delete run under
+    the store lock; they only do a dict lookup unless the key is tracked.
+    Tracking is bounded: past max_tracked_keys the oldest tracked key is
+    invalidated early to make room. A channel whose queue grows past
+    max_backlog bytes is disconnected; its client then drops its whole
+    cache.
+    """
+    def __init__(self, store, max_tracked_keys: int = 1_000_000,
+                 max_backlog: int = 8 << 20):
+        self.store = store
+        self.max_tracked_keys = max_tracked_keys
+        self.max_backlog = max_backlog
+        self.invalidations = 0  # INVALIDATE lines queued since startup
+        self._table = {}  # key -> set of channel ids that read it
+        self._channels = {}  # channel id -> _Channel
+        self._next_id = 0
+        self._lock = threading.Lock()  # guards _table, _channels and counters
+        self._stopped = False
+        store.add_listener(self)
+
+    def has_channel(self, channel_id: int) -> bool:
+        return channel_id in self._channels
+
+    def stats(self) -> dict:
+        return {
+            "tracked_keys": len(self._table),
+            "invalidation_channels": len(self._channels),
+            "invalidations_sent": self.invalidations,
+        }
+
+    def track(self, keys: list[str], channel_id: int):
+        """
+        Remember that channel_id's client is about to read keys. Must be
+        called before the read, so a write racing with it is announced.
+        """
+        with self._lock:
+            table = self._table
+            for key in keys:
+                readers = table.get(key)
+                if readers is None:
+                    if len(table) >= self.max_tracked_keys:
+                        oldest = next(iter(table))
+                        self._notify_unlocked(oldest, table.pop(oldest))
+                    table[key] = {channel_id}
+                else:
+                    readers.add(channel_id)
+
+    def record_put(self, key: str, value: bytes, expiry: float | None):
+        if key in self._table:
+            self._invalidate(key)
+
+    def record_delete(self, key: str):
+        if key in self._table:
+            self._invalidate(key)
+
+    def _invalidate(self, key: str):
+        with self._lock:
+            readers = self._table.pop(key, None)
+            if readers:
+                self._notify_unlocked(key, readers)
+
+    def _notify_unlocked(self, key: str, readers: set):
+        line = f"INVALIDATE {key}\n".encode("utf-8")
+        for channel_id in readers:
+            channel = self._channels.get(channel_id)
+            if channel is None:
+                continue  # disconnected; its client already dropped its cache
+            self.invalidations += 1
+            with channel.ready:
+                if channel.closed:
+                    continue
+                channel.pending += line
+                if len(channel.pending) > self.max_backlog:
+                    channel.closed = True
+                    channel.pending.clear()
+                channel.ready.notify()
+
+    def serve(self, sock: socket.socket, addr):
+        """
+        Run an invalidation channel on an accepted connection that has
+        just sent INVALIDATIONS. Blocks until the client disconnects.
+        """
+        with self._lock:
+            self._next_id += 1
+            channel = self._channels[self._next_id] = _Channel(self._next_id, addr)
+        print(f"[SERVER] Invalidation channel {channel.id} opened by {addr}")
+        try:
+            sock.sendall(f"OK INVALIDATIONS {channel.id}\n".encode("ascii"))
+            while True:
+                with channel.ready:
+                    while not channel.pending and not channel.closed:
+                        channel.ready.wait()
+                    if channel.closed:
+                        if not self._stopped:
+                            print(f"[SERVER] Invalidation channel {channel.id} fell too "
+                                  f"far behind, disconnecting")
+                        break
+                    data, channel.pending = channel.pending, bytearray()
+                sock.sendall(data)
+        except OSError:
+            print(f"[SERVER] Invalidation channel {channel.id} closed by {addr}")
+        finally:
+            with self._lock:
+                self._channels.pop(channel.id, None)
+
+    def close(self):
+        with self._lock:
+            self._stopped = True
+            for channel in self._channels.values():
+                with channel.ready:
+                    channel.closed = True
+                    channel.ready.notify()
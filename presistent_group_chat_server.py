@@ -5,21 +5,32 @@ import time
 import json
 import os
 
+from chat_broadcast import BroadcastEngine
+
 HOST = "0.0.0.0"
 PORT = 5003  # change if needed
 
+MAX_OUTBOX_BYTES = 256 * 1024   # output queued per client before the policy applies
+SLOW_CLIENT_POLICY = "disconnect"  # or "drop": skip messages for that client
+
 HISTORY_TTL_SECONDS = 15 * 60          # 15 minutes
 HISTORY_FILE = "chat_history.json"     # persistent storage file
 
-# group_id -> list of (conn, user_id)
+# group_id -> {conn: user_id}; dicts keep join order and make leaving O(1)
 groups = {}
 
+# conn -> group_id, so leaving does not scan every group
+member_group = {}
+
 # group_id -> list of {"ts": <float>, "text": <str>}
 group_history = {}
 
-# One lock to protect both 'groups' and 'group_history' + file writes
+# One lock to protect 'groups', 'member_group' and 'group_history' + file writes
 data_lock = threading.Lock()
 
+# Writes everything sent to joined clients; created in main()
+engine = None
+
 
 # ---------- Persistence helpers ----------
 
@@ -83,6 +94,8 @@ def broadcast(group_id, message, sender_conn=None, save_to_history=True):
     except optionally 'sender_conn'.
     If save_to_history is True, store message with timestamp
     in persistent history (only last 15 minutes kept).
+    The message is encoded once and queued for each client; the broadcast
+    engine writes it, so a slow client never blocks the sender.
     """
     with data_lock:
         # Save to history if it's a normal chat message
@@ -96,17 +109,10 @@ def broadcast(group_id, message, sender_conn=None, save_to_history=True):
             save_history_locked()
 
         # Snapshot of current clients in that group
-        clients = list(groups.get(group_id, []))
+        conns = list(groups.get(group_id, ()))
 
-    # Send to all clients except the sender (outside the lock)
-    for conn, _uid in clients:
-        if conn is sender_conn:
-            continue
-        try:
-            conn.sendall(message.encode())
-        except OSError:
-            # Ignore broken pipe; cleanup in handler
-            pass
+    # Queue for all clients except the sender (outside the lock)
+    engine.broadcast(conns, message.encode(), exclude=sender_conn)
 
 
 def send_previous_messages(conn, group_id):
@@ -120,14 +126,15 @@ def send_previous_messages(conn, group_id):
         recent_msgs = [m["text"] for m in msgs if now - m["ts"] <= HISTORY_TTL_SECONDS]
 
     if not recent_msgs:
-        conn.sendall(b"(No messages in this group in the last 15 minutes.)\r\n\r\n")
+        engine.send(conn, b"(No messages in this group in the last 15 minutes.)\r\n\r\n")
         return
 
+    # Queued as one message, so live broadcasts cannot interleave with it,
+    # and exempt from MAX_OUTBOX_BYTES so a long history cannot get every
+    # joiner disconnected
     header = f"--- Messages in group '{group_id}' from last 15 minutes ---\r\n"
-    conn.sendall(header.encode())
-    for txt in recent_msgs:
-        conn.sendall(txt.encode())
-    conn.sendall(b"--- End of recent messages ---\r\n\r\n")
+    replay = header + "".join(recent_msgs) + "--- End of recent messages ---\r\n\r\n"
+    engine.send(conn, replay.encode(), capped=False)
 
 
 def handle_client(conn, addr):
@@ -151,19 +158,23 @@ def handle_client(conn, addr):
             conn.close()
             return
 
+        # From here on all output goes through the engine
+        engine.register(conn)
+
         # Add client to the chosen group (create group if it doesn't exist)
         with data_lock:
-            groups.setdefault(group_id, [])
-            groups[group_id].append((conn, user_id))
+            groups.setdefault(group_id, {})[conn] = user_id
+            member_group[conn] = group_id
             # Ensure group_history entry exists too
             group_history.setdefault(group_id, [])
 
         print(f"[+] User '{user_id}' joined group '{group_id}' from {addr}")
 
-        conn.sendall(
+        engine.send(
+            conn,
             f"\r\nYou joined group '{group_id}' as '{user_id}'.\r\n"
             "Type messages and press Enter to chat.\r\n"
-            "Type '/quit' to leave.\r\n\r\n".encode()
+            "Type '/quit' to leave.\r\n\r\n".encode(),
         )
 
         # Send last-15-minutes history for this group
@@ -188,7 +199,7 @@ def handle_client(conn, addr):
                 continue
 
             if msg.lower() == "/quit":
-                conn.sendall(b"Goodbye!\r\n")
+                engine.send(conn, b"Goodbye!\r\n")
                 break
 
             # Normal chat message
@@ -203,16 +214,13 @@ def handle_client(conn, addr):
         pass
     finally:
         # Remove client from any group it was in
-        removed_from = None
         with data_lock:
-            for gid, clients in list(groups.items()):
-                new_list = [(c, uid) for (c, uid) in clients if c is not conn]
-                if len(new_list) != len(clients):
-                    groups[gid] = new_list
-                    removed_from = gid
-                    if not new_list:
-                        del groups[gid]
-                    break
+            removed_from = member_group.pop(conn, None)
+            if removed_from is not None:
+                members = groups[removed_from]
+                del members[conn]
+                if not members:
+                    del groups[removed_from]
 
         if removed_from and user_id:
             print(f"[-] Connection from {addr} ({removed_from}) closed.")
@@ -227,10 +235,14 @@ def handle_client(conn, addr):
             except Exception:
                 pass
 
-        conn.close()
+        # Closes the socket once queued output (e.g. "Goodbye!") is written
+        engine.unregister(conn)
 
 
 def main():
+    global engine
+    engine = BroadcastEngine(MAX_OUTBOX_BYTES, SLOW_CLIENT_POLICY)
+
     # Load persistent history before accepting any clients
     load_history_from_disk()
     print("[*] Loaded history from disk.")